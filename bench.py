@@ -0,0 +1,766 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the compiler internals.
+
+Usage: ./bench.py [name ...]
+
+Without arguments every benchmark is run. A benchmark that detects a
+scaling regression returns False and the script exits with status 1.
+"""
+
+import gc
+import glob
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from ibtool import genlib, ibdump, ibtool, nibencoding, xibparser
+from ibtool.models import CompilationSession, NibObject, NibList, NibMutableList, NibString, NibData
+
+
+BENCHMARKS = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__.removeprefix("bench_")] = fn
+    return fn
+
+
+def _best_of(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def _check_linear(label, per_item_costs, tolerance=4.0):
+    first, last = per_item_costs[0], per_item_costs[-1]
+    growth = last / first if first else 0.0
+    print(f"  {label} per-item cost growth: {growth:.2f}x")
+    if growth > tolerance:
+        print(f"  FAIL: {label} is not linear (limit {tolerance:.1f}x)")
+        return False
+    return True
+
+
+@benchmark
+def bench_make_tuples():
+    """Key/class resolution in makeTuples with one distinct key per value."""
+    costs = []
+    for n in (1000, 2000, 4000, 8000, 16000):
+        items = []
+        for i in range(n):
+            obj = NibObject(f"BenchClass{i % 64}")
+            obj[f"BenchKey{i}"] = i
+            items.append(obj)
+        ctx = genlib.CompilationContext()
+        ctx.addObjects([NibList(items)])
+        elapsed = _best_of(ctx.makeTuples)
+        values = n * 2 + 1
+        costs.append(elapsed / values)
+        print(f"  {values:>7} values  {elapsed * 1e3:8.2f} ms  {elapsed / values * 1e6:6.2f} us/value")
+    return _check_linear("makeTuples", costs)
+
+
+@benchmark
+def bench_intern():
+    """NibString/NibData interning of up to 100k distinct values, then re-lookup."""
+    costs = []
+    for n in (25000, 50000, 100000):
+        texts = [f"bench-intern-{n}-{i}" for i in range(n)]
+        blobs = [t.encode() * 16 for t in texts[: n // 10]]
+
+        def run():
+            # Each run interns into fresh session pools, leaving the global
+            # caches (and the constants in them) alone.
+            with CompilationSession():
+                for t in texts:
+                    NibString.intern(t)
+                for t in texts:
+                    NibString.intern(t)
+                for b in blobs:
+                    NibData.intern(b)
+                    NibData.intern(b)
+
+        elapsed = _best_of(run)
+        ops = 2 * (len(texts) + len(blobs))
+        costs.append(elapsed / ops)
+        print(f"  {n:>7} strings  {elapsed * 1e3:8.2f} ms  {elapsed / ops * 1e9:7.0f} ns/intern")
+    return _check_linear("intern", costs)
+
+
+@benchmark
+def bench_session_memory():
+    """Traced memory across 1,000 consecutive in-process compiles.
+
+    Every compile uses a copy of the XIB with its titles made unique, so
+    strings from one compile are never reused by the next.
+    """
+    with open("samples/correct/StatusBar.xib") as f:
+        source = f.read()
+    compiles, checkpoint = 1000, 100
+    strings_before = len(NibString.cache)
+    with tempfile.TemporaryDirectory() as tmp:
+        xib = os.path.join(tmp, "in.xib")
+        out = os.path.join(tmp, "out.nib")
+        gc.collect()
+        tracemalloc.start()
+        try:
+            for i in range(1, compiles + 1):
+                with open(xib, "w") as f:
+                    f.write(source.replace('title="', f'title="{i} '))
+                ibtool.ib_compile(xib, out)
+                if i == checkpoint:
+                    gc.collect()
+                    baseline = tracemalloc.get_traced_memory()[0]
+            gc.collect()
+            final = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+    growth = final - baseline
+    print(f"  after {checkpoint:>4} compiles: {baseline / 1024:8.1f} KiB traced")
+    print(f"  after {compiles:>4} compiles: {final / 1024:8.1f} KiB traced ({growth / 1024:+.1f} KiB)")
+    if len(NibString.cache) != strings_before:
+        print(f"  FAIL: global string cache grew from {strings_before} to {len(NibString.cache)}")
+        return False
+    if growth > 64 * 1024:
+        print("  FAIL: memory keeps growing between compiles")
+        return False
+    return True
+
+
+@benchmark
+def bench_deep_hierarchy():
+    """Compile a synthetic 10,000-deep view chain (well past the recursion limit)."""
+    depth = 10000
+    root = cur = NibObject("NSView")
+    views = [root]
+    for _ in range(depth):
+        child = NibObject("NSView")
+        child["NSSuperview"] = cur
+        child["NSNextResponder"] = cur
+        cur["NSSubviews"] = NibMutableList([child])
+        cur["NSNextKeyView"] = child
+        views.append(child)
+        cur = child
+
+    start = time.perf_counter()
+    ctx = genlib.CompilationContext()
+    ctx.addObjects([root])
+    out = nibencoding.WriteNib(ctx.makeTuples())
+    elapsed = time.perf_counter() - start
+    print(f"  depth {depth}  {len(ctx.object_list)} objects  {len(out)} bytes  {elapsed * 1e3:8.2f} ms")
+
+    # Pre-order: each view is followed by its subviews list, then the child view.
+    if [o.nibidx() for o in views] != list(range(0, 2 * depth + 1, 2)):
+        print("  FAIL: object order differs from depth-first pre-order")
+        return False
+    return True
+
+
+@benchmark
+def bench_string_attributes():
+    """Fold up to 32k <string key=...> children into attributes, flat and 10,000 deep."""
+    costs = []
+    for n in (4000, 8000, 16000, 32000):
+        def run():
+            elem = ET.Element("textField")
+            for i in range(n):
+                ET.SubElement(elem, "string", key=f"k{i}").text = "value"
+                ET.SubElement(elem, "rect", key=f"r{i}")
+            xibparser.replace_string_attribures(elem)
+            assert len(elem) == n and elem.get(f"k{n - 1}") == "value"
+
+        elapsed = _best_of(run)
+        costs.append(elapsed / n)
+        print(f"  {n:>7} strings  {elapsed * 1e3:8.2f} ms  {elapsed / n * 1e6:6.2f} us/string")
+
+    depth = 10000
+    root = cur = ET.Element("view")
+    for _ in range(depth):
+        ET.SubElement(cur, "string", key="toolTip", **{"base64-UTF8": "YES"}).text = "dGlw"
+        cur = ET.SubElement(cur, "view")
+    start = time.perf_counter()
+    xibparser.replace_string_attribures(root)
+    elapsed = time.perf_counter() - start
+    print(f"  depth {depth}  {elapsed * 1e3:8.2f} ms")
+    if cur.get("toolTip") is not None or root.get("toolTip") != "tip" or root.find("string") is not None:
+        print("  FAIL: strings in the deep chain were not replaced")
+        return False
+    return _check_linear("replace_string_attribures", costs)
+
+
+@benchmark
+def bench_stream_writer():
+    """Peak memory while writing a nib that embeds an 8 MiB TIFF-sized blob."""
+    blob_size = 8 * 1024 * 1024
+    image = NibObject("NSBitmapImageRep")
+    image["NSTIFFRepresentation"] = NibData(os.urandom(blob_size))
+    ctx = genlib.CompilationContext()
+    ctx.addObjects([image])
+    nib = ctx.makeTuples()
+
+    with tempfile.TemporaryFile() as f:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            written = nibencoding.WriteNibTo(nib, f)
+            file_peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        f.seek(0)
+        streamed = f.read()
+
+    buf = bytearray(nibencoding.NibWriter(nib).size)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        nibencoding.WriteNibTo(nib, buf)
+        buffer_peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    print(f"  {written} bytes  file peak {file_peak / 1024:8.1f} KiB  buffer peak {buffer_peak / 1024:8.1f} KiB")
+    if streamed != nibencoding.WriteNib(nib) or streamed != buf:
+        print("  FAIL: streamed output differs from WriteNib")
+        return False
+    if max(file_peak, buffer_peak) > blob_size // 4:
+        print("  FAIL: writer copies the embedded blob")
+        return False
+    return True
+
+
+@benchmark
+def bench_encode():
+    """Encode throughput for the largest sample nib (transmission_MainMenu)."""
+    root = ET.parse("samples/correct/transmission_MainMenu.xib").getroot()
+    with CompilationSession() as session:
+        _, nibroot = xibparser.ParseXIBObjects(root, session=session)
+        nib = genlib._makeNibTuples([nibroot])
+    values = len(nib[2])
+    elapsed = _best_of(lambda: nibencoding.WriteNib(nib), repeat=30)
+    size = len(nibencoding.WriteNib(nib))
+    print(f"  {values} values  {size} bytes  {elapsed * 1e3:8.2f} ms  {values / elapsed:12,.0f} values/s")
+    return True
+
+
+@benchmark
+def bench_read():
+    """Parse every sample nib, copying string values out or leaving them as views."""
+    blobs = []
+    for path in sorted(glob.glob("samples/**/*.nib", recursive=True)):
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            if data.startswith(b"NIBArchive"):
+                blobs.append(data)
+    values = sum(len(ibdump.readNibSectionsFromBytes(b)[2]) for b in blobs)
+
+    for materialize in (True, False):
+        def run():
+            for b in blobs:
+                ibdump.readNibSectionsFromBytes(b, materialize=materialize)
+
+        elapsed = _best_of(run, repeat=5)
+        gc.collect()
+        tracemalloc.start()
+        try:
+            run()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        label = "bytes" if materialize else "views"
+        print(f"  {label}: {len(blobs)} nibs  {values} values  {elapsed * 1e3:8.2f} ms"
+              f"  {values / elapsed:12,.0f} values/s  peak {peak / 1024:8.1f} KiB")
+
+    for b in blobs:
+        eager = ibdump.readNibSectionsFromBytes(b)
+        lazy = ibdump.readNibSectionsFromBytes(b, materialize=False)
+        lazy_values = [(k, bytes(v) if isinstance(v, memoryview) else v, e) for k, v, e in lazy[2]]
+        if eager[:2] + eager[3:] != lazy[:2] + lazy[3:] or eager[2] != lazy_values:
+            print("  FAIL: views do not match the materialised values")
+            return False
+    return True
+
+
+@benchmark
+def bench_lazy_filter():
+    """Resolve a structure path in the largest sample nib, eagerly and lazily."""
+    path = "samples/correct/transmission_MainMenu.nib"
+    structure = "NSIBObjectData/NSRoot"
+
+    def eager():
+        return ibdump.resolveStructurePath(ibdump.getNibSectionsFile(path), structure)
+
+    def lazy():
+        with ibdump.NibArchive.open(path) as nib:
+            return ibdump.resolveStructurePath(nib, structure), nib.values.decodedCount(), len(nib.values)
+
+    eager_time = _best_of(eager, repeat=5)
+    lazy_time = _best_of(lazy, repeat=5)
+    obj_id, decoded, total = lazy()
+    print(f"  eager {eager_time * 1e3:8.2f} ms  lazy {lazy_time * 1e3:8.2f} ms  decoded {decoded} of {total} values")
+    if obj_id != eager():
+        print("  FAIL: lazy archive resolves a different object")
+        return False
+    if decoded * 10 > total:
+        print("  FAIL: lazy archive decodes values off the requested path")
+        return False
+    return True
+
+
+def _compare_views(n):
+    """A compare-side window with n views, 8 subviews each, pointing back at their superview and window."""
+    from ibtool.compare import NibCollection, NibObject as Obj, NibValue
+
+    window = Obj("NSWindow", {"NSWindowTitle": NibValue(b"bench", 0)})
+    views = [Obj("NSView", {"NSTag": NibValue(0, 0), "NSFrame": NibValue(b"{{0, 0}, {10, 10}}", 0), "NSWindow": window})]
+    window.entries["NSWindowView"] = views[0]
+    for i in range(1, n):
+        parent = views[(i - 1) // 8]
+        view = Obj("NSView", {"NSTag": NibValue(i, 0), "NSFrame": NibValue(b"{{0, 0}, {10, 10}}", 0),
+                              "NSWindow": window, "NSSuperview": parent, "NSNextResponder": parent})
+        parent.entries.setdefault("NSSubviews", NibCollection("NSMutableArray", [])).entries.append(view)
+        views.append(view)
+    root = Obj("NSObject", {"IB.objectdata": Obj("NSIBObjectData", {"NSRoot": window})})
+    return root, views
+
+
+@benchmark
+def bench_compare():
+    """Compare two copies of a synthetic window with 4k to 32k views that differ in one view's tag."""
+    from ibtool import compare
+
+    visited = []
+    for n in (4096, 8192, 16384, 32768):
+        lhs, _ = _compare_views(n)
+        rhs, rhs_views = _compare_views(n)
+        rhs_views[n - 1].entries["NSTag"].value = -1
+
+        start = time.perf_counter()
+        digests = (compare.structural_digests(lhs), compare.structural_digests(rhs))
+        digest_time = time.perf_counter() - start
+        pruned = compare.Comparator()
+        start = time.perf_counter()
+        issues = list(pruned.diff(lhs, rhs, digests=digests))
+        diff_time = time.perf_counter() - start
+        visited.append(len(pruned.seen))
+
+        unpruned = compare.Comparator(prune=False)
+        start = time.perf_counter()
+        full = list(unpruned.diff(lhs, rhs))
+        full_time = time.perf_counter() - start
+        print(f"  {n:>6} views  digests {digest_time * 1e3:8.2f} ms  diff {diff_time * 1e3:6.2f} ms"
+              f" ({visited[-1]} pairs)  unpruned diff {full_time * 1e3:8.2f} ms ({len(unpruned.seen)} pairs)")
+        if issues != full or len(issues) != 1:
+            print(f"  FAIL: pruned diff reports {issues}, unpruned {full}")
+            return False
+    # The tree gets one level deeper each time the size grows 8x.
+    if visited[-1] > 2 * visited[0]:
+        print(f"  FAIL: pairs compared grow with the size of the nib ({visited[0]} -> {visited[-1]})")
+        return False
+    return True
+
+
+def _compare_constraints(n, seed):
+    """A compare-side nib with n layout constraints between 100 labels, in shuffled order."""
+    import random
+
+    from ibtool.compare import NibCollection, NibObject as Obj, NibValue
+
+    def string(text):
+        return Obj("NSString", {"NS.bytes": NibValue(text.encode(), 0)})
+
+    window = Obj("NSWindow", {})
+    content = Obj("NSView", {"NSWindow": window})
+    window.entries["NSWindowView"] = content
+    labels = []
+    for i in range(100):
+        cell = Obj("NSTextFieldCell", {"NSContents": string(f"label {i}")})
+        labels.append(Obj("NSTextField", {"NSCell": cell, "NSSuperview": content, "NSTag": NibValue(i, 0),
+                                          "NSFrame": string(f"{{{{0, {i * 20}}}, {{100, 20}}}}")}))
+    content.entries["NSSubviews"] = NibCollection("NSMutableArray", labels)
+    constraints = [
+        Obj("NSLayoutConstraint", {"NSFirstItem": labels[i % 100], "NSSecondItem": labels[(i * 7 + 1) % 100],
+                                   "NSFirstAttribute": NibValue(i % 7 + 1, 0), "NSSecondAttribute": NibValue(i % 5 + 1, 0),
+                                   "NSConstant": NibValue(float(i), 0)})
+        for i in range(n)
+    ]
+    random.Random(seed).shuffle(constraints)
+    content.entries["NSViewConstraints"] = NibCollection("NSMutableArray", constraints)
+    objects = [window, content] + labels + constraints
+    objectdata = Obj("NSIBObjectData", {"NSRoot": window, "NSObjectsKeys": NibCollection("NSArray", objects),
+                                        "NSOidsKeys": NibCollection("NSArray", list(objects))})
+    return Obj("NSObject", {"IB.objectdata": objectdata})
+
+
+@benchmark
+def bench_compare_constraints():
+    """Compare two nibs with 2.5k to 10k layout constraints stored in a different order."""
+    from ibtool import compare
+
+    costs = []
+    for n in (2500, 5000, 10000):
+        lhs, rhs = _compare_constraints(n, 1), _compare_constraints(n, 2)
+        start = time.perf_counter()
+        issues = list(compare.Comparator().compare(lhs, rhs))
+        elapsed = time.perf_counter() - start
+        costs.append(elapsed / n)
+        print(f"  {n:>6} constraints  {elapsed * 1e3:8.2f} ms  {elapsed / n * 1e6:6.2f} us/constraint")
+        if issues:
+            print(f"  FAIL: reordered constraints reported as different: {issues[:3]}")
+            return False
+    return _check_linear("constraint comparison", costs)
+
+
+def _compare_inlined(n, cell):
+    """A compare-side nib holding n copies of the cell nib as inlined NIBArchive values."""
+    from ibtool.compare import NibCollection, NibObject as Obj, NibValue
+
+    with open(cell, "rb") as f:
+        data = f.read()
+    cells = [Obj("NSNib", {"NSNibFileData": Obj("NSData", {"NS.bytes": NibValue(data, 0)})}) for _ in range(n)]
+    table = Obj("NSTableView", {"NSPrototypeCells": NibCollection("NSMutableArray", cells)})
+    objectdata = Obj("NSIBObjectData", {"NSRoot": table, "NSObjectsKeys": NibCollection("NSArray", [table])})
+    return Obj("NSObject", {"IB.objectdata": objectdata})
+
+
+@benchmark
+def bench_compare_inlined():
+    """Compare two nibs with 50 to 200 differing inlined prototype cell nibs."""
+    from ibtool import compare
+
+    lhs_cell, rhs_cell = "samples/correct/outline_cellview.nib", "samples/correct/outline_autohide_header.nib"
+    with open(lhs_cell, "rb") as f:
+        lhs_data = f.read()
+    with open(rhs_cell, "rb") as f:
+        rhs_data = f.read()
+    for n in (50, 100, 200):
+        lhs, rhs = _compare_inlined(n, lhs_cell), _compare_inlined(n, rhs_cell)
+        start = time.perf_counter()
+        issues = [str(issue) for issue in compare.Comparator().compare(lhs, rhs)]
+        elapsed = time.perf_counter() - start
+        # Each cell on its own, without reusing anything between them.
+        start = time.perf_counter()
+        expected = []
+        for i in range(n):
+            path = ["IB.objectdata", "NSObjectsKeys", "0", "NSPrototypeCells", str(i), "NSNibFileData", "NS.bytes", "nib"]
+            expected += [str(issue) for issue in compare.Comparator().compare_inlined(lhs_data, rhs_data, path)]
+        separate = time.perf_counter() - start
+        print(f"  {n:>4} cells  {elapsed * 1e3:8.2f} ms  (separately {separate * 1e3:8.2f} ms)  {len(issues)} differences")
+        if issues != expected:
+            print("  FAIL: reused inlined nib comparisons report different differences")
+            return False
+    if elapsed * 4 > separate:
+        print("  FAIL: identical inlined nibs are decoded and compared again")
+        return False
+    return True
+
+
+def _synthetic_storyboard(pairs):
+    """sb_textview.storyboard with its window/view controller scenes repeated."""
+    with open("samples/correct/sb_textview.storyboard") as f:
+        source = f.read()
+    head, rest = source.split('        <scene sceneID="sc2-00-020">', 1)
+    scenes, tail = rest.split("    </scenes>", 1)
+    scenes = '        <scene sceneID="sc2-00-020">' + scenes
+    # Give every copy its own ids and storyboard identifiers.
+    scenes = scenes.replace('<windowController id="wc1-00-020"',
+                            '<windowController id="wc1-00-020" storyboardIdentifier="Window-00-020"')
+    body = "".join(scenes.replace("-00-020", f"-{i:02x}-{i // 256:03x}") for i in range(pairs))
+    return head.replace("-00-020", f"-{0:02x}-{0:03x}") + body + "    </scenes>" + tail
+
+
+@benchmark
+def bench_storyboard_scaling():
+    """Per-scene compile cost of synthetic storyboards with 101 to 801 scenes."""
+    costs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pairs in (50, 100, 200, 400):
+            path = os.path.join(tmp, f"Synthetic{pairs}.storyboard")
+            with open(path, "w") as f:
+                f.write(_synthetic_storyboard(pairs))
+            out = os.path.join(tmp, f"out-{pairs}.storyboardc")
+            elapsed = _best_of(lambda: ibtool.ib_compile(path, out), repeat=1)
+            scenes = 2 * pairs + 1
+            costs.append(elapsed / scenes)
+            print(f"  {scenes:>4} scenes  {elapsed * 1e3:8.1f} ms  {elapsed / scenes * 1e3:6.2f} ms/scene")
+    return _check_linear("storyboard compile", costs, tolerance=1.5)
+
+
+@benchmark
+def bench_storyboard_jobs():
+    """Compile a synthetic 201-scene storyboard serially and with --jobs."""
+    import plistlib
+    import re
+
+    jobs = max(2, min(4, os.cpu_count() or 1))
+    uuid_re = re.compile(rb"[0-9A-F]{8}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{4}-[0-9A-F]{12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "Synthetic.storyboard")
+        with open(path, "w") as f:
+            f.write(_synthetic_storyboard(100))
+
+        outputs = {}
+        for n in (1, jobs):
+            out = os.path.join(tmp, f"out-{n}.storyboardc")
+            start = time.perf_counter()
+            ibtool.ib_compile(path, out, jobs=n)
+            elapsed = time.perf_counter() - start
+            with open(os.path.join(out, "Info.plist"), "rb") as f:
+                info = plistlib.load(f)
+            outputs[n] = (sorted(os.listdir(out)), uuid_re.sub(b"UUID", plistlib.dumps(info)))
+            print(f"  jobs={n}  {len(outputs[n][0]) - 1} nibs  {elapsed * 1e3:8.1f} ms  ({os.cpu_count()} CPUs)")
+
+    if outputs[1] != outputs[jobs]:
+        print("  FAIL: parallel output differs from the serial compile")
+        return False
+    return True
+
+
+@benchmark
+def bench_compare_jobs():
+    """Compare two compiles of a synthetic 201-scene storyboard serially, with --jobs, --quick and --format ndjson."""
+    import contextlib
+    import io
+    import json
+    import shutil
+
+    from ibtool import compare
+
+    def run(orig, test, **kwargs):
+        out = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(out):
+            try:
+                compare._compare_storyboard_dirs(orig, test, **kwargs)
+            except SystemExit as e:
+                status = e.code
+        return time.perf_counter() - start, status, out.getvalue()
+
+    jobs = max(2, min(4, os.cpu_count() or 1))
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "Synthetic.storyboard")
+        with open(path, "w") as f:
+            f.write(_synthetic_storyboard(100))
+        orig, test = os.path.join(tmp, "orig.storyboardc"), os.path.join(tmp, "test.storyboardc")
+        ibtool.ib_compile(path, orig)
+        ibtool.ib_compile(path, test)
+        # One scene in the middle differs.
+        nibs = sorted(f for f in os.listdir(test) if f.endswith(".nib"))
+        shutil.copyfile("samples/correct/minimal.nib", os.path.join(test, nibs[len(nibs) // 2]))
+
+        results = {}
+        for label, kwargs in (("serial", {}), (f"jobs={jobs}", {"jobs": jobs}),
+                              ("quick", {"quick": True}), (f"quick jobs={jobs}", {"quick": True, "jobs": jobs}),
+                              ("ndjson", {"fmt": "ndjson"}), (f"ndjson jobs={jobs}", {"fmt": "ndjson", "jobs": jobs})):
+            results[label] = run(orig, test, **kwargs)
+            elapsed, status, output = results[label]
+            print(f"  {label:<14} {len(nibs)} nibs  {elapsed * 1e3:8.1f} ms  exit {status}  {output.count(chr(10))} lines")
+
+    if any(status != 1 for _, status, _ in results.values()):
+        print("  FAIL: the difference was not reported")
+        return False
+    if any(results[label][2] != results[f"{label} jobs={jobs}"][2] for label in ("quick", "ndjson")) \
+            or results["serial"][2] != results[f"jobs={jobs}"][2]:
+        print("  FAIL: parallel comparison prints different output")
+        return False
+    messages = [json.loads(line)["message"] for line in results["ndjson"][2].splitlines()]
+    if messages != [line for line in results["serial"][2].splitlines() if not line.startswith("Comparing ")]:
+        print("  FAIL: ndjson records don't match the text output")
+        return False
+    return True
+
+
+@benchmark
+def bench_compile_cache():
+    """Store 500 to 2000 small entries in a compile cache, then trim it."""
+    from ibtool.compile_cache import CompileCache
+
+    costs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "out.nib")
+        with open(out, "wb") as f:
+            f.write(b"NIBArchive" * 100)
+        for n in (500, 1000, 2000):
+            cache = CompileCache(os.path.join(tmp, f"cache{n}"))
+            start = time.perf_counter()
+            for i in range(n):
+                cache.store(f"{i:064x}", out)
+            elapsed = time.perf_counter() - start
+            costs.append(elapsed / n)
+            print(f"  {n:>6} entries  {elapsed * 1e3:8.2f} ms  {elapsed / n * 1e6:7.1f} us/store")
+        cache.max_bytes = cache.size() // 2
+        cache.store("f" * 64, out)
+        walked, recorded = sum(size for _, size, _ in cache._entries()), cache.size()
+    if recorded != walked or walked > cache.max_bytes:
+        print(f"  FAIL: cache holds {walked} bytes, recorded {recorded}, limit {cache.max_bytes}")
+        return False
+    return _check_linear("cache store", costs, tolerance=2.0)
+
+
+@benchmark
+def bench_object_memory():
+    """Traced bytes per compiled object after parsing each XIB in samples/correct."""
+    total_bytes = total_objects = with_dict = 0
+    for xib in sorted(glob.glob("samples/correct/*.xib")):
+        root = ET.parse(xib).getroot()
+        if root.tag != "document":
+            continue
+        gc.collect()
+        tracemalloc.start()
+        try:
+            with CompilationSession() as session:
+                _, nibroot = xibparser.ParseXIBObjects(root, session=session)
+            gc.collect()
+            used = tracemalloc.get_traced_memory()[0]
+        except Exception:
+            # Samples that need host frameworks (e.g. CoreGraphics) are skipped.
+            continue
+        finally:
+            tracemalloc.stop()
+        ctx = genlib.CompilationContext()
+        ctx.addObjects([nibroot])
+        total_bytes += used
+        total_objects += len(ctx.object_list)
+        with_dict += sum(1 for o in ctx.object_list if hasattr(o, "__dict__"))
+    print(f"  {total_objects} objects  {total_bytes / 1024:8.1f} KiB  {total_bytes / total_objects:6.1f} bytes/object")
+    if with_dict:
+        print(f"  FAIL: {with_dict} objects still carry a __dict__")
+        return False
+    return True
+
+
+# Most ibtool modules (and of those, ibtool.parsers modules) a cold command
+# line run may import. Import times are only reported: they depend on the
+# machine, while what gets imported is up to the code.
+_STARTUP_MODULE_BUDGETS = {
+    "--version": (1, 0),
+    "--compile minimal.xib": (15, 2),
+}
+
+
+def _startup_imports(args, env):
+    """Runs `python -X importtime -m ibtool args` and returns {module: cumulative ms}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "ibtool"] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, env=env, check=True,
+    )
+    imports = {}
+    for line in result.stderr.splitlines():
+        m = re.match(r"import time:\s+\d+ \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m and m.group(3).startswith("ibtool"):
+            imports[m.group(3)] = (int(m.group(1)) / 1000, len(m.group(2)))
+    return imports
+
+
+@benchmark
+def bench_startup():
+    """ibtool modules imported, and their import time, by a cold --version and a cold compile of samples/correct/minimal.xib."""
+    from ibtool.parsers import PARSER_MODULES, scan_parser_modules
+
+    ok = True
+    if scan_parser_modules() != PARSER_MODULES:
+        print("  FAIL: ibtool/parsers/_registry.py is out of date, run `python -m ibtool.parsers`")
+        ok = False
+
+    # Stale bytecode would be recompiled on every run and swamp the numbers.
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    with tempfile.TemporaryDirectory() as tmp:
+        commands = {
+            "--version": ["--version"],
+            "--compile minimal.xib": ["--compile", os.path.join(tmp, "out.nib"), "samples/correct/minimal.xib"],
+        }
+        for label, args in commands.items():
+            _startup_imports(args, env)
+            runs = [_startup_imports(args, env) for _ in range(5)]
+            # Modules imported at the top level account for everything below them.
+            ms = min(sum(t for t, depth in run.values() if depth == 0) for run in runs)
+            modules = len(runs[0])
+            parsers = sum(1 for name in runs[0] if name.startswith("ibtool.parsers."))
+            max_modules, max_parsers = _STARTUP_MODULE_BUDGETS[label]
+            print(f"  {label:<22} {modules:>3} ibtool modules ({parsers} parsers)  {ms:7.1f} ms"
+                  f"  (budget {max_modules} modules, {max_parsers} parsers)")
+            if modules > max_modules or parsers > max_parsers:
+                print(f"  FAIL: {label} imports more of ibtool than it needs: {', '.join(sorted(runs[0]))}")
+                ok = False
+    return ok
+
+
+@benchmark
+def bench_client_pipelining():
+    """Pipeline 2,000 requests through ibtool_client.Client to a server that answers one at a time."""
+    import json
+    import socket
+    import threading
+
+    from ibtool_client import Client
+
+    n, limit = 2000, 60
+    reply = "x" * 65536
+    results = []
+
+    def serve(listener):
+        # Like a busy server: the next request is only read once the reply to
+        # the previous one has been written, so both socket buffers fill up.
+        conn, _ = listener.accept()
+        with conn, conn.makefile("rb") as requests:
+            for line in requests:
+                request_id = json.loads(line)["id"]
+                conn.sendall((json.dumps({"id": request_id, "stdout": reply}) + "\n").encode())
+                conn.sendall((json.dumps({"id": request_id, "finish": 0}) + "\n").encode())
+
+    def pipeline(address):
+        with Client(address) as client:
+            futures = [client.submit(["/usr/bin/ibtool", "--compile", f"{i}.nib", "x" * 4096]) for i in range(n)]
+            results.extend(future.result() for future in futures)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "server.sock")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        threading.Thread(target=serve, args=(listener,), daemon=True).start()
+        start = time.perf_counter()
+        thread = threading.Thread(target=pipeline, args=(f"unix:{path}",), daemon=True)
+        thread.start()
+        thread.join(limit)
+        elapsed = time.perf_counter() - start
+        listener.close()
+    if thread.is_alive():
+        print(f"  FAIL: the client stalled, {len(results)} of {n} pipelined requests finished after {limit} s")
+        return False
+    print(f"  {n} requests  {elapsed * 1e3:8.2f} ms  {sum(len(r.stdout) for r in results) / 2**20:.1f} MiB of replies")
+    if any(r != (0, reply, "") for r in results):
+        print("  FAIL: pipelined requests got the wrong replies")
+        return False
+    return True
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmark(s): {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+        sys.exit(2)
+
+    failed = 0
+    for name in names:
+        print(f"{name}:")
+        if BENCHMARKS[name]() is False:
+            failed += 1
+        print()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
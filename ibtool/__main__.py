@@ -1,7 +1,5 @@
-from . import ibdump
-from . import ibtool
-from . import compare
-from . import xibmap as xibmap_mod
+# Each command imports the modules it needs, so that --version or --dump
+# don't pay for loading the compiler.
 import sys
 import argparse
 import plistlib
@@ -26,11 +24,27 @@ def _output_diagnostics(args):
         sys.stdout.buffer.write(plistlib.dumps(result, fmt=plistlib.FMT_XML))
 
 
+def _compile_cache(args):
+    if not args.cache_dir:
+        return None
+    from . import compile_cache
+    max_bytes = compile_cache.DEFAULT_MAX_BYTES
+    if args.cache_size is not None:
+        max_bytes = args.cache_size * 1024 * 1024
+    return compile_cache.CompileCache(args.cache_dir, max_bytes)
+
+
 def run():
     parser = argparse.ArgumentParser()
     parser.add_argument("input", nargs='?')
     parser.add_argument("--compile", metavar="output")
+    parser.add_argument("--compile-batch", metavar="MANIFEST",
+                        help="Compile every input/output pair listed in MANIFEST (JSON or one pair per line) and report per-file JSON results")
     parser.add_argument("--compare", metavar="input2")
+    parser.add_argument("--quick", action="store_true",
+                        help="With --compare, stop at the first difference")
+    parser.add_argument("--format", choices=["text", "ndjson"], default="text",
+                        help="Output format for --compare: text lines, or one JSON record per difference")
     parser.add_argument("--xib", metavar="XIB", help="XIB source file for annotating --compare output with XIB element ids")
     parser.add_argument("--xibmap", action="store_true", help="Show mapping from XIB element ids to NIB object indices (input must be a .xib)")
     parser.add_argument("--dump", action="store_true")
@@ -53,6 +67,14 @@ def run():
                         help="Target device; only 'mac' is supported")
     parser.add_argument("--minimum-deployment-target", metavar="VERSION",
                         help="Minimum deployment target (accepted but ignored)")
+    parser.add_argument("-j", "--jobs", metavar="N", type=int, default=1,
+                        help="Compile storyboard scenes (or --compile-batch files, or compare the nibs of two compiled storyboards) in N worker processes")
+    parser.add_argument("--cache-dir", metavar="DIR",
+                        help="Reuse compiled outputs stored in DIR for unchanged inputs")
+    parser.add_argument("--cache-size", metavar="MB", type=int,
+                        help="Size limit of --cache-dir in MB (default: 512)")
+    parser.add_argument("--cache-stats", action="store_true",
+                        help="Print compile cache hit/miss statistics to stderr")
     parser.add_argument("--version", action="store_true", help="Version")
     args = parser.parse_args()
     
@@ -76,24 +98,39 @@ def run():
         print(f"unsupported target device: {args.target_device!r} (only 'mac' is supported)")
         sys.exit(1)
 
+    if args.compile_batch:
+        from . import batch
+        cache = _compile_cache(args)
+        ok = batch.run_batch(args.compile_batch, jobs=args.jobs, module=args.module, cache=cache)
+        if cache is not None and args.cache_stats:
+            cache.print_stats()
+        sys.exit(0 if ok else 1)
+
     if not args.input:
         print('input file required')
         sys.exit(1)
 
     if args.xibmap:
-        xibmap_mod.print_xibmap(args.input)
+        from . import xibmap
+        xibmap.print_xibmap(args.input)
 
     elif args.compile:
-        ibtool.ib_compile(args.input, args.compile, module=args.module)
+        from . import ibtool
+        cache = _compile_cache(args)
+        ibtool.ib_compile(args.input, args.compile, module=args.module, cache=cache, jobs=args.jobs)
+        if cache is not None and args.cache_stats:
+            cache.print_stats()
         if args.output_partial_info_plist:
             with open(args.output_partial_info_plist, "wb") as f:
                 f.write(plistlib.dumps({}, fmt=plistlib.FMT_XML))
         _output_diagnostics(args)
 
     elif args.compare:
-        compare.main(args.compare, args.input, xib_path=args.xib)
+        from . import compare
+        compare.main(args.compare, args.input, xib_path=args.xib, quick=args.quick, jobs=args.jobs, fmt=args.format)
 
     elif args.dump:
+        from . import ibdump
         ibdump.ibdump(args.input, args.encoding, args.tree, args.sort, args.filter)
 
     elif args.errors or args.warnings or args.notices:
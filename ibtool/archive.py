@@ -24,6 +24,7 @@ from typing import Optional
 
 from .models import (
     ArrayLike,
+    CompilationSession,
     NibObject,
     NibNSNumber,
     NibString,
@@ -888,7 +889,12 @@ def _apply_view_defaults(obj: NibObject, seen: set) -> None:
             _apply_view_defaults(v, seen)
 
 
-def parse_archive(root: Element) -> NibObject:
+def parse_archive(root: Element, session: Optional[CompilationSession] = None) -> NibObject:
+    with CompilationSession.join(session):
+        return _parse_archive(root)
+
+
+def _parse_archive(root: Element) -> NibObject:
     data_elem = root.find("data")
     if data_elem is None:
         raise ValueError("archive: missing <data> element")
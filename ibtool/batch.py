@@ -0,0 +1,174 @@
+"""Compiling many XIB/storyboard files in one process (--compile-batch).
+
+A manifest is either JSON or a plain text list:
+
+    [{"input": "A.xib", "output": "A.nib", "module": "App"},
+     ["B.xib", "B.nib"]]
+
+    # one entry per line: input output [--module NAME]
+    A.xib A.nib --module App
+    B.xib B.nib
+
+Paths are used as given, i.e. relative to the current directory. Each file
+produces one JSON line on stdout with its status and timing, followed by a
+summary line.
+"""
+
+import json
+import shlex
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, NamedTuple, Optional
+
+from . import ibtool
+from .compile_cache import CompileCache
+
+
+class BatchItem(NamedTuple):
+    input: str
+    output: str
+    module: Optional[str] = None
+
+
+def load_manifest(path: str) -> list[BatchItem]:
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith(("[", "{")):
+        return _parse_json_manifest(json.loads(text))
+    return _parse_text_manifest(text)
+
+
+def _parse_json_manifest(data: Any) -> list[BatchItem]:
+    if isinstance(data, dict):
+        data = data.get("files")
+    if not isinstance(data, list):
+        raise ValueError("manifest must be a list of files or an object with a \"files\" list")
+    items = []
+    for n, entry in enumerate(data):
+        if isinstance(entry, dict):
+            if "input" not in entry or "output" not in entry:
+                raise ValueError(f"manifest entry {n}: \"input\" and \"output\" are required")
+            items.append(BatchItem(entry["input"], entry["output"], entry.get("module")))
+        elif isinstance(entry, list) and len(entry) in (2, 3):
+            items.append(BatchItem(*entry))
+        else:
+            raise ValueError(f"manifest entry {n}: expected an object or an [input, output(, module)] list")
+    return items
+
+
+def _parse_text_manifest(text: str) -> list[BatchItem]:
+    items = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        fields = shlex.split(line, comments=True)
+        if not fields:
+            continue
+        module = None
+        if "--module" in fields:
+            i = fields.index("--module")
+            if i + 1 >= len(fields):
+                raise ValueError(f"manifest line {lineno}: --module needs a value")
+            module = fields[i + 1]
+            del fields[i : i + 2]
+        if len(fields) != 2:
+            raise ValueError(f"manifest line {lineno}: expected \"input output [--module NAME]\"")
+        items.append(BatchItem(fields[0], fields[1], module))
+    return items
+
+
+def compile_batch(items: list[BatchItem], jobs: int = 1, module: Optional[str] = None, cache: Optional[CompileCache] = None):
+    """Compiles every item and yields one result dict per item, in manifest order.
+
+    module is the default for items that don't set their own. Failures are
+    reported in the result instead of stopping the batch.
+    """
+    tasks = [(item, item.module or module) for item in items]
+    if jobs > 1 and len(tasks) > 1:
+        cache_config = (cache.root, cache.max_bytes) if cache is not None else None
+        with ProcessPoolExecutor(
+            max_workers=min(jobs, len(tasks)),
+            initializer=_init_batch_worker,
+            initargs=(cache_config,),
+        ) as pool:
+            for result, counts in pool.map(_compile_in_worker, tasks):
+                # Count the workers' lookups and stores on the caller's cache.
+                if cache is not None:
+                    for name, count in zip(_CACHE_COUNTERS, counts):
+                        setattr(cache, name, getattr(cache, name) + count)
+                yield result
+    else:
+        for item, item_module in tasks:
+            yield _compile_one(item, item_module, cache)
+
+
+def _compile_one(item: BatchItem, module: Optional[str], cache: Optional[CompileCache]) -> dict:
+    result: dict[str, Any] = {"input": item.input, "output": item.output, "module": module}
+    before = _cache_counts(cache)
+    start = time.perf_counter()
+    try:
+        ibtool.ib_compile(item.input, item.output, module=module, cache=cache)
+        result["status"] = "ok"
+    except (Exception, SystemExit) as e:
+        result["status"] = "error"
+        if isinstance(e, SystemExit):
+            result["error"] = str(e.code)
+        else:
+            result["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+    result["seconds"] = round(time.perf_counter() - start, 6)
+    if cache is not None:
+        hits, misses, _, _ = _cache_counts_since(cache, before)
+        # An input that can't be read fails before it is looked up.
+        result["cache"] = "hit" if hits else "miss" if misses else "error"
+    return result
+
+
+_CACHE_COUNTERS = ("hits", "misses", "stores", "evictions")
+
+
+def _cache_counts(cache: Optional[CompileCache]) -> tuple[int, ...]:
+    if cache is None:
+        return (0,) * len(_CACHE_COUNTERS)
+    return tuple(getattr(cache, name) for name in _CACHE_COUNTERS)
+
+
+def _cache_counts_since(cache: Optional[CompileCache], before: tuple[int, ...]) -> tuple[int, ...]:
+    return tuple(after - was for after, was in zip(_cache_counts(cache), before))
+
+
+_worker_cache: Optional[CompileCache] = None
+
+
+def _init_batch_worker(cache_config):
+    global _worker_cache
+    if cache_config is not None:
+        _worker_cache = CompileCache(*cache_config)
+
+
+def _compile_in_worker(task) -> tuple[dict, tuple[int, ...]]:
+    """Compiles one item; also returns what it added to the worker's cache counters."""
+    item, module = task
+    before = _cache_counts(_worker_cache)
+    result = _compile_one(item, module, _worker_cache)
+    return result, _cache_counts_since(_worker_cache, before)
+
+
+def run_batch(manifest: str, jobs: int = 1, module: Optional[str] = None, cache: Optional[CompileCache] = None, out=sys.stdout) -> bool:
+    """Runs a manifest, writing one JSON line per file and a summary line to out.
+
+    Returns True if every file compiled.
+    """
+    items = load_manifest(manifest)
+    start = time.perf_counter()
+    summary = {"files": len(items), "ok": 0, "failed": 0}
+    before = _cache_counts(cache)
+    for result in compile_batch(items, jobs=jobs, module=module, cache=cache):
+        summary["ok" if result["status"] == "ok" else "failed"] += 1
+        print(json.dumps(result), file=out, flush=True)
+    summary["seconds"] = round(time.perf_counter() - start, 6)
+    if cache is not None:
+        hits, misses, _, _ = _cache_counts_since(cache, before)
+        summary["cache_hits"] = hits
+        summary["cache_misses"] = misses
+    print(json.dumps({"summary": summary}), file=out, flush=True)
+    return summary["failed"] == 0
@@ -1,8 +1,12 @@
 from .ibdump import getNibSections, getNibSectionsFile, NibStructure
+import base64
+import hashlib
+import json
+import math
 import sys
 import os
 import re
-from typing import Any, Union, cast, Iterable, Optional
+from typing import Any, NamedTuple, Union, cast, Iterable, Iterator, Optional
 
 SCROLLBAR_WIDTH = 17
 
@@ -37,18 +41,6 @@ class NibCollection:
     def __repr__(self):
         return f"{self.classname} ({len(self.entries)} entries)"
 
-    def rec_hash(self, path, cache=None):
-        if cache is None:
-            cache = {}
-        if id(self) in cache:
-            return cache[id(self)]
-        if id(self) in path:
-            return 999
-        path_next = path + [id(self)]
-        result = hash((self.classname, tuple([x.rec_hash(path_next, cache) if getattr(x, "rec_hash", None) else x for x in self.entries])))
-        cache[id(self)] = result
-        return result
-
 class NibObject:
     def __init__(self, classname: str, entries: dict[str,Any], nibidx: int = -1):
         self.classname = classname
@@ -66,18 +58,6 @@ class NibObject:
     def __repr__(self):
         return f"{self.classname} ({len(self.entries)} entries)"
 
-    def rec_hash(self, path, cache=None):
-        if cache is None:
-            cache = {}
-        if id(self) in cache:
-            return cache[id(self)]
-        if id(self) in path:
-            return 999
-        path_next = path + [id(self)]
-        result = hash((self.classname, tuple([(k,v.rec_hash(path_next, cache) if getattr(v, "rec_hash", None) else v) for k,v in self.entries.items()])))
-        cache[id(self)] = result
-        return result
-
 class NibValue:
     def __init__(self, value: Any, vtype: int):
         self.value = value
@@ -158,16 +138,62 @@ def pythonObjects(nib: NibStructure) -> tuple[NibObject, list[Any]]:
 
     return cast(NibObject, res[0]), [] #not_referenced
 
-already_seen = set()
+def _xib_id(obj: Union[NibValue,NibCollection,NibObject], xibid_map: Optional[dict[int,str]]) -> Optional[str]:
+    """Return the XIB id of the object if it is known."""
+    if xibid_map is None:
+        return None
+    nibidx = getattr(obj, 'nibidx', -1)
+    if nibidx >= 0:
+        return xibid_map.get(nibidx)
+    return None
 
 def _xib_annotation(obj: Union[NibValue,NibCollection,NibObject], xibid_map: Optional[dict[int,str]]) -> str:
     """Return ' [xib:ID]' annotation if the object has a known XIB id, else ''."""
-    if xibid_map is None:
-        return ""
-    nibidx = getattr(obj, 'nibidx', -1)
-    if nibidx >= 0 and nibidx in xibid_map:
-        return f" [xib:{xibid_map[nibidx]}]"
-    return ""
+    xib_id = _xib_id(obj, xibid_map)
+    return f" [xib:{xib_id}]" if xib_id is not None else ""
+
+def _json_value(value: Any) -> Any:
+    """A JSON-compatible form of a compared value, without references into the nib."""
+    if isinstance(value, NibValue):
+        value = value.value
+    if isinstance(value, (NibObject, NibCollection)):
+        return {"class": value.classname}
+    if isinstance(value, bytes):
+        try:
+            return value.decode("utf-8")
+        except UnicodeDecodeError:
+            return {"base64": base64.b64encode(value).decode("ascii")}
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    return value
+
+class Difference(NamedTuple):
+    """One difference found by Comparator.diff; str() gives the --compare text line."""
+    path: list[str]
+    kind: str
+    message: str
+    parent_class: Optional[str] = None
+    xib_id: Optional[str] = None
+    lhs: Any = None
+    rhs: Any = None
+    lhs_encoding: Optional[int] = None
+    rhs_encoding: Optional[int] = None
+
+    def __str__(self) -> str:
+        return self.message
+
+    def record(self) -> dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "path": self.path,
+            "parent_class": self.parent_class,
+            "xib_id": self.xib_id,
+            "lhs": self.lhs,
+            "rhs": self.rhs,
+            "lhs_encoding": self.lhs_encoding,
+            "rhs_encoding": self.rhs_encoding,
+            "message": self.message,
+        }
 
 def _sv_child_sort_key(obj):
     """Stable sort key for stack view container children.
@@ -217,183 +243,358 @@ def _sv_child_sort_key(obj):
     return (cn, text, tag_val)
 
 
-def diff(lhs: Union[NibValue,NibCollection,NibObject], rhs: Union[NibValue,NibCollection,NibObject], lhs_root: list[Union[NibValue,NibCollection,NibObject]], rhs_root: list[Union[NibValue,NibCollection,NibObject]], current_path: list[str]=[], lhs_path: list[int]=[], rhs_path: list[int]=[], parent_class: Optional[str] = None, xibid_map: Optional[dict[int,str]] = None) -> Iterable[str]:
-    if (id(lhs), id(rhs)) in already_seen:
-        return
-    already_seen.add((id(lhs), id(rhs)))
-    lhs_path = lhs_path + [id(lhs)]
-    rhs_path = rhs_path + [id(rhs)]
-
-    path = '->'.join(str(key) for key in current_path)
-
-    if path.endswith("NSOidsValues") or path.endswith("NSAccessibilityOidsValues") or path.endswith("NSAccessibilityOidsKeys"):
-        return
-
-    if type(lhs) != type(rhs):
-        yield f"{path}{_xib_annotation(rhs, xibid_map)} (in {parent_class}): Types don't match {type(lhs)} != {type(rhs)}"
-        return
-
-    if isinstance(lhs, NibValue) and isinstance(rhs, NibValue):
-        if lhs.type != rhs.type:
-            yield f"{path} (in {parent_class}): Object types don't match {lhs.type} != {rhs.type}"
-
-        if type(lhs.value) is bytes and lhs.value.startswith(b"NIBArchive") and not rhs.value.startswith(b"NIBArchive"):
-            yield f"{path} (in {parent_class}): LHS is a NIB, but RHS isn't"
-        elif type(rhs.value) is bytes and rhs.value.startswith(b"NIBArchive") and not lhs.value.startswith(b"NIBArchive"):
-            yield f"{path} (in {parent_class}): RHS is a NIB, but LHS isn't"
-        elif type(lhs.value) is bytes and lhs.value.startswith(b"NIBArchive"):
-            nib_left = getNibSections(lhs.value, "(inlined)")
-            nib_left_root, _ = pythonObjects(nib_left)
-            nib_right = getNibSections(rhs.value, "(inlined)")
-            nib_right_root, _ = pythonObjects(nib_right)
-            nib_left_objects = nib_left_root.entries["IB.objectdata"].entries["NSObjectsKeys"].entries
-            nib_right_objects = nib_right_root.entries["IB.objectdata"].entries["NSObjectsKeys"].entries
-            fixup_layout_constrints(nib_left_objects, nib_left_objects)
-            fixup_layout_constrints(nib_right_objects, nib_right_objects)
-            nib_left_oids = nib_left_root.entries["IB.objectdata"].entries.get("NSOidsKeys")
-            nib_right_oids = nib_right_root.entries["IB.objectdata"].entries.get("NSOidsKeys")
-            if nib_left_oids is not None:
-                fixup_layout_constrints(nib_left_oids.entries, nib_left_objects)
-                fixup_connections(nib_left_oids.entries)
-            if nib_right_oids is not None:
-                fixup_layout_constrints(nib_right_oids.entries, nib_right_objects)
-                fixup_connections(nib_right_oids.entries)
-            yield from diff(nib_left_root, nib_right_root, nib_left_objects, nib_right_objects, current_path + ["nib"], [], [], xibid_map=xibid_map)
-
-        elif type(lhs.value) in [int, str, float, bytes, type(None)]:
-            if lhs.value != rhs.value:
-                if _is_scrollbar_width_diff(path, lhs.value, rhs.value):
-                    pass
-                elif (path.endswith("Flags") or path.endswith("Flags2") or path.endswith("Mask")) and isinstance(lhs.value, int) and isinstance(rhs.value, int):
-                    lval = lhs.value if lhs.value >= 0 else lhs.value + 0x10000000000000000
-                    rval = rhs.value if rhs.value >= 0 else rhs.value + 0x10000000000000000
-                    yield f"{path} (in {parent_class}): difference {hex(lval)} != {hex(rval)}"
-                else:
-                    yield f"{path} (in {parent_class}): difference {lhs.value} != {rhs.value}"
+def _digest_entries(key: str, collection: NibCollection) -> list[Any]:
+    """Applies the in-place reordering diff does for collections under key."""
+    if key.endswith("NSViewConstraints"):
+        fixup_layout_constrints(collection.entries)
+    elif key.endswith("NSConnections"):
+        fixup_connections(collection.entries)
+    return collection.entries
+
+
+def _value_token(value: NibValue) -> Any:
+    if isinstance(value.value, float) and value.value != value.value:
+        # NaN never compares equal, so it must not make two digests equal.
+        return (value.type, "nan", id(value))
+    return (value.type, value.value)
+
+
+Digest = tuple[bytes, tuple[int, ...]]
+
+
+def structural_digests(root: Union[NibObject,NibCollection]) -> dict[int,Digest]:
+    """Bottom-up (Merkle) digests of every object and collection reachable from root, by id().
+
+    Each digest covers the class, keys, values and collection order (after
+    the constraint/connection fixups diff applies) of everything first
+    reached through the object. A reference to an object still being
+    digested - the NSSuperview/NSNextResponder cycles - is hashed as its
+    distance up the chain instead of being followed, which keeps the walk
+    finite. What those references point at depends on how the object was
+    reached, so each digest comes with its exits: the ids of objects outside
+    the digested subgraph that it refers to, in order of first reference.
+    """
+    digests: dict[int,Digest] = {}
+    depth: dict[int,int] = {}
+    # Objects are numbered as they are first reached; everything numbered
+    # after an object, until it's finished, belongs to its subgraph.
+    order: dict[int,int] = {}
+    # [object, (label, token) pairs so far, remaining (label, child) pairs, label of the child being digested, exit ids]
+    stack: list[list[Any]] = []
+
+    def push(obj, key):
+        if isinstance(obj, NibObject):
+            children = iter(sorted(obj.entries.items()))
+            kind = "object"
+        else:
+            children = enumerate(_digest_entries(key, obj))
+            kind = "collection"
+        depth[id(obj)] = len(stack)
+        order[id(obj)] = len(order)
+        stack.append([obj, [kind, obj.classname], children, None, []])
+
+    push(root, "")
+    while stack:
+        frame = stack[-1]
+        obj, tokens, children, _, exits = frame
+        for label, child in children:
+            if type(child) is NibValue:
+                tokens.append((label, _value_token(child)))
+                continue
+            child_id = id(child)
+            known = digests.get(child_id)
+            if known is not None:
+                tokens.append((label, known[0]))
+                exits += known[1]
+            elif child_id in depth:
+                tokens.append((label, len(stack) - depth[child_id]))
+                exits.append(child_id)
+            else:
+                frame[3] = label
+                push(child, str(label))
+                break
+        else:
+            stack.pop()
+            del depth[id(obj)]
+            first = order[id(obj)]
+            own_exits = tuple({x: None for x in exits if order[x] < first})
+            digest = hashlib.blake2b(repr(tokens).encode(), digest_size=16).digest()
+            digests[id(obj)] = (digest, own_exits)
+            if stack:
+                parent = stack[-1]
+                parent[1].append((parent[3], digest))
+                parent[4] += own_exits
+    return digests
+
+
+class Comparator:
+    """One comparison of two decoded nibs.
+
+    Remembers which pairs of objects were compared, so shared objects and
+    reference cycles are only walked once. Use a new Comparator for every
+    pair of files.
+    """
+
+    def __init__(self, xibid_map: Optional[dict[int,str]] = None, prune: bool = True) -> None:
+        self.xibid_map = xibid_map
+        self.prune = prune
+        self.seen: set[tuple[int,int]] = set()
+        # Inlined NIBArchive values decoded and normalized once per side and
+        # content digest. This also keeps the objects alive, so the ids in
+        # seen can't be reused by later objects.
+        self._decoded: dict[tuple[int,bytes],tuple[NibObject,Optional[dict[int,Digest]]]] = {}
+        # Differences found between pairs of inlined archives, with the path
+        # they were found under.
+        self._inlined_diffs: dict[tuple[bytes,bytes],tuple[list[str],list[Difference]]] = {}
+
+    def _difference(self, path, kind, message, parent_class, obj, lhs=None, rhs=None, lhs_encoding=None, rhs_encoding=None) -> Difference:
+        return Difference(list(path), kind, message, parent_class, _xib_id(obj, self.xibid_map),
+                          _json_value(lhs), _json_value(rhs), lhs_encoding, rhs_encoding)
+
+    def compare(self, lhs_root: NibObject, rhs_root: NibObject, current_path: list[str] = []) -> Iterable[Difference]:
+        """Puts constraints and connections of both nibs in a stable order and yields the differences."""
+        _normalize_nib(lhs_root)
+        _normalize_nib(rhs_root)
+        digests = None
+        if self.prune:
+            digests = (structural_digests(lhs_root), structural_digests(rhs_root))
+        yield from self.diff(lhs_root, rhs_root, current_path, [], [], digests=digests)
+
+    def _decode_inlined(self, side: int, data: bytes) -> tuple[bytes,NibObject,Optional[dict[int,Digest]]]:
+        key = hashlib.blake2b(data, digest_size=16).digest()
+        decoded = self._decoded.get((side, key))
+        if decoded is None:
+            root, _ = pythonObjects(getNibSections(data, "(inlined)"))
+            _normalize_nib(root)
+            decoded = (root, structural_digests(root) if self.prune else None)
+            self._decoded[(side, key)] = decoded
+        return (key, *decoded)
+
+    def compare_inlined(self, lhs_data: bytes, rhs_data: bytes, current_path: list[str]) -> Iterable[Difference]:
+        """Compares two inlined NIBArchive values.
+
+        Their differences only depend on the two archives, so a pair that was
+        already compared (e.g. identical prototype cells) replays the recorded
+        differences under the new path instead of walking the graphs again.
+        """
+        lhs_key, lhs_root, lhs_digests = self._decode_inlined(0, lhs_data)
+        rhs_key, rhs_root, rhs_digests = self._decode_inlined(1, rhs_data)
+        cached = self._inlined_diffs.get((lhs_key, rhs_key))
+        if cached is not None:
+            found_path, found = cached
+            found_prefix = len('->'.join(str(key) for key in found_path))
+            prefix = '->'.join(str(key) for key in current_path)
+            for difference in found:
+                yield difference._replace(path=current_path + difference.path[len(found_path):],
+                                          message=prefix + difference.message[found_prefix:])
+            return
+        digests = (lhs_digests, rhs_digests) if self.prune else None
+        found = []
+        for difference in self.diff(lhs_root, rhs_root, current_path, [], [], digests=digests):
+            found.append(difference)
+            yield difference
+        # Only complete results can be replayed; a --quick run stops early.
+        self._inlined_diffs[(lhs_key, rhs_key)] = (list(current_path), found)
+
+    def diff(self, lhs: Union[NibValue,NibCollection,NibObject], rhs: Union[NibValue,NibCollection,NibObject], current_path: list[str]=[], lhs_path: list[int]=[], rhs_path: list[int]=[], parent_class: Optional[str] = None, digests: Optional[tuple[dict[int,Digest],dict[int,Digest]]] = None) -> Iterable[Difference]:
+        if (id(lhs), id(rhs)) in self.seen:
+            return
+        self.seen.add((id(lhs), id(rhs)))
+        lhs_path = lhs_path + [id(lhs)]
+        rhs_path = rhs_path + [id(rhs)]
+
+        path = '->'.join(str(key) for key in current_path)
+
+        if path.endswith("NSOidsValues") or path.endswith("NSAccessibilityOidsValues") or path.endswith("NSAccessibilityOidsKeys"):
+            return
+
+        if digests is not None and not isinstance(lhs, NibValue):
+            lhs_digest = digests[0].get(id(lhs))
+            rhs_digest = digests[1].get(id(rhs))
+            if lhs_digest is not None and rhs_digest is not None and lhs_digest[0] == rhs_digest[0]:
+                lhs_exits, rhs_exits = lhs_digest[1], rhs_digest[1]
+                # Identical subgraphs can't produce differences as long as the
+                # references leading out of them end in pairs already compared.
+                if len(lhs_exits) == len(rhs_exits) and all(pair in self.seen for pair in zip(lhs_exits, rhs_exits)):
+                    return
+
+        if type(lhs) != type(rhs):
+            yield self._difference(current_path, "type", f"{path}{_xib_annotation(rhs, self.xibid_map)} (in {parent_class}): Types don't match {type(lhs)} != {type(rhs)}",
+                                   parent_class, rhs, type(lhs).__name__, type(rhs).__name__)
+            return
+
+        if isinstance(lhs, NibValue) and isinstance(rhs, NibValue):
+            if lhs.type != rhs.type:
+                yield self._difference(current_path, "encoding", f"{path} (in {parent_class}): Object types don't match {lhs.type} != {rhs.type}",
+                                       parent_class, rhs, lhs.value, rhs.value, lhs.type, rhs.type)
+
+            if type(lhs.value) is bytes and lhs.value.startswith(b"NIBArchive") and not rhs.value.startswith(b"NIBArchive"):
+                yield self._difference(current_path, "nib", f"{path} (in {parent_class}): LHS is a NIB, but RHS isn't",
+                                       parent_class, rhs, None, None, lhs.type, rhs.type)
+            elif type(rhs.value) is bytes and rhs.value.startswith(b"NIBArchive") and not lhs.value.startswith(b"NIBArchive"):
+                yield self._difference(current_path, "nib", f"{path} (in {parent_class}): RHS is a NIB, but LHS isn't",
+                                       parent_class, rhs, None, None, lhs.type, rhs.type)
+            elif type(lhs.value) is bytes and lhs.value.startswith(b"NIBArchive"):
+                yield from self.compare_inlined(lhs.value, rhs.value, current_path + ["nib"])
+
+            elif type(lhs.value) in [int, str, float, bytes, type(None)]:
+                if lhs.value != rhs.value:
+                    if _is_scrollbar_width_diff(path, lhs.value, rhs.value):
+                        pass
+                    elif (path.endswith("Flags") or path.endswith("Flags2") or path.endswith("Mask")) and isinstance(lhs.value, int) and isinstance(rhs.value, int):
+                        lval = lhs.value if lhs.value >= 0 else lhs.value + 0x10000000000000000
+                        rval = rhs.value if rhs.value >= 0 else rhs.value + 0x10000000000000000
+                        yield self._difference(current_path, "value", f"{path} (in {parent_class}): difference {hex(lval)} != {hex(rval)}",
+                                               parent_class, rhs, hex(lval), hex(rval), lhs.type, rhs.type)
+                    else:
+                        yield self._difference(current_path, "value", f"{path} (in {parent_class}): difference {lhs.value} != {rhs.value}",
+                                               parent_class, rhs, lhs.value, rhs.value, lhs.type, rhs.type)
+                return
+            return
+
+        assert isinstance(lhs, NibObject) or isinstance(lhs, NibCollection), type(lhs)
+        assert isinstance(rhs, NibObject) or isinstance(rhs, NibCollection), type(rhs)
+
+        annotation = _xib_annotation(rhs, self.xibid_map)
+
+        connector_classes = ("NSNibConnector", "NSNibOutletConnector", "NSNibControlConnector", "NSNibAuxiliaryActionConnector", "NSIBHelpConnector", "NSNibBindingConnector", "NSIBUserDefinedRuntimeAttributesConnector")
+        if lhs.classname != rhs.classname:
+            yield self._difference(current_path, "class", f"{path}{annotation} (in {parent_class}): Class name doesn't match {lhs.classname} != {rhs.classname}",
+                                   parent_class, rhs, lhs.classname, rhs.classname)
+            return
+        if type(lhs.entries) != type(rhs.entries):
+            yield self._difference(current_path, "type", f"{path}{annotation} (in {parent_class}): Values types don't match",
+                                   parent_class, rhs, type(lhs.entries).__name__, type(rhs.entries).__name__)
+            return
+
+        l_ind = lhs_path.index(id(lhs))
+        r_ind = rhs_path.index(id(rhs))
+
+        if l_ind != r_ind:
+            yield self._difference(current_path, "cycle", f"{path}: Cycle to different places", parent_class, rhs, l_ind, r_ind)
+            return
+        if l_ind < len(lhs_path)-1:
+            # don't get stuck in a loop
             return
-        return
-
-    assert isinstance(lhs, NibObject) or isinstance(lhs, NibCollection), type(lhs)
-    assert isinstance(rhs, NibObject) or isinstance(rhs, NibCollection), type(rhs)
-
-    annotation = _xib_annotation(rhs, xibid_map)
-
-    connector_classes = ("NSNibConnector", "NSNibOutletConnector", "NSNibControlConnector", "NSNibAuxiliaryActionConnector", "NSIBHelpConnector", "NSNibBindingConnector", "NSIBUserDefinedRuntimeAttributesConnector")
-    if lhs.classname != rhs.classname:
-        yield f"{path}{annotation} (in {parent_class}): Class name doesn't match {lhs.classname} != {rhs.classname}"
-        return
-    if type(lhs.entries) != type(rhs.entries):
-        yield f"{path}{annotation} (in {parent_class}): Values types don't match"
-        return
-
-    l_ind = lhs_path.index(id(lhs))
-    r_ind = rhs_path.index(id(rhs))
-
-    if l_ind != r_ind:
-        yield f"{path}: Cycle to different places"
-        return
-    if l_ind < len(lhs_path)-1:
-        # don't get stuck in a loop
-        return
-
-    if path.endswith("NSViewConstraints"):
-        # They're hopefully unordered. TODO match the apple's order later
-        if len(lhs.entries) != len(rhs.entries):
-            yield f"{path}{annotation} Mismatched length: {len(lhs.entries)} != {len(rhs.entries)}"
-        fixup_layout_constrints(lhs.entries, lhs_root)
-        fixup_layout_constrints(rhs.entries, rhs_root)
-        for i, (left, right) in enumerate(zip(lhs.entries, rhs.entries)):
-            yield from diff(left, right, lhs_root, rhs_root, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, xibid_map=xibid_map)
-    elif path.endswith("NSConnections"):
-        fixup_connections(lhs.entries)
-        fixup_connections(rhs.entries)
-        if len(lhs.entries) != len(rhs.entries):
-            yield f"{path}{annotation} Mismatched connection count: {len(lhs.entries)} != {len(rhs.entries)}"
-        for i, (left, right) in enumerate(zip(lhs.entries, rhs.entries)):
-            yield from diff(left, right, lhs_root, rhs_root, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, xibid_map=xibid_map)
-    elif path.endswith("NSAccessibilityConnectors"):
-        def ax_sort_key(x):
-            dest = x.entries.get("AXDestinationArchiveKey")
-            val = x.entries.get("AXAttributeValueArchiveKey")
-            dest_cls = dest.classname if dest else ""
-            dest_name = ""
-            if dest and hasattr(dest, 'entries'):
-                n = dest.entries.get("NSClassName")
-                if n and hasattr(n, 'entries'):
-                    b = n.entries.get("NS.bytes")
+
+        if path.endswith("NSViewConstraints"):
+            # They're hopefully unordered. TODO match the apple's order later
+            if len(lhs.entries) != len(rhs.entries):
+                yield self._difference(current_path, "length", f"{path}{annotation} Mismatched length: {len(lhs.entries)} != {len(rhs.entries)}",
+                                       parent_class, rhs, len(lhs.entries), len(rhs.entries))
+            fixup_layout_constrints(lhs.entries)
+            fixup_layout_constrints(rhs.entries)
+            for i, (left, right) in enumerate(zip(lhs.entries, rhs.entries)):
+                yield from self.diff(left, right, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, digests=digests)
+        elif path.endswith("NSConnections"):
+            fixup_connections(lhs.entries)
+            fixup_connections(rhs.entries)
+            if len(lhs.entries) != len(rhs.entries):
+                yield self._difference(current_path, "length", f"{path}{annotation} Mismatched connection count: {len(lhs.entries)} != {len(rhs.entries)}",
+                                       parent_class, rhs, len(lhs.entries), len(rhs.entries))
+            for i, (left, right) in enumerate(zip(lhs.entries, rhs.entries)):
+                yield from self.diff(left, right, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, digests=digests)
+        elif path.endswith("NSAccessibilityConnectors"):
+            def ax_sort_key(x):
+                dest = x.entries.get("AXDestinationArchiveKey")
+                val = x.entries.get("AXAttributeValueArchiveKey")
+                dest_cls = dest.classname if dest else ""
+                dest_name = ""
+                if dest and hasattr(dest, 'entries'):
+                    n = dest.entries.get("NSClassName")
+                    if n and hasattr(n, 'entries'):
+                        b = n.entries.get("NS.bytes")
+                        if b and hasattr(b, 'value'):
+                            dest_name = str(b.value)
+                val_str = ""
+                if val and hasattr(val, 'entries'):
+                    b = val.entries.get("NS.bytes")
                     if b and hasattr(b, 'value'):
-                        dest_name = str(b.value)
-            val_str = ""
-            if val and hasattr(val, 'entries'):
-                b = val.entries.get("NS.bytes")
-                if b and hasattr(b, 'value'):
-                    val_str = str(b.value)
-            return (val_str, dest_cls, dest_name)
-        lhs_entries = sorted(lhs.entries, key=ax_sort_key)
-        rhs_entries = sorted(rhs.entries, key=ax_sort_key)
-        for i, (left, right) in enumerate(zip(lhs_entries, rhs_entries)):
-            yield from diff(left, right, lhs_root, rhs_root, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, xibid_map=xibid_map)
-    elif isinstance(lhs, NibCollection) and isinstance(rhs, NibCollection):
-        l_entries = lhs.entries
-        r_entries = rhs.entries
-        if path.endswith("NSSubviews"):
-            l_entries = [e for e in l_entries if not (isinstance(e, NibObject) and e.classname == "_NSCornerView")]
-            r_entries = [e for e in r_entries if not (isinstance(e, NibObject) and e.classname == "_NSCornerView")]
-        if path.endswith("NSStackViewContainerNonDroppedViews"):
-            l_entries = sorted(l_entries, key=_sv_child_sort_key)
-            r_entries = sorted(r_entries, key=_sv_child_sort_key)
-        if len(l_entries) != len(r_entries):
-            yield f"{path}{annotation} Mismatched length: {len(l_entries)} != {len(r_entries)}"
-        for i, (left, right) in enumerate(zip(l_entries, r_entries)):
-            yield from diff(left, right, lhs_root, rhs_root, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, xibid_map=xibid_map)
-    elif isinstance(lhs, NibObject) and isinstance(rhs, NibObject):
-        all_keys = set(list(lhs.entries.keys()) + list(rhs.entries.keys()))
-        if lhs.classname == "_NSCornerView":
-            all_keys -= {"NSNextResponder", "NSSuperview", "NSvFlags", "NSFrame", "NSFrameSize"}
-        if lhs.classname == "NSScroller":
-            all_keys -= {"NSViewIsLayerTreeHost"}
-        orig_cls = lhs.classname
-        if lhs.classname.startswith("NSClassSwapper/"):
-            ocn = lhs.entries.get("NSOriginalClassName")
-            if ocn and hasattr(ocn, "entries"):
-                b = ocn.entries.get("NS.bytes")
-                if b and hasattr(b, "value"):
-                    orig_cls = b.value if isinstance(b.value, str) else b.value.decode()
-        if orig_cls == "NSScrollView":
-            all_keys -= {"NSCornerView"}
-        for key in sorted(all_keys):
-            if key not in lhs.entries:
-                rval = rhs.entries.get(key)
-                if (key.endswith("Flags") or key.endswith("Flags2") or key.endswith("Mask")) and isinstance(rval.value, int):
-                    rval = rval.value
-                    rval = hex(rval if rval >= 0 else rval + 0x10000000000000000)
-
-                yield f"{path}{annotation} LHS ({lhs.classname}) missing key {key}, RHS {rval}"
-                continue
-            if key not in rhs.entries:
-                lval = lhs.entries.get(key)
-                if (key.endswith("Flags") or key.endswith("Flags2") or key.endswith("Mask")) and isinstance(lval.value, int):
-                    lval = lval.value
-                    lval = hex(lval if lval >= 0 else lval + 0x10000000000000000)
+                        val_str = str(b.value)
+                return (val_str, dest_cls, dest_name)
+            lhs_entries = sorted(lhs.entries, key=ax_sort_key)
+            rhs_entries = sorted(rhs.entries, key=ax_sort_key)
+            for i, (left, right) in enumerate(zip(lhs_entries, rhs_entries)):
+                yield from self.diff(left, right, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, digests=digests)
+        elif isinstance(lhs, NibCollection) and isinstance(rhs, NibCollection):
+            l_entries = lhs.entries
+            r_entries = rhs.entries
+            if path.endswith("NSSubviews"):
+                l_entries = [e for e in l_entries if not (isinstance(e, NibObject) and e.classname == "_NSCornerView")]
+                r_entries = [e for e in r_entries if not (isinstance(e, NibObject) and e.classname == "_NSCornerView")]
+            if path.endswith("NSStackViewContainerNonDroppedViews"):
+                l_entries = sorted(l_entries, key=_sv_child_sort_key)
+                r_entries = sorted(r_entries, key=_sv_child_sort_key)
+            if len(l_entries) != len(r_entries):
+                yield self._difference(current_path, "length", f"{path}{annotation} Mismatched length: {len(l_entries)} != {len(r_entries)}",
+                                       parent_class, rhs, len(l_entries), len(r_entries))
+            for i, (left, right) in enumerate(zip(l_entries, r_entries)):
+                yield from self.diff(left, right, current_path + [str(i)], lhs_path, rhs_path, lhs.classname, digests=digests)
+        elif isinstance(lhs, NibObject) and isinstance(rhs, NibObject):
+            all_keys = set(list(lhs.entries.keys()) + list(rhs.entries.keys()))
+            if lhs.classname == "_NSCornerView":
+                all_keys -= {"NSNextResponder", "NSSuperview", "NSvFlags", "NSFrame", "NSFrameSize"}
+            if lhs.classname == "NSScroller":
+                all_keys -= {"NSViewIsLayerTreeHost"}
+            orig_cls = lhs.classname
+            if lhs.classname.startswith("NSClassSwapper/"):
+                ocn = lhs.entries.get("NSOriginalClassName")
+                if ocn and hasattr(ocn, "entries"):
+                    b = ocn.entries.get("NS.bytes")
+                    if b and hasattr(b, "value"):
+                        orig_cls = b.value if isinstance(b.value, str) else b.value.decode()
+            if orig_cls == "NSScrollView":
+                all_keys -= {"NSCornerView"}
+            for key in sorted(all_keys):
+                if key not in lhs.entries:
+                    rval = rhs.entries.get(key)
+                    if (key.endswith("Flags") or key.endswith("Flags2") or key.endswith("Mask")) and isinstance(rval.value, int):
+                        rval = rval.value
+                        rval = hex(rval if rval >= 0 else rval + 0x10000000000000000)
+
+                    yield self._difference(current_path + [key], "missing", f"{path}{annotation} LHS ({lhs.classname}) missing key {key}, RHS {rval}",
+                                           lhs.classname, rhs, None, rval, None, getattr(rhs.entries[key], "type", None))
+                    continue
+                if key not in rhs.entries:
+                    lval = lhs.entries.get(key)
+                    if (key.endswith("Flags") or key.endswith("Flags2") or key.endswith("Mask")) and isinstance(lval.value, int):
+                        lval = lval.value
+                        lval = hex(lval if lval >= 0 else lval + 0x10000000000000000)
+
+                    yield self._difference(current_path + [key], "missing", f"{path}{annotation} RHS ({rhs.classname}) missing key {key}, LHS {lval}",
+                                           rhs.classname, rhs, lval, None, getattr(lhs.entries[key], "type", None), None)
+                    continue
+                yield from self.diff(lhs.entries[key], rhs.entries[key], current_path + [key], lhs_path, rhs_path, lhs.classname, digests=digests)
+        else:
+            raise Exception(f"Unknown type {type(lhs)}")
 
-                yield f"{path}{annotation} RHS ({rhs.classname}) missing key {key}, LHS {lval}"
-                continue
-            yield from diff(lhs.entries[key], rhs.entries[key], lhs_root, rhs_root, current_path + [key], lhs_path, rhs_path, lhs.classname, xibid_map=xibid_map)
-    else:
-        raise Exception(f"Unknown type {type(lhs)}")
+def _normalize_nib(root: NibObject) -> None:
+    objectdata = root.entries["IB.objectdata"].entries
+    fixup_layout_constrints(objectdata["NSObjectsKeys"].entries)
+    oids = objectdata.get("NSOidsKeys")
+    if oids is not None:
+        fixup_layout_constrints(oids.entries)
+        fixup_connections(oids.entries)
 
-def fixup_layout_constrints(collection, all_objects):
+def fixup_layout_constrints(collection):
     # We need to order the layout constraints explicitly for comparison. Apple's tool uses random order.
-    def constraint_sort_key(obj):
-        def _item_key(item):
-            if item is None:
-                return ("", b"", -1, "")
+    # Many constraints share their items, so each item's key is only built once.
+    item_keys: dict[int, tuple] = {}
+
+    def _item_key(item):
+        if item is None:
+            return ("", b"", -1, "")
+        key = item_keys.get(id(item))
+        if key is None:
             frame = item.entries.get("NSFrame")
             frame_bytes = frame.entries.get("NS.bytes").value if frame is not None and hasattr(frame, "entries") and frame.entries.get("NS.bytes") is not None else b""
             tag = item.entries.get("NSTag")
             tag_val = tag.value if tag is not None and hasattr(tag, "value") else -1
             content = _sv_child_sort_key(item)[1] if hasattr(item, 'entries') else ""
-            return (item.classname, content, tag_val, frame_bytes)
+            key = item_keys[id(item)] = (item.classname, content, tag_val, frame_bytes)
+        return key
+
+    def constraint_sort_key(obj):
         first = obj.entries.get("NSFirstAttribute").value if obj.entries.get("NSFirstAttribute") is not None else -1
         firstv2 = obj.entries.get("NSFirstAttributeV2").value if obj.entries.get("NSFirstAttributeV2") is not None else -1
         second = obj.entries.get("NSSecondAttribute").value if obj.entries.get("NSSecondAttribute") is not None else -1
@@ -409,10 +610,7 @@ def fixup_layout_constrints(collection, all_objects):
         relation = obj.entries.get("NSRelation").value if obj.entries.get("NSRelation") is not None else -1
         return (first, firstv2, second, secondv2, priority, constantval, constantvalv2, constant, constantv2, symbolic, relation, firstitem_key, seconditem_key)
 
-    all_objects_copy = all_objects.copy()
-    constraint_indices = [i for i, obj in enumerate(collection)
-                          if any(obj is k and k.classname == "NSLayoutConstraint" for k in all_objects_copy)
-                          or (obj.classname == "NSLayoutConstraint" if hasattr(obj, "classname") else False)]
+    constraint_indices = [i for i, obj in enumerate(collection) if getattr(obj, "classname", None) == "NSLayoutConstraint"]
     constraints = [collection[i] for i in constraint_indices]
     constraints.sort(key=constraint_sort_key)
     for idx, sorted_obj in zip(constraint_indices, constraints):
@@ -424,6 +622,8 @@ def fixup_connections(collection):
         "NSIBUserDefinedRuntimeAttributesConnector"}
     connectors = [x for x in collection if x.classname in connector_classes]
     non_connectors = [x for x in collection if x.classname not in connector_classes]
+    # Sources and destinations are shared by many connections; their text is looked up once.
+    content_keys: dict[int, bytes] = {}
     def conn_sort_key(c):
         cls = c.classname
         dest = c.entries.get("NSDestination")
@@ -477,7 +677,11 @@ def fixup_connections(collection):
             """Extract stable content (text, image) from an object for sorting."""
             if obj is None:
                 return b""
-            return _sv_child_sort_key(obj)[1].encode() if isinstance(_sv_child_sort_key(obj)[1], str) else b""
+            key = content_keys.get(id(obj))
+            if key is None:
+                text = _sv_child_sort_key(obj)[1]
+                key = content_keys[id(obj)] = text.encode() if isinstance(text, str) else b""
+            return key
         rt_obj = c.entries.get("NSObject")
         rt_cls = rt_obj.classname if rt_obj is not None else ""
         rt_subviews = _subview_count(rt_obj) if rt_obj is not None else -1
@@ -489,9 +693,11 @@ def _is_uuid_diff(issue_str):
     return bool(re.search(r"(uniqueIdentifierForStoryboardCompilation|NSStoryboardSegueDestinationOptions).*difference b'[0-9A-F-]+'", issue_str))
 
 
-def _compare_nib(orig_path, test_path, xib_path=None, skip_uuids=False):
-    global already_seen
-    already_seen = set()
+def _nib_items(orig_path, test_path, xib_path=None, skip_uuids=False, quick=False) -> Iterator[Union[str,Difference]]:
+    """Compares two nib files, yielding notes (str) and Differences as they are found.
+
+    With quick, stops at the first difference.
+    """
     orig_nib = getNibSectionsFile(orig_path)
     test_nib = getNibSectionsFile(test_path)
 
@@ -499,60 +705,146 @@ def _compare_nib(orig_path, test_path, xib_path=None, skip_uuids=False):
     test_root, test_rest = pythonObjects(test_nib)
 
     if orig_rest:
-        print("original has unreferenced items")
+        yield "original has unreferenced items"
     if test_rest:
-        print("test has unreferenced items")
+        yield "test has unreferenced items"
 
     xibid_map = None
     if xib_path:
         from .xibmap import build_nibidx_to_xibid
         xibid_map = build_nibidx_to_xibid(xib_path)
 
-    found_issues = False
-    orig_objects = orig_root.entries["IB.objectdata"].entries["NSObjectsKeys"].entries
-    test_objects = test_root.entries["IB.objectdata"].entries["NSObjectsKeys"].entries
-    fixup_layout_constrints(orig_root.entries["IB.objectdata"].entries["NSObjectsKeys"].entries, orig_objects)
-    fixup_layout_constrints(test_root.entries["IB.objectdata"].entries["NSObjectsKeys"].entries, test_objects)
-    fixup_layout_constrints(orig_root.entries["IB.objectdata"].entries["NSOidsKeys"].entries, orig_objects)
-    fixup_layout_constrints(test_root.entries["IB.objectdata"].entries["NSOidsKeys"].entries, test_objects)
-    fixup_connections(orig_root.entries["IB.objectdata"].entries["NSOidsKeys"].entries)
-    fixup_connections(test_root.entries["IB.objectdata"].entries["NSOidsKeys"].entries)
-    for issue in diff(orig_root, test_root, lhs_root=orig_objects, rhs_root=test_objects, xibid_map=xibid_map):
-        if skip_uuids and _is_uuid_diff(issue):
+    for issue in Comparator(xibid_map).compare(orig_root, test_root):
+        if skip_uuids and _is_uuid_diff(str(issue)):
             continue
-        found_issues = True
-        print(issue)
-    return found_issues
+        yield issue
+        if quick:
+            break
 
 
-def main(orig_path, test_path, xib_path=None):
-    if os.path.isdir(orig_path) and os.path.isdir(test_path):
-        _compare_storyboard_dirs(orig_path, test_path)
-    else:
-        if _compare_nib(orig_path, test_path, xib_path):
-            sys.exit(1)
+def _nib_report(orig_path, test_path, xib_path=None, skip_uuids=False, quick=False) -> tuple[list[Union[str,Difference]], bool]:
+    """All of _nib_items for two nib files, and whether they differ."""
+    items = list(_nib_items(orig_path, test_path, xib_path, skip_uuids, quick))
+    return items, any(isinstance(item, Difference) for item in items)
+
+
+class _Report:
+    """Prints --compare results, either as text lines or as one JSON record per line (ndjson)."""
 
+    def __init__(self, fmt: str = "text") -> None:
+        self.ndjson = fmt == "ndjson"
 
-def _compare_storyboard_dirs(orig_dir, test_dir):
+    def item(self, item: Union[str,Difference], nib: Optional[str] = None) -> bool:
+        """Prints a note or a Difference and returns whether it was a Difference."""
+        is_difference = isinstance(item, Difference)
+        if not self.ndjson:
+            print(item)
+        else:
+            record = item.record() if is_difference else {"kind": "note", "message": item}
+            self._emit(record, nib)
+        return is_difference
+
+    def comparing(self, nib: str) -> None:
+        if not self.ndjson:
+            print(f"Comparing {nib}...")
+
+    def missing_nib(self, nib: str, side: str) -> None:
+        message = f"{'Missing' if side == 'missing' else 'Extra'} in test: {nib}"
+        if not self.ndjson:
+            print(message)
+        else:
+            self._emit({"kind": f"{side}_nib", "message": message}, nib)
+
+    def _emit(self, record: dict[str, Any], nib: Optional[str]) -> None:
+        if nib is not None:
+            record = {"nib": nib, **record}
+        print(json.dumps(record), flush=True)
+
+
+def _compare_nib(orig_path, test_path, xib_path=None, skip_uuids=False, quick=False, fmt="text"):
+    report = _Report(fmt)
+    found_issues = False
+    for item in _nib_items(orig_path, test_path, xib_path, skip_uuids, quick):
+        found_issues |= report.item(item)
+    return found_issues
+
+
+def main(orig_path, test_path, xib_path=None, quick=False, jobs=1, fmt="text"):
+    try:
+        try:
+            if os.path.isdir(orig_path) and os.path.isdir(test_path):
+                _compare_storyboard_dirs(orig_path, test_path, quick=quick, jobs=jobs, fmt=fmt)
+            elif _compare_nib(orig_path, test_path, xib_path, quick=quick, fmt=fmt):
+                sys.exit(1)
+        finally:
+            sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`). Point stdout at devnull so the
+        # flush at interpreter exit doesn't fail again, and exit quietly.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def _compare_storyboard_dirs(orig_dir, test_dir, quick=False, jobs=1, fmt="text"):
+    """Compares the nibs of two compiled storyboards and exits with 1 if they differ.
+
+    With quick, stops at the first difference. With jobs > 1 the nibs are
+    compared in worker processes; the output is printed in file order, the
+    same as a serial run.
+    """
+    report = _Report(fmt)
     orig_nibs = {f for f in os.listdir(orig_dir) if f.endswith(".nib")}
     test_nibs = {f for f in os.listdir(test_dir) if f.endswith(".nib")}
 
     found_issues = False
     for nib in sorted(orig_nibs - test_nibs):
-        print(f"Missing in test: {nib}")
+        report.missing_nib(nib, "missing")
         found_issues = True
     for nib in sorted(test_nibs - orig_nibs):
-        print(f"Extra in test: {nib}")
+        report.missing_nib(nib, "extra")
         found_issues = True
-
-    for nib in sorted(orig_nibs & test_nibs):
-        orig_path = os.path.join(orig_dir, nib)
-        test_path = os.path.join(test_dir, nib)
-        print(f"Comparing {nib}...")
-        if _compare_nib(orig_path, test_path, skip_uuids=True):
-            found_issues = True
+    if quick and found_issues:
+        sys.exit(1)
+
+    nibs = sorted(orig_nibs & test_nibs)
+    tasks = [(os.path.join(orig_dir, nib), os.path.join(test_dir, nib), quick) for nib in nibs]
+    if jobs > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        workers = min(jobs, len(tasks))
+        pool = ProcessPoolExecutor(max_workers=workers)
+        try:
+            # Scene nibs are small; batching a few per task saves round trips.
+            reports = pool.map(_storyboard_nib_report, tasks, chunksize=max(1, len(tasks) // (8 * workers)))
+            found_issues |= _print_reports(report, nibs, (items for items, _ in reports), quick)
+        finally:
+            # Nibs after the first difference (or after the reader of our
+            # output went away) don't need comparing.
+            pool.shutdown(cancel_futures=True)
+    else:
+        reports = (_nib_items(orig, test, skip_uuids=True, quick=quick) for orig, test, quick in tasks)
+        found_issues |= _print_reports(report, nibs, reports, quick)
 
     sys.exit(int(found_issues))
 
+
+def _storyboard_nib_report(task):
+    orig_path, test_path, quick = task
+    return _nib_report(orig_path, test_path, skip_uuids=True, quick=quick)
+
+
+def _print_reports(report: _Report, nibs, reports, quick) -> bool:
+    found_issues = False
+    for nib, items in zip(nibs, reports):
+        report.comparing(nib)
+        differs = False
+        for item in items:
+            differs |= report.item(item, nib)
+        found_issues |= differs
+        if quick and differs:
+            break
+    return found_issues
+
 if __name__ == "__main__":
     main(sys.argv[1], sys.argv[2])
@@ -0,0 +1,248 @@
+"""On-disk cache of compiled XIB and storyboard outputs.
+
+Entries are keyed by the input bytes, the --module value, the Base.lproj
+localization flag and the tool version, and hold a copy of whatever the
+compile produced at the output path: a single .nib file or a directory
+(.storyboardc, or a nib bundle for deployment XIBs). Least recently used
+entries are evicted once the cache grows past its size limit.
+
+The total size of the entries is kept in a file in the cache directory and
+updated by every store, so the whole cache is only walked when it has to be
+trimmed (or when that file is missing).
+"""
+
+import contextlib
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+from typing import Callable, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: the size total is updated without a lock.
+    fcntl = None
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Bump when the layout of cache entries changes.
+_FORMAT = b"ibtool-compile-cache-1"
+
+# Running total of the entry sizes, in bytes.
+_SIZE_FILE = ".size"
+
+_tool_version: Optional[bytes] = None
+
+
+def tool_version() -> bytes:
+    """The package version plus a digest of its sources.
+
+    The source digest keeps a development checkout from serving outputs
+    produced by older code under the same version number.
+    """
+    global _tool_version
+    if _tool_version is None:
+        from importlib import metadata
+
+        try:
+            version = metadata.version("ibtool")
+        except metadata.PackageNotFoundError:
+            version = "unknown"
+        h = hashlib.sha256(version.encode())
+        pkg_dir = os.path.dirname(os.path.abspath(__file__))
+        for dirpath, dirnames, filenames in os.walk(pkg_dir):
+            dirnames.sort()
+            for name in sorted(filenames):
+                if name.endswith(".py"):
+                    path = os.path.join(dirpath, name)
+                    h.update(os.path.relpath(path, pkg_dir).encode())
+                    with open(path, "rb") as f:
+                        h.update(hashlib.sha256(f.read()).digest())
+        _tool_version = h.hexdigest().encode()
+    return _tool_version
+
+
+class CompileCache:
+    label = "compile cache"
+
+    def __init__(self, root: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, inpath: str, module: Optional[str], isBaseLocalization: bool) -> str:
+        h = hashlib.sha256(_FORMAT)
+        for part in (
+            tool_version(),
+            os.path.splitext(inpath)[1].encode(),
+            (module or "").encode(),
+            b"base" if isBaseLocalization else b"",
+        ):
+            h.update(len(part).to_bytes(4, "little"))
+            h.update(part)
+        with open(inpath, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def restore(self, key: str, outpath: str) -> bool:
+        """Copies a cached output to outpath. Returns False on a miss."""
+        entry = self._entry(key)
+        out = os.path.join(entry, "out")
+        if not os.path.lexists(out):
+            self.misses += 1
+            return False
+        _copy(out, outpath)
+        self.touch(key)
+        self.hits += 1
+        return True
+
+    def touch(self, key: str) -> None:
+        # The entry's mtime is its last use, for LRU eviction.
+        os.utime(self._entry(key))
+
+    def store(self, key: str, outpath: str) -> None:
+        if os.path.exists(outpath):
+            self._store_entry(key, lambda tmp: _copy(outpath, os.path.join(tmp, "out")))
+
+    def _store_entry(self, key: str, populate: Callable[[str], None]) -> None:
+        """Creates the entry for key by calling populate with an empty directory to fill."""
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        # Build the entry next to its final location and move it into place,
+        # so concurrent compiles never see a partial entry.
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.root)
+        try:
+            populate(tmp)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # Another process stored the same entry first.
+                return
+        finally:
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp, ignore_errors=True)
+        self.stores += 1
+        if self._add_size(_tree_size(entry)) > self.max_bytes:
+            self.evict()
+
+    def _entries(self) -> list[tuple[float, int, str]]:
+        entries = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix.startswith(".") or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                try:
+                    mtime = os.stat(entry).st_mtime
+                except FileNotFoundError:
+                    continue
+                entries.append((mtime, _tree_size(entry), entry))
+        return entries
+
+    @contextlib.contextmanager
+    def _size_file(self) -> Iterator[int]:
+        """Opens the size total file, locked against other processes."""
+        fd = os.open(os.path.join(self.root, _SIZE_FILE), os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield fd
+        finally:
+            os.close(fd)
+
+    def _add_size(self, delta: int) -> int:
+        """Adds delta to the size total and returns the new total."""
+        with self._size_file() as fd:
+            total = _read_total(fd)
+            if total is None:
+                # Walks the entry being added too.
+                total = sum(size for _, size, _ in self._entries())
+            else:
+                total += delta
+            _write_total(fd, total)
+        return total
+
+    def size(self) -> int:
+        with self._size_file() as fd:
+            total = _read_total(fd)
+            if total is None:
+                total = sum(size for _, size, _ in self._entries())
+                _write_total(fd, total)
+        return total
+
+    def evict(self) -> None:
+        """Removes least recently used entries until the cache fits max_bytes."""
+        with self._size_file() as fd:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                self.evictions += 1
+            _write_total(fd, total)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "evictions": self.evictions,
+            "bytes": self.size(),
+            "max_bytes": self.max_bytes,
+        }
+
+    def print_stats(self, file=sys.stderr) -> None:
+        stats = self.stats()
+        print(
+            f"{self.label}: {stats['hits']} hits, {stats['misses']} misses ({100 * stats['hit_rate']:.1f}% hit rate), "
+            f"{stats['stores']} stored, {stats['evictions']} evicted, "
+            f"{stats['bytes']} / {stats['max_bytes']} bytes in {self.root}",
+            file=file,
+        )
+
+
+def _copy(src: str, dst: str) -> None:
+    if os.path.isdir(src):
+        shutil.copytree(src, dst, dirs_exist_ok=True)
+    else:
+        shutil.copyfile(src, dst)
+
+
+def _read_total(fd: int) -> Optional[int]:
+    os.lseek(fd, 0, os.SEEK_SET)
+    try:
+        return int(os.read(fd, 32))
+    except ValueError:
+        return None
+
+
+def _write_total(fd: int, total: int) -> None:
+    os.lseek(fd, 0, os.SEEK_SET)
+    os.ftruncate(fd, 0)
+    os.write(fd, str(total).encode())
+
+
+def _tree_size(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            total += os.path.getsize(os.path.join(dirpath, name))
+    return total
@@ -1,9 +1,54 @@
+import os
 import struct
 from . import nibencoding
 from typing import Union
 from .models import PropValue, NibObject, NibDictionaryImpl, ArrayLike, NibInlineString, NibByte, NibFloat, NibNil, NibNSNumber, XibId
 
 
+class SymbolTable:
+    """Insertion-ordered name table backing the keys section of a nib.
+
+    Each distinct name gets the next free index on first use; lookups after
+    that are a single dict probe instead of a list scan.
+    """
+
+    def __init__(self) -> None:
+        self.entries: list = []
+        self._indices: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._indices
+
+    def index(self, name: str) -> int:
+        idx = self._indices.get(name)
+        if idx is None:
+            idx = len(self.entries)
+            self.entries.append(name)
+            self._indices[name] = idx
+        return idx
+
+
+class ClassTable(SymbolTable):
+    """Symbol table for the classes section.
+
+    NSNibAuxiliaryActionConnector is written as an auxiliary entry that points
+    at the NSNibConnector entry right after it. Every use emits a fresh pair,
+    so it is never looked up in the index.
+    """
+
+    def index(self, name: str) -> int:
+        if name != "NSNibAuxiliaryActionConnector":
+            return super().index(name)
+        idx = len(self.entries)
+        self.entries.append((name, idx + 1))
+        self.entries.append("NSNibConnector")
+        self._indices.setdefault("NSNibConnector", idx + 1)
+        return idx
+
+
 class CompilationContext:
     def __init__(self):
         self.class_set = set()
@@ -26,9 +71,21 @@ class CompilationContext:
             print("CompilationContext.addObject: Non-NibObject value:", obj)
             raise Exception("Not supported.")
 
+        # Walk the graph with an explicit stack so deep view hierarchies can't
+        # hit the recursion limit. Children are pushed in reverse, which numbers
+        # objects in the same depth-first pre-order as a recursive walk.
+        stack = [obj]
+        while stack:
+            children = self._visitObject(stack.pop())
+            for child in reversed(children):
+                if isinstance(child, NibObject):
+                    stack.append(child)
+
+    def _visitObject(self, obj: NibObject) -> list[PropValue]:
+        """Assign obj its index in the object list and return the values to visit next."""
         serial = obj.serial()
         if serial in self.serial_set:
-            return
+            return []
         self.serial_set.add(serial)
 
         if isinstance(obj, NibNSNumber):
@@ -40,7 +97,7 @@ class CompilationContext:
                     existing = self._number_by_value.get(dedup_key)
                     if existing is not None:
                         obj._nibidx = existing._nibidx
-                        return
+                        return []
                     self._number_by_value[dedup_key] = obj
 
         cls = obj.classname()
@@ -51,10 +108,10 @@ class CompilationContext:
         self.object_list.append(obj)
 
         if isinstance(obj, NibDictionaryImpl):
-            self.addObjects(obj._objects)
+            return obj._objects
 
         elif isinstance(obj, ArrayLike):
-            self.addObjects(obj._items)
+            return obj._items
 
         else:
             back_refs = []
@@ -64,8 +121,7 @@ class CompilationContext:
                     back_refs.append(v)
                 else:
                     forward_refs.append(v)
-            self.addObjects(forward_refs)
-            self.addObjects(back_refs)
+            return forward_refs + back_refs
 
     def makeTuples(self) -> tuple[
             list[tuple[int,int,int]],
@@ -74,27 +130,12 @@ class CompilationContext:
             list[str]
             ]:
         out_objects: list[tuple[int,int,int]] = []
-        out_keys: list[str] = []
         out_values: list[Union[tuple[int,int],tuple[int,int,Union[int,str,bytearray,float]],tuple[int,int,int,PropValue]]] = []
-        out_classes: list[str] = []
-
-        def idx_of_class(cls: str) -> int:
-            if cls in out_classes:
-                return out_classes.index(cls)
-            if cls == "NSNibAuxiliaryActionConnector":
-                current_class_len = len(out_classes)
-                out_classes.append((cls, current_class_len + 1))
-                out_classes.append("NSNibConnector")
-                return current_class_len
-            else:
-                out_classes.append(cls)
-                return len(out_classes) - 1
-
-        def idx_of_key(key: str) -> int:
-            if key in out_keys:
-                return out_keys.index(key)
-            out_keys.append(key)
-            return len(out_keys) - 1
+
+        key_table = SymbolTable()
+        class_table = ClassTable()
+        idx_of_key = key_table.index
+        idx_of_class = class_table.index
 
         xibid_index: dict[XibId, NibObject] = {}
         for o in self.object_list:
@@ -175,7 +216,7 @@ class CompilationContext:
                 (class_idx, obj_values_start, obj_values_end - obj_values_start)
             )
 
-        return (out_objects, out_keys, out_values, out_classes)
+        return (out_objects, key_table.entries, out_values, class_table.entries)
 
 
 """
@@ -186,6 +227,34 @@ This really has (at least) two phases.
 
 
 def CompileNibObjects(objects: list[NibObject]) -> bytes:
+    return nibencoding.WriteNib(_makeNibTuples(objects))
+
+
+# Like CompileNibObjects, but streams the archive into a writable file object
+# or a preallocated buffer. Returns the number of bytes written.
+def CompileNibObjectsTo(objects: list[NibObject], out) -> int:
+    return nibencoding.WriteNibTo(_makeNibTuples(objects), out)
+
+
+# Writes the archive to path. It is streamed into a temporary file next to
+# path and only renamed into place once complete, so a failed compile never
+# leaves a truncated .nib behind. Returns the number of bytes written.
+def CompileNibObjectsToPath(objects: list[NibObject], path: str) -> int:
+    writer = nibencoding.NibWriter(_makeNibTuples(objects))
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}-{os.urandom(4).hex()}.tmp")
+    try:
+        with open(tmp, "xb") as f:
+            written = writer.write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    return written
+
+
+def _makeNibTuples(objects: list[NibObject]):
     ctx = CompilationContext()
 
     # Collect OID NSNumber ids before compilation so cross-type dedup skips them
@@ -219,5 +288,4 @@ def CompileNibObjects(objects: list[NibObject]) -> bytes:
                     if existing is not None and existing is not item:
                         oids_values._items[i] = existing
 
-    t = ctx.makeTuples()
-    return nibencoding.WriteNib(t)
+    return ctx.makeTuples()
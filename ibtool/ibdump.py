@@ -1,7 +1,10 @@
 #!/usr/bin/python
 
+import mmap
 import struct
 import sys
+from array import array
+from collections.abc import Sequence
 from typing import cast, Optional, TypeAlias, Any
 
 NibStructure: TypeAlias = tuple[
@@ -12,6 +15,18 @@ NibStructure: TypeAlias = tuple[
     ]
 
 
+_UINT16 = struct.Struct("<H")
+_UINT32 = struct.Struct("<I")
+_INT64 = struct.Struct("<q")
+_FLOAT = struct.Struct("<f")
+_DOUBLE = struct.Struct("<d")
+
+# The reader works on anything that supports the buffer protocol. Fields are
+# unpacked in place; only keys, class names and (optionally) string values
+# are copied out of the input.
+NibBuffer: TypeAlias = bytes | bytearray | memoryview
+
+
 def rword(b: bytes) -> int:
     return cast(int, struct.unpack("<I", b)[0])
 
@@ -30,7 +45,7 @@ def rsingle(b: bytes) -> int:
 
 # Reads a flexible number from the bytes array and returns a tuple
 # containing the number read and the number of bytes read.
-def readFlexNumber(b: bytes, addr: int) -> tuple[int, int]:
+def readFlexNumber(b: NibBuffer, addr: int) -> tuple[int, int]:
     number = 0
     shift = 0
     ptr = addr
@@ -48,160 +63,178 @@ def readFlexNumber(b: bytes, addr: int) -> tuple[int, int]:
     return (number, ptr - addr)
 
 
-def readHeader(b: bytes, start: int) -> list[tuple[int, int]]:
-    hsize = rword(b[start : start + 4])
+def readHeader(b: NibBuffer, start: int) -> list[tuple[int, int]]:
+    hsize = _UINT32.unpack_from(b, start)[0]
     # print("Header size (words):", str(hsize))
     sections = []
     sectionDataStart = start + 4
     for section in range((hsize - 1) // 2):
-        objcount = rword(
-            b[sectionDataStart + section * 8 : sectionDataStart + section * 8 + 4]
-        )
-        address = rword(
-            b[sectionDataStart + section * 8 + 4 : sectionDataStart + section * 8 + 8]
-        )
+        objcount, address = struct.unpack_from("<II", b, sectionDataStart + section * 8)
         sections += [(objcount, address)]
     return sections
 
 
-def readKeys(b: bytes, keysSection: tuple[int, int]) -> list[str]:
+def readKeys(b: NibBuffer, keysSection: tuple[int, int]) -> list[str]:
     count, ptr = keysSection
-    keys = []
-    for i in range(count):
-        rd = readFlexNumber(b, ptr)
-        length = rd[0]
-        ptr += rd[1]
+    with memoryview(b) as mv:
+        keys = []
+        for i in range(count):
+            length = mv[ptr]
+            if length & 0x80:
+                length &= 0x7F
+                ptr += 1
+            else:
+                length, n = readFlexNumber(mv, ptr)
+                ptr += n
 
-        keys.append(b[ptr : ptr + length].decode('utf-8'))
-        ptr += length
-    return keys
+            keys.append(str(mv[ptr : ptr + length], 'utf-8'))
+            ptr += length
+        return keys
 
 
-def readObjects(b: bytes, objectsSection: tuple[int, int]) -> list[tuple[int, int, int]]:
+def readObjects(b: NibBuffer, objectsSection: tuple[int, int]) -> list[tuple[int, int, int]]:
     count, ptr = objectsSection
-    objects = []
-    for i in range(count):
-        r0 = readFlexNumber(b, ptr)
-        r1 = readFlexNumber(b, ptr + r0[1])
-        r2 = readFlexNumber(b, ptr + r0[1] + r1[1])
-
-        class_idx = r0[0]
-        start_idx = r1[0]
-        size = r2[0]
-
-        ptr += r0[1] + r1[1] + r2[1]
+    with memoryview(b) as mv:
+        objects = []
+        for i in range(count):
+            fields = []
+            for _ in range(3):
+                num = mv[ptr]
+                if num & 0x80:
+                    fields.append(num & 0x7F)
+                    ptr += 1
+                else:
+                    num, n = readFlexNumber(mv, ptr)
+                    fields.append(num)
+                    ptr += n
 
-        objects.append((class_idx, start_idx, size))
-    return objects
+            class_idx, start_idx, size = fields
+            objects.append((class_idx, start_idx, size))
+        return objects
 
 
-def readClasses(b: bytes, classSection: tuple[int, int]) -> list[str]:
+def readClasses(b: NibBuffer, classSection: tuple[int, int]) -> list[str]:
     count, addr = classSection
-    classes = []
-    ptr = addr
-    for i in range(count):
-        r = readFlexNumber(b, ptr)
-        length = r[0]
-        ptr += r[1]
+    with memoryview(b) as mv:
+        classes = []
+        ptr = addr
+        for i in range(count):
+            r = readFlexNumber(mv, ptr)
+            length = r[0]
+            ptr += r[1]
 
-        tp = b[ptr]
-        ptr += 1
+            tp = mv[ptr]
+            ptr += 1
 
-        unknown = None
-        assert tp in [0x80, 0x81]
-        if tp == 0x81:
-            unknown = rword(b[ptr : ptr + 4])
-            ptr += 4
-            # This is an "auxiliary" class somehow connected to another (usually the next) entry.
-            # In practice that seems to occur for NSNibAuxiliaryActionConnector which is followed by NSNibConnector.
-            # The value is the index of the connected class and normally it's the next class in the list.
-            #print("readClasses: Mystery value:", unknown, "(", end=" ")
+            unknown = None
+            assert tp in [0x80, 0x81]
+            if tp == 0x81:
+                unknown = _UINT32.unpack_from(mv, ptr)[0]
+                ptr += 4
+                # This is an "auxiliary" class somehow connected to another (usually the next) entry.
+                # In practice that seems to occur for NSNibAuxiliaryActionConnector which is followed by NSNibConnector.
+                # The value is the index of the connected class and normally it's the next class in the list.
+                #print("readClasses: Mystery value:", unknown, "(", end=" ")
 
-        classes.append(b[ptr : ptr + length - 1].decode('utf-8'))
+            classes.append(str(mv[ptr : ptr + length - 1], 'utf-8'))
 
-        #if unknown:
-        #    print(classes[-1], ")")
+            #if unknown:
+            #    print(classes[-1], ")")
 
-        ptr += length
+            ptr += length
 
-    return classes
+        return classes
 
 
-def readValues(b: bytes, valuesSection: tuple[int,int], debugKeys: Optional[list[str]]=None) -> list[tuple[int,Any,int]]:
+# With materialize=False, string values are returned as memoryview slices of
+# the input instead of bytes copies. They stay valid as long as the input does.
+def readValues(b: NibBuffer, valuesSection: tuple[int,int], debugKeys: Optional[list[str]]=None, materialize: bool=True) -> list[tuple[int,Any,int]]:
     if debugKeys is None:
         debugKeys = []
 
     count, addr = valuesSection
-    values = []
-    ptr = addr
-    for i in range(count):
-        r = readFlexNumber(b, ptr)
-        key_idx = r[0]
-        ptr += r[1]
-
-        encoding = b[ptr]
-        ptr += 1
+    with memoryview(b) as mv:
+        values = []
+        append = values.append
+        ptr = addr
+        for i in range(count):
+            key_idx = mv[ptr]
+            if key_idx & 0x80:
+                key_idx &= 0x7F
+                ptr += 1
+            else:
+                key_idx, n = readFlexNumber(mv, ptr)
+                ptr += n
 
-        value: Any = None
-        if encoding == 0x00:  # single byte
-            value = b[ptr]
+            encoding = mv[ptr]
             ptr += 1
-        elif encoding == 0x01:  # short
-            value = struct.unpack("<H", b[ptr : ptr + 2])[0]
-            ptr += 2
-        elif encoding == 0x02:  # 4 byte integer
-            value = struct.unpack("<I", b[ptr : ptr + 4])[0]
-            ptr += 4
-        elif encoding == 0x03:  # 8 byte integer
-            value = rquad(b[ptr : ptr + 8])
-            ptr += 8
-        elif encoding == 0x04:
-            value = False
-        elif encoding == 0x05:  # true
-            value = True
-        elif encoding == 0x06:  # word
-            # if len(debugKeys):
-            #     print("Found encoding with 0x6", debugKeys[key_idx])
-            value = rsingle(b[ptr : ptr + 4])
-            ptr += 4
-        elif encoding == 0x07:  # floating point
-            value = rdouble(b[ptr : ptr + 8])
-            ptr += 8
-        elif encoding == 0x08:  # string
-            r = readFlexNumber(b, ptr)
-            length = r[0]
-            ptr += r[1]
-            #if length and b[ptr] == 0x07:
-            #    if length == 17:
-            #        value = struct.unpack("<dd", b[ptr + 1 : ptr + 17])
-            #    elif length == 33:
-            #        value = struct.unpack("<dddd", b[ptr + 1 : ptr + 33])
-            #    else:
-            #        raise Exception("Well this is weird.")
-            #else:
-            value = b[ptr : ptr + length]
-            ptr += length
-        elif encoding == 0x09:  # nil?
-            value = None
-        elif encoding == 0x0A:  # object
-            # object is stored as a 4 byte index.
-            value = "@" + str(rword(b[ptr : ptr + 4]))
-            ptr += 4
-        else:
-            # print("dumping classes:", globals()["classes"])
-            print("dumping keys:")
-            for n, val in enumerate(debugKeys):
-                print(f"{n:X}\t{(n | 0x80):X}\t{val}")
-            raise Exception(
-                "Unknown value encoding (key %d idx %d addr %d): "
-                % (key_idx, i, ptr - 1)
-                + str(encoding)
-            )
-        values.append((key_idx, value, encoding))
-    return values
 
-
-def treePrintObjects(nib: NibStructure, prefix: str ="", showencoding: bool=False, sortKeys: bool=False, alreadyPrinted: set[int]=set(), obj_id: Optional[int]=None) -> None:
+            value: Any = None
+            if encoding == 0x0A:  # object
+                # object is stored as a 4 byte index.
+                value = "@" + str(_UINT32.unpack_from(mv, ptr)[0])
+                ptr += 4
+            elif encoding == 0x00:  # single byte
+                value = mv[ptr]
+                ptr += 1
+            elif encoding == 0x01:  # short
+                value = _UINT16.unpack_from(mv, ptr)[0]
+                ptr += 2
+            elif encoding == 0x02:  # 4 byte integer
+                value = _UINT32.unpack_from(mv, ptr)[0]
+                ptr += 4
+            elif encoding == 0x03:  # 8 byte integer
+                value = _INT64.unpack_from(mv, ptr)[0]
+                ptr += 8
+            elif encoding == 0x04:
+                value = False
+            elif encoding == 0x05:  # true
+                value = True
+            elif encoding == 0x06:  # word
+                # if len(debugKeys):
+                #     print("Found encoding with 0x6", debugKeys[key_idx])
+                value = _FLOAT.unpack_from(mv, ptr)[0]
+                ptr += 4
+            elif encoding == 0x07:  # floating point
+                value = _DOUBLE.unpack_from(mv, ptr)[0]
+                ptr += 8
+            elif encoding == 0x08:  # string
+                length = mv[ptr]
+                if length & 0x80:
+                    length &= 0x7F
+                    ptr += 1
+                else:
+                    length, n = readFlexNumber(mv, ptr)
+                    ptr += n
+                #if length and b[ptr] == 0x07:
+                #    if length == 17:
+                #        value = struct.unpack("<dd", b[ptr + 1 : ptr + 17])
+                #    elif length == 33:
+                #        value = struct.unpack("<dddd", b[ptr + 1 : ptr + 33])
+                #    else:
+                #        raise Exception("Well this is weird.")
+                #else:
+                value = mv[ptr : ptr + length]
+                if materialize:
+                    value = value.tobytes()
+                ptr += length
+            elif encoding == 0x09:  # nil?
+                value = None
+            else:
+                # print("dumping classes:", globals()["classes"])
+                print("dumping keys:")
+                for n, val in enumerate(debugKeys):
+                    print(f"{n:X}\t{(n | 0x80):X}\t{val}")
+                raise Exception(
+                    "Unknown value encoding (key %d idx %d addr %d): "
+                    % (key_idx, i, ptr - 1)
+                    + str(encoding)
+                )
+            append((key_idx, value, encoding))
+        return values
+
+
+def treePrintObjects(nib: "NibStructure | NibArchive", prefix: str ="", showencoding: bool=False, sortKeys: bool=False, alreadyPrinted: set[int]=set(), obj_id: Optional[int]=None) -> None:
     alreadyPrinted = alreadyPrinted.copy()
 
     objects, keys, values, classes = nib
@@ -257,7 +290,7 @@ def treePrintObjects(nib: NibStructure, prefix: str ="", showencoding: bool=Fals
                     print(prefix + "\t" + k_str + " =", v_str)
 
 
-def fancyPrintObjects(nib: NibStructure, prefix: str="", showencoding: bool=False, sortKeys: bool=False) -> None:
+def fancyPrintObjects(nib: "NibStructure | NibArchive", prefix: str="", showencoding: bool=False, sortKeys: bool=False) -> None:
     objects, keys, values, classes = nib
     for o_idx, obj in enumerate(objects):
         # print object
@@ -305,7 +338,7 @@ class RefPlaceholder(int):
     pass
 
 
-def readNibSectionsFromBytes(b: bytes) -> NibStructure:
+def readNibSectionsFromBytes(b: NibBuffer, materialize: bool=True) -> NibStructure:
     sections = readHeader(b, 14)
     # print sections
     classes = readClasses(b, sections[3])
@@ -314,7 +347,7 @@ def readNibSectionsFromBytes(b: bytes) -> NibStructure:
     # print objects
     keys = readKeys(b, sections[1])
     # print keys
-    values = readValues(b, sections[2], keys)
+    values = readValues(b, sections[2], keys, materialize)
     # print values
     return (objects, keys, values, classes)
 
@@ -339,7 +372,147 @@ def getNibSections(filebytes: bytes, filename: str) -> NibStructure:
     return readNibSectionsFromBytes(filebytes)
 
 
-def resolveStructurePath(nib: NibStructure, path: str) -> Optional[int]:
+# Payload sizes of the fixed-width value encodings, used to skip over values
+# without decoding them. Strings (0x08) are length-prefixed.
+_VALUE_SIZES = {0x00: 1, 0x01: 2, 0x02: 4, 0x03: 8, 0x04: 0, 0x05: 0, 0x06: 4, 0x07: 8, 0x09: 0, 0x0A: 4}
+
+
+class LazyValues(Sequence):
+    """The values list of a nib, decoded on first access.
+
+    Indexing and slicing return the same tuples as readValues. Value offsets
+    are indexed in a single forward scan that only goes as far as the
+    highest value requested so far, and decoded values are kept, so walking
+    the same objects again is cheap.
+    """
+
+    def __init__(self, b: NibBuffer, valuesSection: tuple[int, int], keys: list[str]) -> None:
+        self._buf = b
+        self._count, self._scan_ptr = valuesSection
+        self._offsets = array("I")
+        self._keys = keys
+        self._decoded: dict[int, tuple[int, Any, int]] = {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            if step != 1:
+                return [self[j] for j in range(start, stop, step)]
+            return self._decode(start, stop)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("value index out of range")
+        return self._decode(i, i + 1)[0]
+
+    def decodedCount(self) -> int:
+        return len(self._decoded)
+
+    def _decode(self, start: int, stop: int) -> list[tuple[int, Any, int]]:
+        decoded = self._decoded
+        if stop <= start:
+            return []
+        if start not in decoded or stop - 1 not in decoded:
+            section = (stop - start, self._offsetOf(start))
+            for i, value in enumerate(readValues(self._buf, section, self._keys), start):
+                decoded[i] = value
+        return [decoded[i] for i in range(start, stop)]
+
+    def _offsetOf(self, index: int) -> int:
+        offsets = self._offsets
+        if index < len(offsets):
+            return offsets[index]
+
+        with memoryview(self._buf) as mv:
+            sizes = _VALUE_SIZES
+            ptr = self._scan_ptr
+            for i in range(len(offsets), index + 1):
+                offsets.append(ptr)
+                if mv[ptr] & 0x80:
+                    ptr += 1
+                else:
+                    ptr += readFlexNumber(mv, ptr)[1]
+
+                encoding = mv[ptr]
+                ptr += 1
+                size = sizes.get(encoding)
+                if size is not None:
+                    ptr += size
+                elif encoding == 0x08:
+                    length, n = readFlexNumber(mv, ptr)
+                    ptr += n + length
+                else:
+                    raise Exception(
+                        "Unknown value encoding (idx %d addr %d): " % (i, ptr - 1) + str(encoding)
+                    )
+            self._scan_ptr = ptr
+            return offsets[index]
+
+
+class NibArchive:
+    """A memory-mapped nib file whose values are only decoded when used.
+
+    Objects, keys and classes are read up front (they are small); values are
+    located and decoded per object on demand. Unpacks like a
+    NibStructure, so it can be passed to resolveStructurePath and the
+    printing functions:
+
+        with NibArchive.open(path) as nib:
+            objects, keys, values, classes = nib
+    """
+
+    def __init__(self, b: NibBuffer, filename: str = "(buffer)") -> None:
+        assert b[0:10] == b"NIBArchive", f'"{filename}" is not a NIBArchive file.'
+        self._buf = b
+        sections = readHeader(b, 14)
+        self.objects = readObjects(b, sections[0])
+        self.keys = readKeys(b, sections[1])
+        self.values = LazyValues(b, sections[2], self.keys)
+        self.classes = readClasses(b, sections[3])
+
+    @classmethod
+    def open(cls, filename: str) -> "NibArchive":
+        with open(filename, "rb") as file:
+            try:
+                b: NibBuffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files can't be mapped.
+                b = file.read()
+        try:
+            return cls(b, filename)
+        except BaseException:
+            _close_map(b)
+            raise
+
+    def close(self) -> None:
+        _close_map(self._buf)
+
+    def __enter__(self) -> "NibArchive":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __iter__(self):
+        return iter((self.objects, self.keys, self.values, self.classes))
+
+
+def _close_map(b: NibBuffer) -> None:
+    if not isinstance(b, mmap.mmap):
+        return
+    try:
+        b.close()
+    except BufferError:
+        # A view into the map is still alive (say, a memoryview held by the
+        # traceback of a parse error). The map is unmapped once the last view
+        # goes; don't let this hide the error being raised.
+        pass
+
+
+def resolveStructurePath(nib: NibStructure | NibArchive, path: str) -> Optional[int]:
     """Resolve a dot-separated path to an object index in the nib structure.
 
     Path segments (separated by /) can be:
@@ -415,8 +588,11 @@ def resolveStructurePath(nib: NibStructure, path: str) -> Optional[int]:
 
 
 def ibdump(filename: str, showencoding: bool=False, showTree: bool=False, sortKeys: bool=False, structureFilter: Optional[str]=None) -> None:
-    nib = getNibSectionsFile(filename)
+    with NibArchive.open(filename) as nib:
+        _ibdump(nib, showencoding, showTree, sortKeys, structureFilter)
+
 
+def _ibdump(nib: NibArchive, showencoding: bool, showTree: bool, sortKeys: bool, structureFilter: Optional[str]) -> None:
     obj_id = None
     if structureFilter:
         obj_id = resolveStructurePath(nib, structureFilter)
@@ -6,15 +6,15 @@ import xml.etree.ElementTree as ET
 
 from . import archive
 from . import genlib
-from . import ibdump
 from . import xibparser
+from .models import CompilationSession
 
 
 def _is_base_localization(path):
     return "/Base.lproj/" in os.path.abspath(path)
 
 
-def ib_compile(inpath, outpath, module=None):
+def ib_compile(inpath, outpath, module=None, cache=None, jobs=1):
     suffix = None
     if inpath.endswith(".xib"):
         suffix = "xib"
@@ -24,10 +24,18 @@ def ib_compile(inpath, outpath, module=None):
     if suffix is None:
         sys.exit("ib_compile: Only .xib and .storyboard files are currently supported.")
 
+    if cache is not None:
+        key = cache.key(inpath, module, _is_base_localization(inpath))
+        if cache.restore(key, outpath):
+            return
+
     if suffix == "xib":
         ib_compile_xib(inpath, outpath, module=module)
     elif suffix == "storyboard":
-        ib_compile_storyboard(inpath, outpath, module=module)
+        ib_compile_storyboard(inpath, outpath, module=module, jobs=jobs)
+
+    if cache is not None:
+        cache.store(key, outpath)
 
 
 def ib_compile_xib(inpath, outpath, module=None):
@@ -36,25 +44,23 @@ def ib_compile_xib(inpath, outpath, module=None):
     if root.tag == "archive":
         ib_compile_archive(root, outpath)
         return
-    context, nibroot = xibparser.ParseXIBObjects(root, module=module, isBaseLocalization=_is_base_localization(inpath))
-    outbytes = genlib.CompileNibObjects([nibroot])
+    with CompilationSession.join() as session:
+        context, nibroot = xibparser.ParseXIBObjects(root, module=module, isBaseLocalization=_is_base_localization(inpath), session=session)
 
-    if context.deployment:
-        os.makedirs(os.path.dirname(outpath), exist_ok=True)
-        nibpath = os.path.join(outpath, "keyedobjects-101300.nib")
-    else:
-        nibpath = outpath
-    with open(nibpath, "wb") as fl:
-        fl.write(outbytes)
+        if context.deployment:
+            os.makedirs(os.path.dirname(outpath), exist_ok=True)
+            nibpath = os.path.join(outpath, "keyedobjects-101300.nib")
+        else:
+            nibpath = outpath
+        genlib.CompileNibObjectsToPath([nibroot], nibpath)
 
 
-def ib_compile_storyboard(inpath, outpath, module=None):
+def ib_compile_storyboard(inpath, outpath, module=None, jobs=1):
     tree = ET.parse(inpath)
-    xibparser.CompileStoryboard(tree, outpath, module=module, isBaseLocalization=_is_base_localization(inpath))
+    xibparser.CompileStoryboard(tree, outpath, module=module, isBaseLocalization=_is_base_localization(inpath), jobs=jobs)
 
 
 def ib_compile_archive(root, outpath):
-    nibroot = archive.parse_archive(root)
-    outbytes = genlib.CompileNibObjects([nibroot])
-    with open(outpath, "wb") as fl:
-        fl.write(outbytes)
+    with CompilationSession.join() as session:
+        nibroot = archive.parse_archive(root, session=session)
+        genlib.CompileNibObjectsToPath([nibroot], outpath)
@@ -1,5 +1,6 @@
 from typing import Optional, Union, Iterable, TypeAlias, Sequence, Any, cast
 from xml.etree.ElementTree import Element
+import hashlib
 import struct
 import random
 
@@ -7,6 +8,8 @@ PropValue: TypeAlias = Union["NibObject",int,str,bytes,"NibNil","NibByte",bool,f
 PropPair: TypeAlias = tuple[str,PropValue]
 
 class XibId:
+    __slots__ = ("_val",)
+
     def __init__(self, val: str) -> None:
         self._val = val
 
@@ -44,13 +47,75 @@ class XibId:
         return hash(self._val)
 
 
+class CompilationSession:
+    """Intern pools and serial numbers for a single compilation.
+
+    While a session is active, NibString/NibData interning and NibObject
+    serial allocation go through it instead of the class-level state, and the
+    pools are dropped when the outermost `with` block exits. Values interned
+    outside any session (the shared objects in constant_objects) stay in the
+    class-level caches and are still found from inside a session.
+    """
+
+    _active: list["CompilationSession"] = []
+
+    def __init__(self) -> None:
+        self.strings: dict[str, "NibString"] = {}
+        self.data: dict[bytes, "NibData"] = {}
+        self._next_serial = -1
+
+    @classmethod
+    def current(cls) -> Optional["CompilationSession"]:
+        return cls._active[-1] if cls._active else None
+
+    @classmethod
+    def join(cls, session: Optional["CompilationSession"] = None) -> "CompilationSession":
+        """The given session, else the active one, else a new one.
+
+        Entry points run in `with CompilationSession.join(session):`, so
+        parsing or compiling inside a session that is already active interns
+        into its pools, and a string seen by both gives one object.
+        """
+        return session or cls.current() or cls()
+
+    def next_serial(self) -> int:
+        serial = self._next_serial
+        self._next_serial += 1
+        return serial
+
+    def __enter__(self) -> "CompilationSession":
+        if self not in CompilationSession._active:
+            outer = CompilationSession.current()
+            self._next_serial = outer._next_serial if outer is not None else NibObject._total
+        CompilationSession._active.append(self)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        CompilationSession._active.pop()
+        if self in CompilationSession._active:
+            return
+        outer = CompilationSession.current()
+        if outer is not None:
+            outer._next_serial = max(outer._next_serial, self._next_serial)
+        else:
+            # Objects from this session may outlive it, so later serials must not reuse its range.
+            NibObject._total = max(NibObject._total, self._next_serial)
+        self.strings.clear()
+        self.data.clear()
+
+
 class NibObject:
+    __slots__ = ("_classname", "_serial", "properties", "_nibidx", "_repr", "_parent")
     _total = 1000
 
     def __init__(self, classnme: str ="NSObject", parent: Optional["NibObject"] = None, initProperties={}) -> None:
         self._classname = classnme
-        self._serial = NibObject._total
-        NibObject._total += 1
+        session = CompilationSession.current()
+        if session is not None:
+            self._serial = session.next_serial()
+        else:
+            self._serial = NibObject._total
+            NibObject._total += 1
         self.properties: dict[str,PropValue] = {}
         self._nibidx = -1
         self._repr: Optional[Element] = None
@@ -149,15 +214,21 @@ class NibObject:
 
 
 class NibString(NibObject):
-    cache: set["NibString"] = set()
+    __slots__ = ("_text",)
+    cache: dict[str, "NibString"] = {}
 
     @classmethod
     def intern(cls: type["NibString"], text: str) -> "NibString":
-        for x in cls.cache:
-            if x._text == text:
-                return x
+        existing = cls.cache.get(text)
+        if existing is not None:
+            return existing
+        session = CompilationSession.current()
+        pool = session.strings if session is not None else cls.cache
+        existing = pool.get(text)
+        if existing is not None:
+            return existing
         new_string = NibString(text)
-        cls.cache.add(new_string)
+        pool[text] = new_string
         return new_string
 
     def __init__(self, text: str = "Hello World") -> None:
@@ -172,6 +243,8 @@ class NibString(NibObject):
 
 
 class NibLocalizableString(NibObject):
+    __slots__ = ("_text",)
+
     def __init__(self, text: str, key: str = "", dev: str = "") -> None:
         NibObject.__init__(self, "NSLocalizableString")
         self._text = text
@@ -186,6 +259,8 @@ class NibLocalizableString(NibObject):
 
 
 class NibMutableString(NibObject):
+    __slots__ = ("_text",)
+
     def __init__(self, text: str = "Hello World") -> None:
         NibObject.__init__(self, "NSMutableString")
         self._text = text
@@ -198,15 +273,25 @@ class NibMutableString(NibObject):
 
 
 class NibData(NibObject):
-    cache: set["NibData"] = set()
+    __slots__ = ("_data",)
+
+    # Keyed by digest so large blobs (ICC profiles, TIFFs) are hashed once
+    # instead of being compared byte by byte against every cached entry.
+    cache: dict[bytes, "NibData"] = {}
 
     @classmethod
     def intern(cls: type["NibData"], data: bytes) -> "NibData":
-        for x in cls.cache:
-            if x._data == data:
-                return x
+        digest = hashlib.sha256(data).digest()
+        existing = cls.cache.get(digest)
+        if existing is not None:
+            return existing
+        session = CompilationSession.current()
+        pool = session.data if session is not None else cls.cache
+        existing = pool.get(digest)
+        if existing is not None:
+            return existing
         new_data = NibData(data)
-        cls.cache.add(new_data)
+        pool[digest] = new_data
         return new_data
 
     def __init__(self, data: bytes) -> None:
@@ -223,6 +308,8 @@ class NibData(NibObject):
 
 
 class NibInlineString:
+    __slots__ = ("_text",)
+
     def __init__(self, text: str|bytes ="") -> None:
         self._text = text
 
@@ -231,6 +318,8 @@ class NibInlineString:
 
 
 class NibByte:
+    __slots__ = ("_val",)
+
     def __init__(self, val: int = 0) -> None:
         self._val = val
 
@@ -239,6 +328,8 @@ class NibByte:
 
 
 class NibFloat:
+    __slots__ = ("_val",)
+
     def __init__(self, val: float = 0.0) -> None:
         self._val = val
 
@@ -247,6 +338,8 @@ class NibFloat:
 
 
 class NibNil:
+    __slots__ = ()
+
     def __init__(self) -> None:
         pass
 
@@ -256,6 +349,8 @@ def NibFloatToWord(num: int) -> bytes:
 
 
 class ArrayLike(NibObject):
+    __slots__ = ("_items",)
+
     def __init__(self, classname: str, items: Optional[Sequence[PropValue]]) -> None:
         if items is None:
             items = []
@@ -280,27 +375,39 @@ class ArrayLike(NibObject):
         ]
 
 class NibList(ArrayLike):
+    __slots__ = ()
+
     def __init__(self, items: Optional[Sequence[PropValue]] = None) -> None:
         super().__init__("NSArray", items)
 
 class NibMutableList(ArrayLike):
+    __slots__ = ()
+
     def __init__(self, items: Optional[Sequence[PropValue]]=None) -> None:
         super().__init__("NSMutableArray", items)
 
 class NibMutableSet(ArrayLike):
+    __slots__ = ()
+
     def __init__(self, items: Optional[Sequence[PropValue]]=None) -> None:
         super().__init__("NSMutableSet", items)
 
 class NibDictionary(ArrayLike):
+    __slots__ = ()
+
     def __init__(self, items: Optional[Sequence[PropValue]]=None) -> None:
         super().__init__("NSDictionary", items)
 
 class NibMutableDictionary(ArrayLike):
+    __slots__ = ()
+
     def __init__(self, items: Optional[Sequence[PropValue]]=None) -> None:
         super().__init__("NSMutableDictionary", items)
 
 
 class NibNSNumber(NibObject):
+    __slots__ = ("_value",)
+
     def __init__(self, value=0):
         NibObject.__init__(self, "NSNumber")
         self._value = value
@@ -345,6 +452,8 @@ def convertToNibObject(obj):
 
 
 class NibDictionaryImpl(NibObject):
+    __slots__ = ("_objects",)
+
     def __init__(self, objects):
         NibObject.__init__(self, "NSDictionary")
         if isinstance(objects, dict):
@@ -362,6 +471,8 @@ class NibDictionaryImpl(NibObject):
         return pairs
     
 class NibProxyObject(NibObject):
+    __slots__ = ()
+
     def __init__(self, identifier: str) -> None:
         NibObject.__init__(self, "UIProxyObject")
         self["UIProxiedObjectIdentifier"] = identifier
@@ -550,6 +661,8 @@ class ArchiveContext:
 
 
 class XibObject(NibObject):
+    __slots__ = ("xibid", "_original_class", "_extraContext")
+
     def __init__(self, ctx: ArchiveContext, classname: str, elem: Optional[Element], parent: Optional["NibObject"], ) -> None:
         NibObject.__init__(self, classname, parent)
 
@@ -557,7 +670,8 @@ class XibObject(NibObject):
             self.xibid = XibId(xibid)
         else:
             self.xibid = None
-        self.extraContext: dict[str,Any] = {"original_class": classname}
+        self._original_class = classname
+        self._extraContext: Optional[dict[str,Any]] = None
         if elem is not None and (key := elem.attrib.get("key")):
             self.extraContext["key"] = key
         if isinstance(self, XibObject) and elem is not None:
@@ -573,15 +687,23 @@ class XibObject(NibObject):
                 }))
 
 
+    @property
+    def extraContext(self) -> dict[str,Any]:
+        # Allocated on first use; many objects never need parser-side context.
+        if self._extraContext is None:
+            self._extraContext = {}
+        return self._extraContext
+
     def originalclassname(self) -> Optional[str]:
-        name = self.extraContext.get("original_class")
+        name = self._original_class
         if name is None:
             return self.classname()
         assert isinstance(name, str)
         return name
     
     def classname(self) -> str:
-        return self.extraContext.get("swapped_class") or super().classname()
+        extra = self._extraContext
+        return (extra and extra.get("swapped_class")) or super().classname()
     
     def xib_parent(self) -> Optional["XibObject"]:
         parent = self.parent()
@@ -1,4 +1,5 @@
 import struct
+from typing import Optional
 
 NIB_TYPE_BYTE = 0x00
 NIB_TYPE_SHORT = 0x01
@@ -16,150 +17,313 @@ NIB_TYPE_OBJECT = 0x0A
 # Input: Tuple of the four nib components. (Objects, Keys, Values, Classes)
 # Output: A byte array containing the binary representation of the nib archive.
 def WriteNib(nib) -> bytearray:
-    b = bytearray()
-    b.extend(b"NIBArchive")
-    b.extend([1, 0, 0, 0])
-    b.extend([10, 0, 0, 0])
-
-    objs = nib[0]
-    keys = nib[1]
-    vals = nib[2]
-    clss = nib[3]
-
-    objs_section = _nibWriteObjectsSection(objs)
-    keys_section = _nibWriteKeysSection(keys)
-    vals_section = _nibWriteValuesSection(vals)
-    clss_section = _nibWriteClassesSection(clss)
-
-    header_size = 50
-    objs_start = header_size
-    keys_start = objs_start + len(objs_section)
-    vals_start = keys_start + len(keys_section)
-    clss_start = vals_start + len(vals_section)
-
-    for num in [
-        len(objs),
-        objs_start,
-        len(keys),
-        keys_start,
-        len(vals),
-        vals_start,
-        len(clss),
-        clss_start,
-    ]:
-        b.extend(struct.pack("<I", num))
-
-    b.extend(objs_section)
-    b.extend(keys_section)
-    b.extend(vals_section)
-    b.extend(clss_section)
-
+    writer = NibWriter(nib)
+    b = bytearray(writer.size)
+    writer.write(b)
     return b
 
 
-def _nibWriteFlexNumber(btarray, number):
-    cur_byte = 0
+# Streams the archive into a writable file object, or into a preallocated
+# bytearray/memoryview that has room for it. Returns the number of bytes written.
+def WriteNibTo(nib, out) -> int:
+    return NibWriter(nib).write(out)
+
+
+HEADER_SIZE = 50
+
+# Payloads at least this large are handed to the output as-is instead of
+# being copied through the staging buffer first.
+_DIRECT_WRITE_SIZE = 16 * 1024
+_STAGING_FLUSH_SIZE = 64 * 1024
+
+
+class NibWriter:
+    """Lays out a nib archive up front and streams it out section by section.
+
+    All section sizes are computed (and values validated) before anything is
+    written, so the header can go first and the output never has to be
+    assembled in memory.
+    """
+
+    def __init__(self, nib) -> None:
+        self.objects, self.keys, self.values, self.classes = nib
+        # Encoded string values by position in the values list.
+        self._encoded: dict[int, bytes] = {}
+
+        self.objects_size = sum(
+            _flexNumberSize(o[0]) + _flexNumberSize(o[1]) + _flexNumberSize(o[2])
+            for o in self.objects
+        )
+        self.keys_size = sum(
+            _flexNumberSize(len(key)) + len(key.encode("utf-8")) for key in self.keys
+        )
+        self.values_size = self._valuesSize()
+        self.classes_size = sum(_classSize(cls) for cls in self.classes)
+
+        self.objects_start = HEADER_SIZE
+        self.keys_start = self.objects_start + self.objects_size
+        self.values_start = self.keys_start + self.keys_size
+        self.classes_start = self.values_start + self.values_size
+        self.size = self.classes_start + self.classes_size
+
+    def _valuesSize(self) -> int:
+        size = 0
+        headers = _valueHeaders(len(self.keys))
+        payload_sizes = _VALUE_PAYLOAD_SIZES
+        int_ranges = _INT_RANGES
+        for i, value in enumerate(self.values):
+            encoding_type = value[1]
+            payload = payload_sizes.get(encoding_type)
+            if payload is None:
+                raise Exception("Bad encoding type: " + str(encoding_type))
+            size += len(headers[value[0]][encoding_type]) + payload
+            if encoding_type == NIB_TYPE_STRING:
+                v = value[2]
+                if isinstance(v, str):
+                    v = v.encode("utf-8")
+                    self._encoded[i] = v
+                size += _flexNumberSize(len(v)) + len(v)
+                continue
+            limits = int_ranges.get(encoding_type)
+            if limits is not None:
+                v = value[2]
+                if not isinstance(v, int) or not limits[0] <= v <= limits[1]:
+                    if encoding_type == NIB_TYPE_OBJECT:
+                        raise Exception(f"Encoding object not in object list: {value[3]} failed at value: {v}")
+                    raise Exception(f"Encoding {_TYPE_NAMES[encoding_type]} failed at value: {v!r}")
+            elif encoding_type == NIB_TYPE_FLOAT or encoding_type == NIB_TYPE_DOUBLE:
+                # Whether a float fits is easiest to learn by packing it.
+                try:
+                    _VALUE_ENCODERS[encoding_type](value[2])
+                except (struct.error, OverflowError, TypeError):
+                    raise Exception(f"Encoding {_TYPE_NAMES[encoding_type]} failed at value: {value[2]!r}") from None
+        return size
+
+    def write(self, out) -> int:
+        sink = _Sink(out, self.size)
+        b = bytearray()
+        b.extend(b"NIBArchive")
+        b.extend([1, 0, 0, 0])
+        b.extend([10, 0, 0, 0])
+        b.extend(struct.pack(
+            "<8I",
+            len(self.objects), self.objects_start,
+            len(self.keys), self.keys_start,
+            len(self.values), self.values_start,
+            len(self.classes), self.classes_start,
+        ))
+
+        for obj in self.objects:
+            _nibWriteFlexNumber(b, obj[0])
+            _nibWriteFlexNumber(b, obj[1])
+            _nibWriteFlexNumber(b, obj[2])
+            if len(b) >= _STAGING_FLUSH_SIZE:
+                sink.flush(b)
+
+        for key in self.keys:
+            _nibWriteFlexNumber(b, len(key))
+            b.extend(key.encode("utf-8"))
+            if len(b) >= _STAGING_FLUSH_SIZE:
+                sink.flush(b)
+
+        self._writeValues(b, sink)
+
+        for cls in self.classes:
+            _nibWriteClass(b, cls)
+        sink.flush(b)
+        return sink.close()
+
+    def _writeValues(self, b: bytearray, sink: "_Sink") -> None:
+        encoded = self._encoded
+        flex = _FLEX_BYTES
+        small = len(flex)
+        headers = _valueHeaders(len(self.keys))
+        encoders = _VALUE_ENCODERS
+        for i, value in enumerate(self.values):
+            encoding_type = value[1]
+            b += headers[value[0]][encoding_type]
+            encoder = encoders[encoding_type]
+            if encoder is not None:
+                b += encoder(value[2])
+            elif encoding_type == NIB_TYPE_STRING:
+                v = encoded.get(i, value[2])
+                n = len(v)
+                b += flex[n] if n < small else _flexNumber(n)
+                if n >= _DIRECT_WRITE_SIZE:
+                    sink.flush(b)
+                    sink.write(v)
+                    continue
+                b += v
+
+            if len(b) >= _STAGING_FLUSH_SIZE:
+                sink.flush(b)
+
+
+class _Sink:
+    """Write target for NibWriter: a file-like object or a preallocated buffer."""
+
+    def __init__(self, out, size: int) -> None:
+        self._pos = 0
+        if isinstance(out, (bytearray, memoryview)):
+            self._view: Optional[memoryview] = memoryview(out).cast("B")
+            if len(self._view) < size:
+                self._view.release()
+                raise ValueError(f"Output buffer too small for nib: {len(out)} < {size}")
+            self._file = None
+        else:
+            self._view = None
+            self._file = out
+
+    def write(self, data) -> None:
+        n = len(data)
+        if self._view is not None:
+            self._view[self._pos:self._pos + n] = data
+        else:
+            self._file.write(data)
+        self._pos += n
+
+    def flush(self, staging: bytearray) -> None:
+        if staging:
+            self.write(staging)
+            del staging[:]
+
+    def close(self) -> int:
+        if self._view is not None:
+            self._view.release()
+        return self._pos
+
+
+def _flexNumberSize(number: int) -> int:
+    if number < 0x80:
+        return 1
+    size = 1
+    while number >> 7:
+        number >>= 7
+        size += 1
+    return size
+
+
+def _classSize(cls) -> int:
+    aux = isinstance(cls, tuple)
+    if aux:
+        cls = cls[0]
+    return _flexNumberSize(len(cls) + 1) + 1 + (4 if aux else 0) + len(cls.encode("utf-8")) + 1
+
+
+def _flexNumber(number: int) -> bytes:
+    out = bytearray()
     while True:
         cur_byte = number & 0x7F
         number = number >> 7
         if not number:
             break
-        btarray.append(cur_byte)
-    cur_byte |= 0x80
-    btarray.append(cur_byte)
+        out.append(cur_byte)
+    out.append(cur_byte | 0x80)
+    return bytes(out)
 
 
-def _nibWriteObjectsSection(objects):
-    b = bytearray()
-    for obj in objects:
-        _nibWriteFlexNumber(b, obj[0])
-        _nibWriteFlexNumber(b, obj[1])
-        _nibWriteFlexNumber(b, obj[2])
-    return b
+# Encodings of every number that fits in one or two flex bytes, which covers
+# nearly all key indices, object counts and string lengths.
+# Built directly rather than through _flexNumber, which would dominate import time.
+_FLEX_BYTES = tuple(bytes((n | 0x80,)) for n in range(1 << 7)) + tuple(
+    bytes((n & 0x7F, (n >> 7) | 0x80)) for n in range(1 << 7, 1 << 14)
+)
 
 
-def _nibWriteKeysSection(keys):
-    b = bytearray()
-    for key in keys:
-        # print(key)
-        _nibWriteFlexNumber(b, len(key))
-        b.extend(key.encode("utf-8"))
-    return b
+def _nibWriteFlexNumber(btarray, number):
+    if number < len(_FLEX_BYTES):
+        btarray += _FLEX_BYTES[number]
+    else:
+        btarray += _flexNumber(number)
 
 
-def _nibWriteClassesSection(classes):
-    b = bytearray()
-    for cls in classes:
-        if isinstance(cls, tuple):
-            cls, aux_id = cls
-            aux = True
-        else:
-            aux = False
-        _nibWriteFlexNumber(b, len(cls) + 1)
-        if aux:
-            b.append(0x81)
-            b.extend(struct.pack("<I", aux_id))
-        else:
-            b.append(0x80)
-        b.extend(cls.encode("utf-8"))
-        b.append(0x00)
-    return b
+_UINT32 = struct.Struct("<I")
+_UINT16 = struct.Struct("<H")
+_INT64 = struct.Struct("<q")
+_UINT64 = struct.Struct("<Q")
+_FLOAT = struct.Struct("<f")
+_DOUBLE = struct.Struct("<d")
+_BYTES = tuple(bytes((n,)) for n in range(256))
 
 
-def _nibWriteValuesSection(values):
-    b = bytearray()
-    for value in values:
-        keyidx = value[0]
-        encoding_type = value[1]
-        _nibWriteFlexNumber(b, keyidx)
-        b.append(encoding_type)
-
-        if encoding_type == NIB_TYPE_FALSE:
-            continue
-        if encoding_type == NIB_TYPE_TRUE:
-            continue
-        if encoding_type == NIB_TYPE_NIL:
-            continue
-        if encoding_type == NIB_TYPE_OBJECT:
-            try:
-                b.extend(struct.pack("<I", value[2]))
-            except struct.error as err:
-                raise Exception(f"Encoding object not in object list: {value[3]} failed at value: {value[2]}") from err
-            continue
-        if encoding_type == NIB_TYPE_FLOAT:
-            b.extend(struct.pack("<f", value[2]))
-            continue
-        if encoding_type == NIB_TYPE_BYTE:
-            b.append(value[2])
-            continue
-        if encoding_type == NIB_TYPE_SHORT:
-            b.extend(struct.pack("<H", value[2]))
-            continue
-        if encoding_type == NIB_TYPE_LONG:
-            b.extend(struct.pack("<I", value[2]))
-            continue
-        if encoding_type == NIB_TYPE_LONG_LONG:
-            try:
-                if value[2] < 0:
-                    b.extend(struct.pack("<q", value[2]))
-                else:
-                    b.extend(struct.pack("<Q", value[2]))
-            except struct.error as err:
-                raise Exception(f"Encoding long long failed at value: {value[2]}") from err
-            continue
-        if (
-            encoding_type == NIB_TYPE_STRING
-        ):  # TODO struct support (Nibs use this encoding for CGRect)
-            v = value[2]
-            if isinstance(v, str):
-                v = v.encode("utf-8")
-            _nibWriteFlexNumber(b, len(v))
-            b.extend(v)
-            continue
-        if encoding_type == NIB_TYPE_DOUBLE:
-            b.extend(struct.pack("<d", value[2]))
-            continue
-
-        raise Exception("Bad encoding type: " + str(encoding_type))
+def _packLongLong(value: int) -> bytes:
+    if value < 0:
+        return _INT64.pack(value)
+    return _UINT64.pack(value)
 
-    return b
+
+def _packByte(value: int) -> bytes:
+    if not 0 <= value <= 0xFF:
+        raise ValueError("byte must be in range(0, 256)")
+    return _BYTES[value]
+
+
+# Payload encoder per value type. None means the payload is empty (booleans,
+# nil) or, for strings, length-prefixed and written separately.
+_VALUE_ENCODERS: list = [None] * (NIB_TYPE_OBJECT + 1)
+_VALUE_ENCODERS[NIB_TYPE_BYTE] = _packByte
+_VALUE_ENCODERS[NIB_TYPE_SHORT] = _UINT16.pack
+_VALUE_ENCODERS[NIB_TYPE_LONG] = _UINT32.pack
+_VALUE_ENCODERS[NIB_TYPE_LONG_LONG] = _packLongLong
+_VALUE_ENCODERS[NIB_TYPE_FLOAT] = _FLOAT.pack
+_VALUE_ENCODERS[NIB_TYPE_DOUBLE] = _DOUBLE.pack
+_VALUE_ENCODERS[NIB_TYPE_OBJECT] = _UINT32.pack
+
+# Fixed payload size per value type; strings add their length prefix and data.
+# Values each integer type can hold; checked before anything is written.
+_INT_RANGES = {
+    NIB_TYPE_BYTE: (0, 0xFF),
+    NIB_TYPE_SHORT: (0, 0xFFFF),
+    NIB_TYPE_LONG: (0, 0xFFFFFFFF),
+    NIB_TYPE_LONG_LONG: (-0x8000000000000000, 0xFFFFFFFFFFFFFFFF),
+    NIB_TYPE_OBJECT: (0, 0xFFFFFFFF),
+}
+
+_TYPE_NAMES = {
+    NIB_TYPE_BYTE: "byte",
+    NIB_TYPE_SHORT: "short",
+    NIB_TYPE_LONG: "long",
+    NIB_TYPE_LONG_LONG: "long long",
+    NIB_TYPE_FLOAT: "float",
+    NIB_TYPE_DOUBLE: "double",
+}
+
+_VALUE_PAYLOAD_SIZES = {
+    NIB_TYPE_BYTE: 1,
+    NIB_TYPE_SHORT: 2,
+    NIB_TYPE_LONG: 4,
+    NIB_TYPE_LONG_LONG: 8,
+    NIB_TYPE_FALSE: 0,
+    NIB_TYPE_TRUE: 0,
+    NIB_TYPE_FLOAT: 4,
+    NIB_TYPE_DOUBLE: 8,
+    NIB_TYPE_STRING: 0,
+    NIB_TYPE_NIL: 0,
+    NIB_TYPE_OBJECT: 4,
+}
+
+_value_headers: list[tuple[bytes, ...]] = []
+
+
+# Key index + encoding type prefix of a value, for every key/type pair.
+def _valueHeaders(key_count: int) -> list[tuple[bytes, ...]]:
+    for key in range(len(_value_headers), key_count):
+        flex = _FLEX_BYTES[key] if key < len(_FLEX_BYTES) else _flexNumber(key)
+        _value_headers.append(tuple(flex + _BYTES[t] for t in range(NIB_TYPE_OBJECT + 1)))
+    return _value_headers
+
+
+def _nibWriteClass(b, cls):
+    if isinstance(cls, tuple):
+        cls, aux_id = cls
+        aux = True
+    else:
+        aux = False
+    _nibWriteFlexNumber(b, len(cls) + 1)
+    if aux:
+        b.append(0x81)
+        b += _UINT32.pack(aux_id)
+    else:
+        b.append(0x80)
+    b.extend(cls.encode("utf-8"))
+    b.append(0x00)
@@ -1,229 +1,63 @@
-from . import application
-from . import accessibility
-from . import action
-from . import allowedTypes
-from . import animations
-from . import attributedString
-from . import autoresizingMask
-from . import behavior
-from . import binding
-from . import box
-from . import button
-from . import buttonCell
-from . import cells
-from . import clipView
-from . import color
-from . import colorWell
-from . import column
-from . import connections
-from . import contentBorderThickness
-from . import constraint
-from . import constraints
-from . import customFormatter
-from . import customObject
-from . import customSpacing
-from . import customView
-from . import calendarDate
-from . import date
-from . import dateFormatter
-from . import datePicker
-from . import datePickerCell
-from . import datePickerElements
-from . import drawer
-from . import edgeInsets
-from . import font
-from . import holdingPriorities
-from . import imageCell
-from . import imageReference
-from . import imageView
-from . import items
-from . import levelIndicator
-from . import levelIndicatorCell
-from . import matrix
-from . import menu
-from . import menuItem
-from . import modifierMask
-from . import nil
-from . import numberFormatter
-from . import outlet
-from . import outlineView
-from . import pathCell
-from . import pathControl
-from . import placeholder
-from . import allowedInputSourceLocales
-from . import pdfView
-from . import point
-from . import popUpButton
-from . import popUpButtonCell
-from . import predicateEditor
-from . import progressIndicator
-from . import prototypeCellViews
-from . import rect
-from . import scrollView
-from . import segue
-from . import scroller
-from . import secureTextField
-from . import secureTextFieldCell
-from . import searchField
-from . import searchFieldCell
-from . import segment
-from . import segmentedCell
-from . import segmentedControl
-from . import segments
-from . import size
-from . import slider
-from . import sliderCell
-from . import sortDescriptor
-from . import splitView
-from . import stackView
-from . import stepper
-from . import stepperCell
-from . import subviews
-from . import tableCellView
-from . import tableColumn
-from . import tableColumnResizingMask
-from . import tableColumns
-from . import tableFieldCell
-from . import tableHeaderCell
-from . import tableHeaderView
-from . import tabView
-from . import tabViewItem
-from . import tabViewItems
-from . import tableView
-from . import tableViewGridLines
-from . import textField
-from . import textFieldCell
-from . import textView
-from . import toolbar
-from . import url
-from . import userDefinedRuntimeAttributes
-from . import userDefaultsController
-from . import value
-from . import view
-from . import viewController
-from . import viewLayoutGuide
-from . import visibilityPriorities
-from . import visualEffectView
-from . import webPreferences
-from . import webView
-from . import window
-from . import windowController
-from . import windowCollectionBehavior
-from . import windowPositionMask
-from . import windowStyleMask
-
-all = {
-    "application": application,
-    "accessibility": accessibility,
-    "allowedInputSourceLocales": allowedInputSourceLocales,
-    "allowedTypes": allowedTypes,
-    "action": action,
-    "animations": animations,
-    "attributedString": attributedString,
-    "autoresizingMask": autoresizingMask,
-    "behavior": behavior,
-    "binding": binding,
-    "box": box,
-    "button": button,
-    "buttonCell": buttonCell,
-    "cells": cells,
-    "clipView": clipView,
-    "color": color,
-    "colorWell": colorWell,
-    "column": column,
-    "connections": connections,
-    "contentBorderThickness": contentBorderThickness,
-    "constraint": constraint,
-    "constraints": constraints,
-    "customFormatter": customFormatter,
-    "customObject": customObject,
-    "customSpacing": customSpacing,
-    "customView": customView,
-    "calendarDate": calendarDate,
-    "date": date,
-    "dateFormatter": dateFormatter,
-    "datePicker": datePicker,
-    "datePickerCell": datePickerCell,
-    "datePickerElements": datePickerElements,
-    "drawer": drawer,
-    "edgeInsets": edgeInsets,
-    "font": font,
-    "holdingPriorities": holdingPriorities,
-    "imageCell": imageCell,
-    "imageReference": imageReference,
-    "imageView": imageView,
-    "items": items,
-    "levelIndicator": levelIndicator,
-    "levelIndicatorCell": levelIndicatorCell,
-    "matrix": matrix,
-    "menu": menu,
-    "menuItem": menuItem,
-    "modifierMask": modifierMask,
-    "nil": nil,
-    "numberFormatter": numberFormatter,
-    "outlet": outlet,
-    "outlineView": outlineView,
-    "pathCell": pathCell,
-    "pathControl": pathControl,
-    "placeholder": placeholder,
-    "pdfView": pdfView,
-    "point": point,
-    "popUpButton": popUpButton,
-    "popUpButtonCell": popUpButtonCell,
-    "predicateEditor": predicateEditor,
-    "progressIndicator": progressIndicator,
-    "prototypeCellViews": prototypeCellViews,
-    "rect": rect,
-    "scrollView": scrollView,
-    "segue": segue,
-    "scroller": scroller,
-    "secureTextField": secureTextField,
-    "secureTextFieldCell": secureTextFieldCell,
-    "searchField": searchField,
-    "searchFieldCell": searchFieldCell,
-    "segment": segment,
-    "segmentedCell": segmentedCell,
-    "segmentedControl": segmentedControl,
-    "segments": segments,
-    "size": size,
-    "slider": slider,
-    "sliderCell": sliderCell,
-    "sortDescriptor": sortDescriptor,
-    "splitView": splitView,
-    "stackView": stackView,
-    "stepper": stepper,
-    "stepperCell": stepperCell,
-    "subviews": subviews,
-    "tableCellView": tableCellView,
-    "tableColumn": tableColumn,
-    "tableColumnResizingMask": tableColumnResizingMask,
-    "tableColumns": tableColumns,
-    "tableFieldCell": tableFieldCell,
-    "tableHeaderCell": tableHeaderCell,
-    "tableHeaderView": tableHeaderView,
-    "tabView": tabView,
-    "tabViewItem": tabViewItem,
-    "tabViewItems": tabViewItems,
-    "tableView": tableView,
-    "tableViewGridLines": tableViewGridLines,
-    "textField": textField,
-    "textFieldCell": textFieldCell,
-    "textView": textView,
-    "toolbar": toolbar,
-    "url": url,
-    "userDefinedRuntimeAttributes": userDefinedRuntimeAttributes,
-    "userDefaultsController": userDefaultsController,
-    "value": value,
-    "view": view,
-    "viewController": viewController,
-    "viewLayoutGuide": viewLayoutGuide,
-    "visibilityPriorities": visibilityPriorities,
-    "visualEffectView": visualEffectView,
-    "webPreferences": webPreferences,
-    "webView": webView,
-    "window": window,
-    "windowController": windowController,
-    "windowCollectionBehavior": windowCollectionBehavior,
-    "windowPositionMask": windowPositionMask,
-    "windowStyleMask": windowStyleMask,
-}
+"""Parsers for XIB elements, one module per element tag.
+
+A parser module is imported the first time its tag is looked up, so a
+compile only loads the parsers its document uses. The tag to module
+registry in _registry.py is generated: run `python -m ibtool.parsers`
+after adding a parser module.
+"""
+
+import importlib
+import os
+from collections.abc import Mapping
+
+from ._registry import PARSER_MODULES
+
+_MODULE_NAMES = frozenset(PARSER_MODULES.values())
+
+
+def load(tag):
+    """Returns the parser module for an element tag. Raises KeyError for unknown tags."""
+    return importlib.import_module("." + PARSER_MODULES[tag], __name__)
+
+
+class _Parsers(Mapping):
+    def __getitem__(self, tag):
+        return load(tag)
+
+    def __iter__(self):
+        return iter(PARSER_MODULES)
+
+    def __len__(self):
+        return len(PARSER_MODULES)
+
+
+# Element tag -> parser module.
+all = _Parsers()
+
+
+def __getattr__(name):
+    # Keeps `parsers.<module>` working for modules that haven't been loaded yet.
+    if name in _MODULE_NAMES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def scan_parser_modules():
+    """Finds the parser modules in this package, without importing them.
+
+    A parser module defines a top-level parse(ctx, elem, parent) function
+    and handles the element tag of the same name.
+    """
+    import ast
+
+    pkg_dir = os.path.dirname(os.path.abspath(__file__))
+    modules = {}
+    for filename in sorted(os.listdir(pkg_dir)):
+        name, ext = os.path.splitext(filename)
+        if ext != ".py" or name.startswith("_"):
+            continue
+        with open(os.path.join(pkg_dir, filename)) as f:
+            tree = ast.parse(f.read(), filename)
+        if any(isinstance(node, ast.FunctionDef) and node.name == "parse" for node in tree.body):
+            modules[name] = name
+    return modules
@@ -0,0 +1,27 @@
+"""Regenerates the parser registry: python -m ibtool.parsers"""
+
+import os
+
+from . import scan_parser_modules
+
+HEADER = """\
+# Generated by `python -m ibtool.parsers`. Do not edit.
+
+# Element tag -> parser module in ibtool.parsers.
+PARSER_MODULES = {
+"""
+
+
+def main():
+    modules = scan_parser_modules()
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_registry.py")
+    with open(path, "w") as f:
+        f.write(HEADER)
+        for tag, module in modules.items():
+            f.write(f"    \"{tag}\": \"{module}\",\n")
+        f.write("}\n")
+    print(f"Wrote {len(modules)} parsers to {path}")
+
+
+if __name__ == "__main__":
+    main()
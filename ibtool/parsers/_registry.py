@@ -0,0 +1,118 @@
+# Generated by `python -m ibtool.parsers`. Do not edit.
+
+# Element tag -> parser module in ibtool.parsers.
+PARSER_MODULES = {
+    "accessibility": "accessibility",
+    "action": "action",
+    "allowedInputSourceLocales": "allowedInputSourceLocales",
+    "allowedTypes": "allowedTypes",
+    "animations": "animations",
+    "application": "application",
+    "attributedString": "attributedString",
+    "autoresizingMask": "autoresizingMask",
+    "behavior": "behavior",
+    "binding": "binding",
+    "box": "box",
+    "button": "button",
+    "buttonCell": "buttonCell",
+    "calendarDate": "calendarDate",
+    "cells": "cells",
+    "clipView": "clipView",
+    "color": "color",
+    "colorWell": "colorWell",
+    "column": "column",
+    "connections": "connections",
+    "constraint": "constraint",
+    "constraints": "constraints",
+    "contentBorderThickness": "contentBorderThickness",
+    "customFormatter": "customFormatter",
+    "customObject": "customObject",
+    "customSpacing": "customSpacing",
+    "customView": "customView",
+    "date": "date",
+    "dateFormatter": "dateFormatter",
+    "datePicker": "datePicker",
+    "datePickerCell": "datePickerCell",
+    "datePickerElements": "datePickerElements",
+    "drawer": "drawer",
+    "edgeInsets": "edgeInsets",
+    "font": "font",
+    "holdingPriorities": "holdingPriorities",
+    "imageCell": "imageCell",
+    "imageReference": "imageReference",
+    "imageView": "imageView",
+    "items": "items",
+    "levelIndicator": "levelIndicator",
+    "levelIndicatorCell": "levelIndicatorCell",
+    "matrix": "matrix",
+    "menu": "menu",
+    "menuItem": "menuItem",
+    "modifierMask": "modifierMask",
+    "nil": "nil",
+    "numberFormatter": "numberFormatter",
+    "outlet": "outlet",
+    "outlineView": "outlineView",
+    "pathCell": "pathCell",
+    "pathControl": "pathControl",
+    "pdfView": "pdfView",
+    "placeholder": "placeholder",
+    "point": "point",
+    "popUpButton": "popUpButton",
+    "popUpButtonCell": "popUpButtonCell",
+    "predicateEditor": "predicateEditor",
+    "progressIndicator": "progressIndicator",
+    "prototypeCellViews": "prototypeCellViews",
+    "rect": "rect",
+    "scrollView": "scrollView",
+    "scroller": "scroller",
+    "searchField": "searchField",
+    "searchFieldCell": "searchFieldCell",
+    "secureTextField": "secureTextField",
+    "secureTextFieldCell": "secureTextFieldCell",
+    "segment": "segment",
+    "segmentedCell": "segmentedCell",
+    "segmentedControl": "segmentedControl",
+    "segments": "segments",
+    "segue": "segue",
+    "size": "size",
+    "slider": "slider",
+    "sliderCell": "sliderCell",
+    "sortDescriptor": "sortDescriptor",
+    "splitView": "splitView",
+    "stackView": "stackView",
+    "stepper": "stepper",
+    "stepperCell": "stepperCell",
+    "subviews": "subviews",
+    "tabView": "tabView",
+    "tabViewItem": "tabViewItem",
+    "tabViewItems": "tabViewItems",
+    "tableCellView": "tableCellView",
+    "tableColumn": "tableColumn",
+    "tableColumnResizingMask": "tableColumnResizingMask",
+    "tableColumns": "tableColumns",
+    "tableFieldCell": "tableFieldCell",
+    "tableHeaderCell": "tableHeaderCell",
+    "tableHeaderView": "tableHeaderView",
+    "tableView": "tableView",
+    "tableViewGridLines": "tableViewGridLines",
+    "textField": "textField",
+    "textFieldCell": "textFieldCell",
+    "textView": "textView",
+    "toolbar": "toolbar",
+    "url": "url",
+    "userDefaultsController": "userDefaultsController",
+    "userDefinedRuntimeAttributes": "userDefinedRuntimeAttributes",
+    "value": "value",
+    "view": "view",
+    "viewController": "viewController",
+    "viewLayoutGuide": "viewLayoutGuide",
+    "visibilityPriorities": "visibilityPriorities",
+    "visualEffectView": "visualEffectView",
+    "webPreferences": "webPreferences",
+    "webView": "webView",
+    "window": "window",
+    "windowCollectionBehavior": "windowCollectionBehavior",
+    "windowController": "windowController",
+    "windowPositionMask": "windowPositionMask",
+    "windowStyleMask": "windowStyleMask",
+}
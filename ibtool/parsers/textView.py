@@ -106,7 +106,6 @@ def parse(ctx: ArchiveContext, elem: Element, parent: Optional[NibObject]) -> Xi
     storage_run_data = obj.extraContext.get("attributedStringRunData")
     if storage_dicts and len(storage_dicts) > 1:
         attrs_array = NibMutableList(storage_dicts)
-        attrs_array.classname = lambda: "NSMutableArray"
         storage_props["NSAttributes"] = attrs_array
         attr_info = NibObject("NSMutableData")
         # Bypass NibObject.__setitem__ which would auto-wrap bytes in NibData
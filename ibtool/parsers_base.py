@@ -4,12 +4,12 @@ from typing import Optional
 import importlib
 
 
-def __xibparser_ParseXIBObject(ctx: ArchiveContext, elem: Element, parent: Optional[NibObject], all_parsers={}) -> NibObject:
-    if not all_parsers:
-        all_parsers.update(importlib.import_module(".parsers", __package__).all)
-
+def __xibparser_ParseXIBObject(ctx: ArchiveContext, elem: Element, parent: Optional[NibObject], parse_fns={}) -> NibObject:
     tag = elem.tag
-    parsefn = all_parsers[tag].parse
+    parsefn = parse_fns.get(tag)
+    if parsefn is None:
+        # Loads the tag's parser module on first use.
+        parsefn = parse_fns[tag] = importlib.import_module(".parsers", __package__).load(tag).parse
     # print("----- PARSETHING:", tag, parsefn)
     if parsefn:
         obj = parsefn(ctx, elem, parent)
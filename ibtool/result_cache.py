@@ -0,0 +1,141 @@
+"""Recorded results of ibtool command lines, for ibtool_server --result-cache.
+
+Entries live in a CompileCache directory, so they share its layout, size
+limit and least recently used eviction.
+"""
+
+import hashlib
+import json
+import os
+
+from .compile_cache import CompileCache, _copy
+
+
+# Options whose value is a path ibtool writes rather than reads.
+OUTPUT_OPTIONS = (
+    "--compile", "--write", "--strip", "--link", "--compilation-directory",
+    "--output-partial-info-plist", "--generate-strings-file",
+)
+# Of those, the ones naming a directory ibtool writes its outputs into. It is
+# usually shared by every file of a target, so only the entries a request
+# writes there are recorded.
+OUTPUT_DIRECTORY_OPTIONS = ("--link", "--compilation-directory")
+
+INPUT_SUFFIXES = (".xib", ".storyboard", ".nib", ".storyboardc")
+
+
+def output_paths(args):
+    return [args[i + 1] for i, arg in enumerate(args[:-1]) if arg in OUTPUT_OPTIONS]
+
+
+def output_directories(args):
+    return [args[i + 1] for i, arg in enumerate(args[:-1]) if arg in OUTPUT_DIRECTORY_OPTIONS]
+
+
+def output_snapshot(args):
+    """The files in the output directories of args, taken before running it."""
+    return {directory: _files(directory) for directory in output_directories(args)}
+
+
+def written_outputs(args, snapshot):
+    """The outputs a request wrote: its output files, and the entries of its
+    output directories that are named after one of its inputs and were added
+    or changed since snapshot."""
+    directories = set(snapshot)
+    outputs = [path for path in output_paths(args) if path not in directories]
+    stems = {os.path.splitext(os.path.basename(arg.rstrip("/")))[0] for arg in args[1:] if arg.rstrip("/").endswith(INPUT_SUFFIXES)}
+    for directory, before in snapshot.items():
+        names = {rel.split(os.sep, 1)[0] for rel, st in _files(directory).items() if before.get(rel) != st}
+        outputs += [
+            os.path.join(directory, name) for name in sorted(names)
+            if any(name.split(".", 1)[0].split("~", 1)[0] == stem for stem in stems)
+        ]
+    return outputs
+
+
+def _files(directory):
+    files = {}
+    for dirpath, _, filenames in os.walk(directory):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            files[os.path.relpath(path, directory)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+class ResultCache(CompileCache):
+    """Results of successful ibtool requests, replayed for identical ones.
+
+    A request is identical when it has the same tool, the same arguments
+    and the same contents in every existing file or directory named by an
+    argument (other than its outputs). An entry records the exit code,
+    stdout, stderr and a copy of everything the request wrote.
+    """
+
+    label = "result cache"
+
+    def key(self, args, tool):
+        h = hashlib.sha256(b"ibtool-server-result-cache-2")
+        outputs = set(output_paths(args))
+        _update(h, tool)
+        for arg in args[1:]:
+            _update(h, arg.encode())
+            if arg not in outputs and os.path.exists(arg):
+                _update(h, _path_digest(arg))
+        return h.hexdigest()
+
+    def snapshot(self, args):
+        """What has to be known before running args to record its outputs afterwards."""
+        return output_snapshot(args)
+
+    def replay(self, key):
+        """Returns the recorded result for key, restoring its outputs, or None on a miss."""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, "result.json")) as f:
+                result = json.load(f)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        for n, path in enumerate(result["outputs"]):
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            _copy(os.path.join(entry, str(n)), path)
+        self.touch(key)
+        self.hits += 1
+        return result
+
+    def record(self, key, exit_code, stdout, stderr, args, snapshot):
+        """Records the result of running args, with the outputs it wrote since snapshot."""
+        outputs = [path for path in written_outputs(args, snapshot) if os.path.exists(path)]
+
+        def populate(tmp):
+            for n, path in enumerate(outputs):
+                _copy(path, os.path.join(tmp, str(n)))
+            with open(os.path.join(tmp, "result.json"), "w") as f:
+                json.dump({"exit_code": exit_code, "stdout": stdout, "stderr": stderr, "outputs": outputs}, f)
+
+        self._store_entry(key, populate)
+
+
+def _update(h, part):
+    h.update(len(part).to_bytes(4, "little"))
+    h.update(part)
+
+
+def _path_digest(path):
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames.sort()
+            for name in sorted(filenames):
+                file_path = os.path.join(dirpath, name)
+                _update(h, os.path.relpath(file_path, path).encode())
+                _update(h, _path_digest(file_path))
+        return h.digest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
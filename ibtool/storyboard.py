@@ -2,8 +2,10 @@ import os
 import re
 import uuid
 import plistlib
+import xml.etree.ElementTree as ET
 from .models import (
     ArrayLike,
+    CompilationSession,
     NibNSNumber,
     NibObject,
     NibList,
@@ -57,40 +59,146 @@ def _compile_storyboard_nib(genlib, nibroot):
     return genlib.CompileNibObjects([nibroot])
 
 
-def CompileStoryboard(tree, outpath, module=None, isBaseLocalization=False):
+def _write_storyboard_nib(genlib, nibroot, path):
+    _storyboard_fixups(nibroot)
+    genlib.CompileNibObjectsToPath([nibroot], path)
+
+
+def CompileStoryboard(tree, outpath, module=None, isBaseLocalization=False, session=None, jobs=1):
+    with CompilationSession.join(session):
+        _compile_storyboard(tree, outpath, module, isBaseLocalization, jobs)
+
+
+class _StoryboardDocument:
+    """Document-wide settings shared by every scene compiled from a storyboard.
+
+    Also indexes the document in a single pass (scenes by view controller id,
+    segues by view controller, elements by id, image resources), so scene
+    compilers never have to re-scan the whole tree.
+    """
+
+    def __init__(self, root, outpath, module, isBaseLocalization):
+        self.root = root
+        self.outpath = outpath
+        self.module = module
+        self.isBaseLocalization = isBaseLocalization
+        self.initial_vc_id = root.get("initialViewController")
+        self.use_autolayout = root.get("useAutolayout") == "YES"
+        self.tools_version = int(root.get("toolsVersion", "0").split(".")[0])
+        self.custom_instantiation = root.get("customObjectInstantitationMethod")
+        self.scenes = []
+        self.has_app_scene = False
+        self.elements_by_id = {}
+        self.scene_by_vc_id = {}
+        self.segues_by_vc = {}
+        self.image_resources = {}  # name -> (width, height)
+        self.image_catalog = {}  # name -> catalog
+        self._index(root)
+
+    def _index(self, root):
+        # Each entry carries the scene's view controller element it is in, if
+        # any, which every segue below it is attributed to.
+        stack = [(root, None)]
+        while stack:
+            elem, vc_elem = stack.pop()
+            tag = elem.tag
+            elem_id = elem.get("id")
+            if elem_id is not None:
+                self.elements_by_id.setdefault(elem_id, elem)
+
+            if tag == "scene":
+                self.scenes.append(elem)
+                objects_elem = elem.find("objects")
+                if objects_elem is not None:
+                    for child in objects_elem:
+                        if child.tag == "application":
+                            self.has_app_scene = True
+                        if child.get("sceneMemberID") == "viewController":
+                            self.scene_by_vc_id.setdefault(child.get("id"), elem)
+            elif tag == "segue":
+                if vc_elem is not None:
+                    self.segues_by_vc.setdefault(vc_elem, []).append(elem)
+            elif tag == "resources":
+                for img in elem.iter("image"):
+                    name = img.get("name")
+                    w = img.get("width")
+                    h = img.get("height")
+                    if name and w and h:
+                        self.image_resources[name] = (w, h)
+                    catalog = img.get("catalog")
+                    if name and catalog:
+                        self.image_catalog[name] = catalog
+
+            if elem.get("sceneMemberID") == "viewController":
+                vc_elem = elem
+            stack.extend((child, vc_elem) for child in reversed(elem))
+
+    def scene_for_vc(self, vc_id):
+        return self.scene_by_vc_id.get(vc_id)
+
+    def view_controller(self, vc_id):
+        """The scene's view controller element with the given id, if any."""
+        if self.scene_for_vc(vc_id) is None:
+            return None
+        return self.elements_by_id.get(vc_id)
+
+    def segues_from(self, vc_elem):
+        """Every segue inside a scene's view controller, in document order,
+        including those on its buttons, cells and other nested objects."""
+        return self.segues_by_vc.get(vc_elem, [])
+
+
+def _compile_storyboard(tree, outpath, module, isBaseLocalization, jobs=1):
     root = tree.getroot()
     replace_string_attribures(root)
-
-    initial_vc_id = root.get("initialViewController")
-    use_autolayout = root.get("useAutolayout") == "YES"
-    tools_version = int(root.get("toolsVersion", "0").split(".")[0])
-    custom_instantiation = root.get("customObjectInstantitationMethod")
+    doc = _StoryboardDocument(root, outpath, module, isBaseLocalization)
 
     os.makedirs(outpath, exist_ok=True)
 
-    scenes = root.findall(".//scene")
     nib_names = {}  # scene identifier -> nib name
     vc_identifiers_to_uuids = {}  # scene identifier -> UUID
-    main_menu_nib = None
-    has_app_scene = any(
-        child.tag == "application"
-        for s in scenes if (objs := s.find("objects")) is not None
-        for child in objs
-    )
+    scene_jobs = _plan_scenes(doc, nib_names, vc_identifiers_to_uuids)
 
-    for scene_elem in scenes:
-        objects_elem = scene_elem.find("objects")
-        if objects_elem is None:
-            continue
+    if jobs > 1:
+        _compile_scenes_parallel(doc, list(scene_jobs), jobs)
+    else:
+        for job in scene_jobs:
+            _compile_scene(doc, job)
 
-        vc_elem = None
-        first_responder_elem = None
-        for child in objects_elem:
-            if child.get("sceneMemberID") == "viewController":
-                vc_elem = child
-            elif child.get("sceneMemberID") == "firstResponder":
-                first_responder_elem = child
+    # Generate Info.plist
+    info = {
+        "NSStoryboardMainMenu": "MainMenu",
+        "NSViewControllerIdentifiersToNibNames": nib_names,
+        **({"NSStoryboardDesignatedEntryPointIdentifier": f"NSWindowController-{doc.initial_vc_id}"} if doc.initial_vc_id else {}),
+        "NSViewControllerIdentifiersToUUIDs": vc_identifiers_to_uuids,
+        "NSStoryboardVersion": 1,
+    }
+    with open(os.path.join(outpath, "Info.plist"), "wb") as f:
+        plistlib.dump(info, f)
 
+
+def _scene_members(scene_elem):
+    """Returns (objects, view controller, first responder) elements of a scene."""
+    objects_elem = scene_elem.find("objects")
+    if objects_elem is None:
+        return None, None, None
+
+    vc_elem = None
+    first_responder_elem = None
+    for child in objects_elem:
+        if child.get("sceneMemberID") == "viewController":
+            vc_elem = child
+        elif child.get("sceneMemberID") == "firstResponder":
+            first_responder_elem = child
+    return objects_elem, vc_elem, first_responder_elem
+
+
+# Yields one job per scene that produces nibs, in document order, after
+# registering its nib names and UUIDs. Jobs only refer to scenes by index so
+# they can be sent to worker processes.
+def _plan_scenes(doc, nib_names, vc_identifiers_to_uuids):
+    for scene_idx, scene_elem in enumerate(doc.scenes):
+        _, vc_elem, _ = _scene_members(scene_elem)
         if vc_elem is None:
             continue
 
@@ -99,16 +207,8 @@ def CompileStoryboard(tree, outpath, module=None, isBaseLocalization=False):
 
         if scene_type == "application":
             nib_name = "MainMenu"
-            main_menu_nib = nib_name
             nib_names[nib_name] = nib_name
-            nibroot = _compile_application_scene(
-                root, objects_elem, vc_elem, first_responder_elem,
-                use_autolayout, tools_version, custom_instantiation,
-                module=module, isBaseLocalization=isBaseLocalization,
-            )
-            outbytes = _compile_storyboard_nib(genlib, nibroot)
-            with open(os.path.join(outpath, nib_name + ".nib"), "wb") as f:
-                f.write(outbytes)
+            yield ("application", scene_idx, nib_name)
 
         elif scene_type == "windowController":
             storyboard_id = vc_elem.get("storyboardIdentifier")
@@ -117,50 +217,21 @@ def CompileStoryboard(tree, outpath, module=None, isBaseLocalization=False):
             wc_uuid = str(uuid.uuid4()).upper()
             vc_identifiers_to_uuids[nib_name] = wc_uuid
 
-            segue_elems = vc_elem.findall(".//segue")
             content_vc_id = None
-            for seg in segue_elems:
+            for seg in doc.segues_from(vc_elem):
                 if seg.get("kind") == "relationship" and "ContentViewController" in (seg.get("relationship") or ""):
                     content_vc_id = seg.get("destination")
 
             view_nib_name = None
-            view_nib_bytes = None
             if content_vc_id:
-                vc_scene = _find_scene_for_vc(scenes, content_vc_id)
-                if vc_scene is not None:
-                    vc_scene_objects = vc_scene.find("objects")
-                    vc_scene_vc_elem = None
-                    for child in vc_scene_objects:
-                        if child.get("sceneMemberID") == "viewController":
-                            vc_scene_vc_elem = child
-                    if vc_scene_vc_elem is not None:
-                        # tabViewControllers are embedded directly in the WC nib
-                        if vc_scene_vc_elem.tag != "tabViewController":
-                            view_elem = vc_scene_vc_elem.find("view") or vc_scene_vc_elem.find("tabView")
-                            if view_elem is not None:
-                                view_id = view_elem.get("id")
-                                view_nib_name = f"{content_vc_id}-view-{view_id}"
-                                view_nib_root = _compile_view_nib(
-                                    root, vc_scene_vc_elem, view_elem,
-                                    use_autolayout, tools_version, custom_instantiation,
-                                    module=module, isBaseLocalization=isBaseLocalization,
-                                )
-                                view_nib_bytes = _compile_storyboard_nib(genlib, view_nib_root)
-
-            nibroot = _compile_window_controller_scene(
-                root, objects_elem, vc_elem, first_responder_elem,
-                use_autolayout, tools_version, custom_instantiation,
-                wc_uuid, content_vc_id, view_nib_name, scenes,
-                has_app_scene=has_app_scene, module=module,
-                isBaseLocalization=isBaseLocalization,
-            )
-            outbytes = _compile_storyboard_nib(genlib, nibroot)
-            with open(os.path.join(outpath, nib_name + ".nib"), "wb") as f:
-                f.write(outbytes)
+                vc_scene_vc_elem = doc.view_controller(content_vc_id)
+                # tabViewControllers are embedded directly in the WC nib
+                if vc_scene_vc_elem is not None and vc_scene_vc_elem.tag != "tabViewController":
+                    view_elem = vc_scene_vc_elem.find("view") or vc_scene_vc_elem.find("tabView")
+                    if view_elem is not None:
+                        view_nib_name = f"{content_vc_id}-view-{view_elem.get('id')}"
 
-            if view_nib_name and view_nib_bytes:
-                with open(os.path.join(outpath, view_nib_name + ".nib"), "wb") as f:
-                    f.write(view_nib_bytes)
+            yield ("windowController", scene_idx, nib_name, wc_uuid, content_vc_id, view_nib_name)
 
         elif scene_type in ("viewController", "tabViewController"):
             storyboard_id = vc_elem.get("storyboardIdentifier")
@@ -172,51 +243,111 @@ def CompileStoryboard(tree, outpath, module=None, isBaseLocalization=False):
                     nib_names[view_nib_name] = view_nib_name
                     vc_uuid = str(uuid.uuid4()).upper()
                     vc_identifiers_to_uuids[view_nib_name] = vc_uuid
-
-                    view_nib_root = _compile_view_nib(
-                        root, vc_elem, view_elem,
-                        use_autolayout, tools_version, custom_instantiation,
-                        module=module, isBaseLocalization=isBaseLocalization,
-                    )
-                    view_nib_bytes = _compile_storyboard_nib(genlib, view_nib_root)
-                    with open(os.path.join(outpath, view_nib_name + ".nib"), "wb") as f:
-                        f.write(view_nib_bytes)
-
                     nib_names[storyboard_id] = storyboard_id
                     vc_identifiers_to_uuids[storyboard_id] = vc_uuid
-                    ctrl_nib_root = _compile_viewcontroller_scene(
-                        root, vc_elem, view_nib_name, storyboard_id,
-                        vc_uuid, use_autolayout, tools_version, custom_instantiation,
-                        module=module, isBaseLocalization=isBaseLocalization,
-                    )
-                    ctrl_nib_bytes = _compile_storyboard_nib(genlib, ctrl_nib_root)
-                    with open(os.path.join(outpath, storyboard_id + ".nib"), "wb") as f:
-                        f.write(ctrl_nib_bytes)
+                    yield ("viewController", scene_idx, view_nib_name, storyboard_id, vc_uuid)
+
+
+# Compiles the nibs of one planned scene and writes them to doc.outpath.
+def _compile_scene(doc, job):
+    kind, scene_idx = job[0], job[1]
+    outpath = doc.outpath
+    objects_elem, vc_elem, first_responder_elem = _scene_members(doc.scenes[scene_idx])
+    use_autolayout, tools_version = doc.use_autolayout, doc.tools_version
+    custom_instantiation = doc.custom_instantiation
+    module, isBaseLocalization = doc.module, doc.isBaseLocalization
+
+    if kind == "application":
+        nib_name = job[2]
+        nibroot = _compile_application_scene(
+            doc, objects_elem, vc_elem, first_responder_elem,
+            use_autolayout, tools_version, custom_instantiation,
+            module=module, isBaseLocalization=isBaseLocalization,
+        )
+        _write_storyboard_nib(genlib, nibroot, os.path.join(outpath, nib_name + ".nib"))
 
-    # Generate Info.plist
-    info = {
-        "NSStoryboardMainMenu": main_menu_nib or "MainMenu",
-        "NSViewControllerIdentifiersToNibNames": nib_names,
-        **({"NSStoryboardDesignatedEntryPointIdentifier": f"NSWindowController-{initial_vc_id}"} if initial_vc_id else {}),
-        "NSViewControllerIdentifiersToUUIDs": vc_identifiers_to_uuids,
-        "NSStoryboardVersion": 1,
-    }
-    with open(os.path.join(outpath, "Info.plist"), "wb") as f:
-        plistlib.dump(info, f)
+    elif kind == "windowController":
+        nib_name, wc_uuid, content_vc_id, view_nib_name = job[2:]
 
+        view_nib_bytes = None
+        if view_nib_name:
+            vc_scene_vc_elem = doc.view_controller(content_vc_id)
+            view_elem = vc_scene_vc_elem.find("view") or vc_scene_vc_elem.find("tabView")
+            view_nib_root = _compile_view_nib(
+                doc, vc_scene_vc_elem, view_elem,
+                use_autolayout, tools_version, custom_instantiation,
+                module=module, isBaseLocalization=isBaseLocalization,
+            )
+            view_nib_bytes = _compile_storyboard_nib(genlib, view_nib_root)
+
+        nibroot = _compile_window_controller_scene(
+            doc, objects_elem, vc_elem, first_responder_elem,
+            use_autolayout, tools_version, custom_instantiation,
+            wc_uuid, content_vc_id, view_nib_name,
+            has_app_scene=doc.has_app_scene, module=module,
+            isBaseLocalization=isBaseLocalization,
+        )
+        _write_storyboard_nib(genlib, nibroot, os.path.join(outpath, nib_name + ".nib"))
+
+        if view_nib_name and view_nib_bytes:
+            with open(os.path.join(outpath, view_nib_name + ".nib"), "wb") as f:
+                f.write(view_nib_bytes)
+
+    elif kind == "viewController":
+        view_nib_name, storyboard_id, vc_uuid = job[2:]
+        view_elem = vc_elem.find("view") or vc_elem.find("tabView")
+        view_nib_root = _compile_view_nib(
+            doc, vc_elem, view_elem,
+            use_autolayout, tools_version, custom_instantiation,
+            module=module, isBaseLocalization=isBaseLocalization,
+        )
+        _write_storyboard_nib(genlib, view_nib_root, os.path.join(outpath, view_nib_name + ".nib"))
+
+        ctrl_nib_root = _compile_viewcontroller_scene(
+            doc, vc_elem, view_nib_name, storyboard_id,
+            vc_uuid, use_autolayout, tools_version, custom_instantiation,
+            module=module, isBaseLocalization=isBaseLocalization,
+        )
+        _write_storyboard_nib(genlib, ctrl_nib_root, os.path.join(outpath, storyboard_id + ".nib"))
+
+
+# Scene jobs only share the (read-only) document, so each worker process
+# rebuilds it once from the serialized XML and then compiles whole scenes.
+# Nib names and UUIDs are assigned up front by _plan_scenes, so the output
+# files and Info.plist don't depend on which worker finishes first.
+def _compile_scenes_parallel(doc, scene_jobs, jobs):
+    if len(scene_jobs) < 2:
+        for job in scene_jobs:
+            _compile_scene(doc, job)
+        return
+
+    xml = ET.tostring(doc.root)
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(
+        max_workers=min(jobs, len(scene_jobs)),
+        initializer=_init_scene_worker,
+        initargs=(xml, doc.outpath, doc.module, doc.isBaseLocalization),
+    ) as pool:
+        # map() re-raises the first failing scene in document order.
+        for _ in pool.map(_compile_scene_in_worker, scene_jobs):
+            pass
 
-def _find_scene_for_vc(scenes, vc_id):
-    for scene in scenes:
-        objects_elem = scene.find("objects")
-        if objects_elem is None:
-            continue
-        for child in objects_elem:
-            if child.get("sceneMemberID") == "viewController" and child.get("id") == vc_id:
-                return scene
-    return None
 
+_worker_doc = None
 
-def _make_scene_context(root, use_autolayout, tools_version, custom_instantiation, module=None):
+
+def _init_scene_worker(xml, outpath, module, isBaseLocalization):
+    global _worker_doc
+    _worker_doc = _StoryboardDocument(ET.fromstring(xml), outpath, module, isBaseLocalization)
+
+
+def _compile_scene_in_worker(job):
+    with CompilationSession():
+        _compile_scene(_worker_doc, job)
+
+
+def _make_scene_context(doc, use_autolayout, tools_version, custom_instantiation, module=None):
     ctx = ArchiveContext(
         useAutolayout=use_autolayout,
         customObjectInstantitationMethod=custom_instantiation or "direct",
@@ -225,16 +356,8 @@ def _make_scene_context(root, use_autolayout, tools_version, custom_instantiatio
     )
     ctx.isStoryboard = True
 
-    for res_elem in root.iter("resources"):
-        for img in res_elem.iter("image"):
-            name = img.get("name")
-            w = img.get("width")
-            h = img.get("height")
-            if name and w and h:
-                ctx.imageResources[name] = (w, h)
-            catalog = img.get("catalog")
-            if name and catalog:
-                ctx.imageCatalog[name] = catalog
+    ctx.imageResources.update(doc.image_resources)
+    ctx.imageCatalog.update(doc.image_catalog)
 
     return ctx
 
@@ -389,9 +512,9 @@ def _resolve_storyboard_connections(ctx, first_responder_id=None):
     ctx._resolveViewReferences()
 
 
-def _compile_application_scene(root, objects_elem, vc_elem, first_responder_elem,
+def _compile_application_scene(doc, objects_elem, vc_elem, first_responder_elem,
                                 use_autolayout, tools_version, custom_instantiation, module=None, isBaseLocalization=False):
-    ctx = _make_scene_context(root, use_autolayout, tools_version, custom_instantiation, module=module)
+    ctx = _make_scene_context(doc, use_autolayout, tools_version, custom_instantiation, module=module)
     ctx.isBaseLocalization = isBaseLocalization
 
     first_responder_id = first_responder_elem.get("id") if first_responder_elem is not None else None
@@ -476,7 +599,7 @@ def _compile_application_scene(root, objects_elem, vc_elem, first_responder_elem
     return createTopLevel([files_owner] + toplevel, ctx)
 
 
-def _build_tab_view_controller_for_wc(ctx, vc_elem, scenes, parent,
+def _build_tab_view_controller_for_wc(ctx, vc_elem, doc, parent,
                                        vc_tag_to_class, extra_objects,
                                        extra_connections, extra_placeholders):
     """Build a full NSTabViewController with tab items and child VC swappers
@@ -530,7 +653,7 @@ def _build_tab_view_controller_for_wc(ctx, vc_elem, scenes, parent,
 
     # Gather tab items and their segue destinations
     tab_item_segues = [
-        seg for seg in vc_elem.findall(".//segue")
+        seg for seg in doc.segues_from(vc_elem)
         if seg.get("kind") == "relationship" and seg.get("relationship") == "tabItems"
     ]
     tab_view_items_elem = vc_elem.find("tabViewItems")
@@ -541,14 +664,7 @@ def _build_tab_view_controller_for_wc(ctx, vc_elem, scenes, parent,
 
     for tab_item_elem, tab_seg in zip(tab_items_list, tab_item_segues):
         child_vc_id = tab_seg.get("destination")
-        child_scene = _find_scene_for_vc(scenes, child_vc_id)
-        if child_scene is None:
-            continue
-        child_objects = child_scene.find("objects")
-        child_vc_elem = None
-        for ch in child_objects:
-            if ch.get("sceneMemberID") == "viewController":
-                child_vc_elem = ch
+        child_vc_elem = doc.view_controller(child_vc_id)
         if child_vc_elem is None:
             continue
 
@@ -686,11 +802,11 @@ def _build_tab_view_controller_for_wc(ctx, vc_elem, scenes, parent,
     return result
 
 
-def _compile_window_controller_scene(root, objects_elem, vc_elem, first_responder_elem,
+def _compile_window_controller_scene(doc, objects_elem, vc_elem, first_responder_elem,
                                       use_autolayout, tools_version, custom_instantiation,
-                                      wc_uuid, content_vc_id, view_nib_name, scenes,
+                                      wc_uuid, content_vc_id, view_nib_name,
                                       has_app_scene=False, module=None, isBaseLocalization=False):
-    ctx = _make_scene_context(root, use_autolayout, tools_version, custom_instantiation, module=module)
+    ctx = _make_scene_context(doc, use_autolayout, tools_version, custom_instantiation, module=module)
     ctx.isBaseLocalization = isBaseLocalization
 
     first_responder_id = first_responder_elem.get("id") if first_responder_elem is not None else None
@@ -773,16 +889,11 @@ def _compile_window_controller_scene(root, objects_elem, vc_elem, first_responde
 
     vc_elem_in_scene = None
     if content_vc_id:
-        vc_scene = _find_scene_for_vc(scenes, content_vc_id)
-        if vc_scene is not None:
-            vc_objects = vc_scene.find("objects")
-            for child in vc_objects:
-                if child.get("sceneMemberID") == "viewController":
-                    vc_elem_in_scene = child
+        vc_elem_in_scene = doc.view_controller(content_vc_id)
 
     if vc_elem_in_scene is not None and vc_elem_in_scene.tag == "tabViewController":
         content_vc_obj = _build_tab_view_controller_for_wc(
-            ctx, vc_elem_in_scene, scenes, window_template, _vc_tag_to_class,
+            ctx, vc_elem_in_scene, doc, window_template, _vc_tag_to_class,
             tab_vc_extra_objects, tab_vc_extra_connections, tab_vc_extra_placeholders,
         )
         wc_obj["IBWindowTemplateContentViewController"] = content_vc_obj
@@ -937,9 +1048,9 @@ def _compile_window_controller_scene(root, objects_elem, vc_elem, first_responde
     return createTopLevel([files_owner] + toplevel, ctx)
 
 
-def _compile_view_nib(root, vc_elem, view_elem,
+def _compile_view_nib(doc, vc_elem, view_elem,
                        use_autolayout, tools_version, custom_instantiation, module=None, isBaseLocalization=False):
-    ctx = _make_scene_context(root, use_autolayout, tools_version, custom_instantiation, module=module)
+    ctx = _make_scene_context(doc, use_autolayout, tools_version, custom_instantiation, module=module)
     ctx.isBaseLocalization = isBaseLocalization
 
     files_owner = XibObject(ctx, "NSCustomObject", None, None)
@@ -1005,9 +1116,9 @@ def _compile_view_nib(root, vc_elem, view_elem,
     return createTopLevel([files_owner], ctx)
 
 
-def _compile_viewcontroller_scene(root, vc_elem, view_nib_name, storyboard_id,
+def _compile_viewcontroller_scene(doc, vc_elem, view_nib_name, storyboard_id,
                                    vc_uuid, use_autolayout, tools_version, custom_instantiation, module=None, isBaseLocalization=False):
-    ctx = _make_scene_context(root, use_autolayout, tools_version, custom_instantiation, module=module)
+    ctx = _make_scene_context(doc, use_autolayout, tools_version, custom_instantiation, module=module)
     ctx.isBaseLocalization = isBaseLocalization
 
     files_owner = XibObject(ctx, "NSCustomObject", None, None)
@@ -1,17 +1,18 @@
 import xml.etree.ElementTree as ET
 from . import xibparser
 from . import genlib
-from .models import XibObject, NibObject
+from .models import CompilationSession, XibObject, NibObject
 
 
 def build_xibmap(xib_path: str) -> list[tuple[str, int, str, str]]:
     """Parse a XIB, compile it, and return a list of (xibid, nibidx, classname, original_classname) tuples."""
     tree = ET.parse(xib_path)
     root = tree.getroot()
-    context, nibroot = xibparser.ParseXIBObjects(root)
+    with CompilationSession.join() as session:
+        context, nibroot = xibparser.ParseXIBObjects(root, session=session)
 
-    # Compile to assign _nibidx to all objects
-    genlib.CompileNibObjects([nibroot])
+        # Compile to assign _nibidx to all objects
+        genlib.CompileNibObjects([nibroot])
 
     # Walk all objects in context to collect xibid -> nibidx mappings
     entries = []
@@ -4,6 +4,7 @@ import plistlib
 import uuid
 from .models import (
     ArrayLike,
+    CompilationSession,
     NibNSNumber,
     NibObject,
     NibList,
@@ -29,30 +30,44 @@ from .parsers_base import __xibparser_ParseXIBObject
 from .system_images import system_image_size
 from .parsers.helpers import makeSystemColor
 
-def replace_string_attribures(elem: Element):
-    string_elements = [child for child in elem if child.tag == "string" and child.get("key")]
-
-    for string_elem in string_elements:
-        key = string_elem.attrib["key"]
-        if string_elem.attrib.get("base64-UTF8") == "YES":
-            text = (string_elem.text or '').strip()
-            value = base64.b64decode(text + ((4 - (len(text) % 4)) * '=')).decode('utf-8')
-            if key == "toolTip":
-                elem.set("_base64ToolTip", "YES")
-        else:
-            value = (string_elem.text or '')
-        elem.set(key, value)
-        elem.remove(string_elem)
-
-    for child in elem:
-        replace_string_attribures(child)
+def replace_string_attribures(root: Element):
+    """Moves every <string key="..."> child into an attribute of its parent.
+
+    A single iterative pass, so it is linear in the size of the tree and
+    works for documents deeper than the recursion limit.
+    """
+    stack = [root]
+    while stack:
+        elem = stack.pop()
+        kept = []
+        for child in elem:
+            key = child.get("key") if child.tag == "string" else None
+            if not key:
+                kept.append(child)
+                continue
+            if child.attrib.get("base64-UTF8") == "YES":
+                text = (child.text or '').strip()
+                value = base64.b64decode(text + ((4 - (len(text) % 4)) * '=')).decode('utf-8')
+                if key == "toolTip":
+                    elem.set("_base64ToolTip", "YES")
+            else:
+                value = (child.text or '')
+            elem.set(key, value)
+        if len(kept) != len(elem):
+            elem[:] = kept
+        stack.extend(kept)
 
 # Parses xml Xib data and returns a NibObject that can be used as the root
 # object in a compiled NIB archive.
 # element: The element containing the objects to be included in the nib.
 #          For standalone XIBs, this is typically document->objects
 #          For storyboards, this is typically document->scenes->scene->objects
-def ParseXIBObjects(root: Element, context: Optional[ArchiveContext]=None, resolveConnections: bool=True, parent: Optional[NibObject]=None, module: Optional[str]=None, isBaseLocalization: bool=False) -> tuple[ArchiveContext, NibObject]:
+def ParseXIBObjects(root: Element, context: Optional[ArchiveContext]=None, resolveConnections: bool=True, parent: Optional[NibObject]=None, module: Optional[str]=None, isBaseLocalization: bool=False, session: Optional[CompilationSession]=None) -> tuple[ArchiveContext, NibObject]:
+    with CompilationSession.join(session):
+        return _ParseXIBObjects(root, context, resolveConnections, parent, module, isBaseLocalization)
+
+
+def _ParseXIBObjects(root: Element, context: Optional[ArchiveContext], resolveConnections: bool, parent: Optional[NibObject], module: Optional[str], isBaseLocalization: bool) -> tuple[ArchiveContext, NibObject]:
     replace_string_attribures(root)
 
     objects = next(root.iter("objects"))
@@ -1,24 +1,159 @@
 #!/usr/bin/env python3
-"""TCP socket client that sends args to ibtool_server and relays output."""
+"""Socket client that sends args to ibtool_server and relays output.
 
+IBTOOL_SOCKET is either host:port or a Unix-domain socket path
+(unix:/path/to/socket, or any address containing a "/").
+
+Run as a script, it sends its own command line as a single request. Build
+scripts running many requests can import Client instead, which keeps one
+connection open and sends requests without waiting for earlier ones:
+
+    with Client() as client:
+        futures = [client.submit(["/usr/bin/ibtool", "--compile", nib, xib]) for xib, nib in files]
+        for future in futures:
+            exit_code, stdout, stderr = future.result()
+"""
+
+import itertools
 import json
 import os
 import socket
 import sys
+import threading
+from concurrent.futures import Future
+from typing import NamedTuple
+
+DEFAULT_ADDRESS = "host.docker.internal:9123"
+
+
+def connect(addr):
+    if addr.startswith("unix:") or "/" in addr:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(addr.removeprefix("unix:"))
+        return sock
+    host, port = addr.rsplit(":", 1)
+    return socket.create_connection((host, int(port)))
+
+
+class Result(NamedTuple):
+    exit_code: int
+    stdout: str
+    stderr: str
+
+
+class Client:
+    """A persistent connection to ibtool_server carrying many requests.
+
+    Requests are tagged with an id, so any number of them can be in flight
+    at once; the server runs them as workers become free and the replies
+    are matched back to their requests as they arrive.
+    """
+
+    def __init__(self, addr=None):
+        self.sock = connect(addr or os.environ.get("IBTOOL_SOCKET") or DEFAULT_ADDRESS)
+        self._ids = itertools.count(1)
+        self._pending = {}
+        # _lock guards _pending and _closed and is never held while the socket
+        # blocks; _send_lock keeps concurrent requests from interleaving. The
+        # reader thread must always be able to take _lock, or a sender blocked
+        # on a full socket would stop it from draining the replies.
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+
+    def submit(self, args, on_output=None):
+        """Sends a request and returns a Future for its Result.
+
+        on_output(stream, text), if given, is called from the reader thread
+        with each "stdout" or "stderr" chunk as it arrives.
+        """
+        return self._request({"args": list(args)}, on_output)
+
+    def _request(self, request, on_output):
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise ConnectionError("connection to ibtool_server is closed")
+            request_id = next(self._ids)
+            self._pending[request_id] = (future, [], [], on_output)
+        try:
+            with self._send_lock:
+                self.sock.sendall((json.dumps({"id": request_id, **request}) + "\n").encode("utf-8"))
+        except OSError:
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise
+        return future
+
+    def run(self, args):
+        return self.submit(args).result()
+
+    def stats(self):
+        """The server's queue and result cache statistics."""
+        return json.loads(self._request({"stats": True}, None).result().stdout)
+
+    def _read_replies(self):
+        error = ConnectionError("ibtool_server closed the connection")
+        try:
+            with self.sock.makefile("rb") as f:
+                for line in f:
+                    msg = json.loads(line)
+                    with self._lock:
+                        entry = self._pending.get(msg.get("id"))
+                        if entry is not None and "finish" in msg:
+                            del self._pending[msg["id"]]
+                    if entry is None:
+                        continue
+                    future, stdout, stderr, on_output = entry
+                    if "stdout" in msg:
+                        stdout.append(msg["stdout"])
+                        if on_output is not None:
+                            on_output("stdout", msg["stdout"])
+                    elif "stderr" in msg:
+                        stderr.append(msg["stderr"])
+                        if on_output is not None:
+                            on_output("stderr", msg["stderr"])
+                    elif "finish" in msg:
+                        future.set_result(Result(msg["finish"], "".join(stdout), "".join(stderr)))
+        except Exception as e:
+            error = e
+        finally:
+            with self._lock:
+                self._closed = True
+                pending, self._pending = self._pending, {}
+            for future, _, _, _ in pending.values():
+                future.set_exception(error)
+
+    def close(self):
+        """Waits for outstanding requests to finish, then closes the connection."""
+        with self._lock:
+            self._closed = True
+        with self._send_lock:
+            try:
+                self.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+        self._reader.join()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
 
 def main():
-    addr = os.environ.get("IBTOOL_SOCKET", "host.docker.internal:9123")
+    addr = os.environ.get("IBTOOL_SOCKET", DEFAULT_ADDRESS)
     if not addr:
         print("Error: IBTOOL_SOCKET environment variable not set", file=sys.stderr)
         sys.exit(1)
 
     args = sys.argv[:]
 
-    host, port = addr.rsplit(":", 1)
-    port = int(port)
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect((host, port))
+    sock = connect(addr)
 
     request = json.dumps({"args": args}) + "\n"
     sock.sendall(request.encode("utf-8"))
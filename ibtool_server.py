@@ -1,103 +1,707 @@
 #!/usr/bin/env python3
-"""TCP socket server that runs /usr/bin/ibtool on behalf of clients."""
+"""Socket server that runs ibtool on behalf of clients.
 
+By default every request runs /usr/bin/ibtool in a new process. With
+--daemon, ibtool requests are instead handled by this repository's ibtool
+in a pool of pre-forked worker processes that have already imported the
+compiler, so requests don't pay interpreter start-up and import time.
+
+Clients that tag requests with an "id" can send many of them over one
+connection and get their replies interleaved (see ibtool_client.Client).
+
+At most --workers requests run at once; the rest wait in a FIFO queue of
+at most --max-queue entries, and clients get "queued" and "started"
+messages telling them their queue position and how long they waited.
+With --result-cache, an ibtool request whose arguments and input files
+match an earlier successful one is answered by replaying its recorded
+output, without running ibtool.
+
+SIGTERM or Ctrl-C stops accepting connections and lets accepted requests
+finish before exiting.
+
+The address is either host:port or a Unix-domain socket path
+(unix:/path/to/socket, or any address containing a "/").
+"""
+
+import argparse
+import collections
+import io
 import json
+import multiprocessing
 import os
 import selectors
+import signal
 import socket
+import stat
 import subprocess
 import sys
 import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+# Exit codes reported for requests the server didn't run to completion.
+EX_TEMPFAIL = 75  # rejected because the queue was full or the server is stopping
+EX_TIMEOUT = 124  # killed after --timeout, as timeout(1) reports it
+
 
+# A client that lets more replies than this pile up unread is disconnected.
+MAX_BUFFERED_REPLIES = 64 * 1024 * 1024
 
-def handle_client(conn):
-    """Handle a single client connection."""
+
+# Where xcode-select keeps the selected developer directory.
+XCODE_SELECT_LINK = "/var/db/xcode_select_link"
+
+
+def resolved_tool_identity(tool, developer_dir):
+    """Identifies the ibtool that tool actually runs: its resolved path, size,
+    mtime and --version output, and the developer directory it came from."""
+    resolved = tool
     try:
-        # Read the command line from the client (newline-terminated JSONL)
-        buf = b""
-        while b"\n" not in buf:
-            chunk = conn.recv(4096)
-            if not chunk:
-                return
-            buf += chunk
+        found = subprocess.run(["xcrun", "--find", os.path.basename(tool)], stdin=subprocess.DEVNULL,
+                               capture_output=True, text=True, timeout=60)
+        if found.returncode == 0 and found.stdout.strip():
+            resolved = found.stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        # No xcrun: tool is the real thing.
+        pass
+    try:
+        version = subprocess.run([resolved, "--version"], stdin=subprocess.DEVNULL,
+                                 capture_output=True, timeout=60).stdout
+    except (OSError, subprocess.SubprocessError):
+        version = b""
+    st = os.stat(resolved)
+    return f"{resolved}:{st.st_size}:{st.st_mtime_ns}:{developer_dir}\n".encode() + version
+
 
-        line, _ = buf.split(b"\n", 1)
-        request = json.loads(line)
-        args = request.get("args", [])
-        if args[0] == '/usr/bin/ibtool':
+class Connection:
+    """A client socket, shared by every request sent over it.
+
+    Messages are queued and written whole, one at a time, by a writer thread
+    of the connection, so requests never block on a client that is slow to
+    read; one that stops reading altogether is disconnected once
+    MAX_BUFFERED_REPLIES are waiting for it. The socket is closed once the
+    client has stopped sending requests and the last reply to its requests
+    has been written.
+    """
+
+    # Connections whose writer is still running, for flushing on shutdown.
+    open_connections: "set[Connection]" = set()
+    registry_lock = threading.Lock()
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.outbox = collections.deque()
+        self.buffered = 0
+        self.writing = False
+        self.broken = False
+        self.closing = False
+        self.pending = 0
+        self.reading = True
+        with Connection.registry_lock:
+            Connection.open_connections.add(self)
+        threading.Thread(target=self._write_messages, daemon=True).start()
+
+    def send(self, msg):
+        data = (json.dumps(msg) + "\n").encode("utf-8")
+        with self.lock:
+            if self.broken:
+                raise ConnectionError("client connection is closed")
+            if self.buffered and self.buffered + len(data) > MAX_BUFFERED_REPLIES:
+                self._disconnect()
+                raise ConnectionError("client stopped reading replies, disconnected")
+            self.outbox.append(data)
+            self.buffered += len(data)
+            self.cond.notify_all()
+
+    def _disconnect(self):
+        # Called with the lock held. Wakes up the reader as well as the writer.
+        self.broken = True
+        self.outbox.clear()
+        self.buffered = 0
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.cond.notify_all()
+
+    def _write_messages(self):
+        while True:
+            with self.lock:
+                while not self.outbox and not self.closing:
+                    self.cond.wait()
+                if not self.outbox:
+                    break
+                data = self.outbox.popleft()
+                self.buffered -= len(data)
+                self.writing = True
+            try:
+                self.sock.sendall(data)
+            except OSError:
+                with self.lock:
+                    self._disconnect()
+            with self.lock:
+                self.writing = False
+                self.cond.notify_all()
+        # Forked workers (e.g. replacement daemon processes) may hold copies of
+        # the socket, so closing it alone wouldn't end the connection.
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
             pass
-        elif args[0] == '/usr/bin/test.py':
-            args[0] = './test.py'
+        self.sock.close()
+        with Connection.registry_lock:
+            Connection.open_connections.discard(self)
+
+    def flush(self, timeout=None):
+        """Waits until every queued message has been written. Returns False on a timeout."""
+        with self.lock:
+            return self.cond.wait_for(lambda: not self.outbox and not self.writing, timeout)
+
+    @classmethod
+    def flush_all(cls, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with cls.registry_lock:
+            connections = list(cls.open_connections)
+        for conn in connections:
+            if not conn.flush(None if deadline is None else max(0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def request_started(self):
+        with self.lock:
+            self.pending += 1
+
+    def request_finished(self):
+        with self.lock:
+            self.pending -= 1
+            self._close_when_done()
+
+    def stop_reading(self):
+        with self.lock:
+            self.reading = False
+            self._close_when_done()
+
+    def _close_when_done(self):
+        if not self.reading and not self.pending:
+            self.closing = True
+            self.cond.notify_all()
+
+
+class Job:
+    """A request waiting for, or holding, one of the server's run slots."""
+
+    def __init__(self, conn, args, request_id=None):
+        self.conn = conn
+        self.args = args
+        self.request_id = request_id
+        self.queued_at = time.monotonic()
+        # Set when the result should be recorded in the result cache, along
+        # with the contents of its output directories before it ran.
+        self.cache_key = None
+        self.output_snapshot = {}
+        self.stdout = []
+        self.stderr = []
+        conn.request_started()
+
+    def send(self, msg):
+        if self.request_id is not None:
+            msg = {"id": self.request_id, **msg}
+        self.conn.send(msg)
+
+    def output(self, stream, text):
+        if self.cache_key is not None:
+            (self.stdout if stream == "stdout" else self.stderr).append(text)
+        self.send({stream: text})
+
+    def finish(self, exit_code, **stats):
+        try:
+            self.send({"finish": exit_code, **stats})
+        finally:
+            self.conn.request_finished()
+
+
+class Scheduler:
+    """Runs at most `workers` requests at a time, in arrival order.
+
+    Requests beyond that wait in a FIFO queue of at most `max_queue` entries;
+    when the queue is full, new requests are turned away immediately instead
+    of piling up on the host. With a result cache, ibtool requests seen
+    before are answered from it without waiting for a slot. The lookups
+    hash the request's inputs, so they run on threads of their own rather
+    than on the connection reading the requests.
+    """
+
+    def __init__(self, workers, max_queue, timeout=None, pool=None, cache=None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.pool = pool
+        self.cache = cache
+        # Result cache identities of the tools run, by (tool, developer directory).
+        self.tool_identities = {}
+        self.queue = collections.deque()
+        # Accepted jobs whose "queued" message is still being sent.
+        self.admitting = 0
+        # Accepted jobs being looked up in the result cache.
+        self.looking_up = 0
+        self.lookups = ThreadPoolExecutor(workers, thread_name_prefix="result-cache") if cache is not None else None
+        self.running = 0
+        self.closing = False
+        self.cond = threading.Condition()
+        self.threads = [threading.Thread(target=self._run_jobs, daemon=True) for _ in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def submit(self, job):
+        """Queues job and tells the client where it stands. Returns False if it was rejected."""
+        if self.lookups is not None and job.args[0] == "/usr/bin/ibtool":
+            with self.cond:
+                if not self.closing:
+                    self.looking_up += 1
+                    self.lookups.submit(self._look_up, job)
+                    return True
+        return self._enqueue(job)
+
+    def _look_up(self, job):
+        try:
+            if not self._replay(job):
+                self._enqueue(job, accepted=True)
+        except Exception as e:
+            print(f"result cache lookup failed: {e}", file=sys.stderr)
+            job.cache_key = None
+            self._enqueue(job, accepted=True)
+        finally:
+            with self.cond:
+                self.looking_up -= 1
+                self.cond.notify_all()
+
+    def _enqueue(self, job, accepted=False):
+        """Queues job unless the queue is full or, for a job that wasn't accepted
+        before the server started shutting down, the server is stopping."""
+        with self.cond:
+            waiting = len(self.queue) + self.admitting
+            stopping = self.closing and not accepted
+            if stopping or waiting >= self.max_queue:
+                reason = "shutting down" if stopping else f"queue full ({waiting} waiting)"
+                queued = None
+            else:
+                self.admitting += 1
+                queued = {"queued": {"position": waiting + 1, "running": self.running, "workers": self.workers}}
+        if queued is None:
+            job.send({"stderr": f"ibtool_server: busy, {reason}; try again later\n"})
+            job.finish(EX_TEMPFAIL)
+            return False
+        # Sent outside the lock, so a client that isn't reading can't hold up
+        # the other connections and the runners. The job only becomes visible
+        # to the runners afterwards, so "queued" always precedes "started".
+        try:
+            job.send(queued)
+        except OSError:
+            sent = False
         else:
-            print("wrong tool, refusing")
-            return
-
-        print("running", args)
-        cmd = args
-        proc = subprocess.Popen(
-            cmd,
-            stdin=subprocess.DEVNULL,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
+            sent = True
+        with self.cond:
+            self.admitting -= 1
+            if sent:
+                self.queue.append(job)
+                self.cond.notify()
+            else:
+                self.cond.notify_all()
+        if not sent:
+            job.conn.request_finished()
+        return sent
+
+    def _tool_identity(self, tool):
+        if self.pool is not None:
+            from ibtool import compile_cache
 
-        sel = selectors.DefaultSelector()
-        sel.register(proc.stdout, selectors.EVENT_READ, "stdout")
-        sel.register(proc.stderr, selectors.EVENT_READ, "stderr")
+            return compile_cache.tool_version()
+        # /usr/bin/ibtool is the xcrun shim, which stays the same across Xcode
+        # upgrades and xcode-select switches; the selected developer directory
+        # tells which ibtool it runs.
+        developer_dir = os.environ.get("DEVELOPER_DIR") or os.path.realpath(XCODE_SELECT_LINK)
+        identity = self.tool_identities.get((tool, developer_dir))
+        if identity is None:
+            identity = resolved_tool_identity(tool, developer_dir)
+            self.tool_identities[(tool, developer_dir)] = identity
+        return identity
 
+    def _replay(self, job):
+        """Answers job from the result cache. Returns False on a miss."""
+        try:
+            key = self.cache.key(job.args, self._tool_identity(job.args[0]))
+            result = self.cache.replay(key)
+        except OSError as e:
+            print(f"result cache lookup failed: {e}", file=sys.stderr)
+            return False
+        if result is None:
+            job.cache_key = key
+            return False
+        print("replaying cached result", job.args)
+        try:
+            if result["stdout"]:
+                job.send({"stdout": result["stdout"]})
+            if result["stderr"]:
+                job.send({"stderr": result["stderr"]})
+            job.finish(result["exit_code"], wait=0.0, elapsed=0.0, cached=True)
+        except OSError:
+            pass
+        return True
+
+    def _run_jobs(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    if self.closing and not self.admitting and not self.looking_up:
+                        return
+                    self.cond.wait()
+                job = self.queue.popleft()
+                self.running += 1
+            try:
+                self._execute(job)
+            finally:
+                with self.cond:
+                    self.running -= 1
+                    self.cond.notify_all()
+
+    def _execute(self, job):
+        wait = time.monotonic() - job.queued_at
+        print(f"running{' (daemon)' if self.pool is not None else ''} after {wait:.3f}s in queue", job.args)
+        start = time.monotonic()
+        if job.cache_key is not None:
+            try:
+                job.output_snapshot = self.cache.snapshot(job.args)
+            except OSError as e:
+                print(f"result cache snapshot failed: {e}", file=sys.stderr)
+                job.cache_key = None
+        try:
+            job.send({"started": {"wait": round(wait, 3)}})
+            if self.pool is not None and job.args[0] == "/usr/bin/ibtool":
+                exit_code = run_in_pool(job, self.pool, self.timeout)
+            else:
+                exit_code = run_subprocess(job, self.timeout)
+        except Exception as e:
+            try:
+                job.send({"stderr": f"server error: {e}\n"})
+            except OSError:
+                pass
+            exit_code = 1
+        if job.cache_key is not None and exit_code == 0:
+            try:
+                self.cache.record(job.cache_key, exit_code, "".join(job.stdout), "".join(job.stderr),
+                                  job.args, job.output_snapshot)
+            except OSError as e:
+                print(f"result cache store failed: {e}", file=sys.stderr)
+        try:
+            job.finish(exit_code, wait=round(wait, 3), elapsed=round(time.monotonic() - start, 3))
+        except OSError:
+            pass
+
+    def stats(self):
+        with self.cond:
+            stats = {"queued": len(self.queue) + self.admitting, "running": self.running, "workers": self.workers}
+        if self.cache is not None:
+            stats["result_cache"] = self.cache.stats()
+        return stats
+
+    def drain(self, timeout=None):
+        """Stops taking requests and waits for queued and running ones to finish.
+
+        Returns False if some were still unfinished after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            self.closing = True
+            self.cond.notify_all()
+            while self.queue or self.admitting or self.looking_up or self.running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+
+def handle_client(sock, scheduler):
+    """Reads requests from a client and hands them to the scheduler.
+
+    A request without an "id" is the only one on its connection. Requests
+    with an "id" can be sent one after another on the same connection
+    without waiting for earlier ones to finish; every reply message carries
+    the id of the request it belongs to.
+
+    A {"stats": true} request is answered with the server's queue and result
+    cache statistics, as a JSON line on stdout.
+    """
+    conn = Connection(sock)
+    buf = b""
+    request_id = None
+    try:
+        while True:
+            # Read the command line from the client (newline-terminated JSONL)
+            while b"\n" not in buf:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    return
+                buf += chunk
+
+            line, buf = buf.split(b"\n", 1)
+            request = json.loads(line)
+            request_id = request.get("id")
+            tag = {} if request_id is None else {"id": request_id}
+            if request.get("stats"):
+                conn.send({**tag, "stdout": json.dumps(scheduler.stats()) + "\n"})
+                conn.send({**tag, "finish": 0})
+                if request_id is None:
+                    return
+                continue
+            args = request.get("args", [])
+            if args[0] == '/usr/bin/test.py':
+                args[0] = './test.py'
+            elif args[0] != '/usr/bin/ibtool':
+                print("wrong tool, refusing")
+                if request_id is None:
+                    return
+                conn.send({"id": request_id, "stderr": "wrong tool, refusing\n"})
+                conn.send({"id": request_id, "finish": 1})
+                continue
+
+            scheduler.submit(Job(conn, args, request_id))
+            if request_id is None:
+                return
+    except Exception as e:
+        tag = {} if request_id is None else {"id": request_id}
+        try:
+            conn.send({**tag, "stderr": f"server error: {e}\n"})
+            conn.send({**tag, "finish": 1})
+        except Exception:
+            pass
+    finally:
+        conn.stop_reading()
+
+
+def run_subprocess(job, timeout=None):
+    proc = subprocess.Popen(
+        job.args,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    sel = selectors.DefaultSelector()
+    sel.register(proc.stdout, selectors.EVENT_READ, "stdout")
+    sel.register(proc.stderr, selectors.EVENT_READ, "stderr")
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    try:
         open_count = 2
         while open_count > 0:
-            for key, _ in sel.select():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                job.send({"stderr": f"ibtool_server: request timed out after {timeout:g}s\n"})
+                return EX_TIMEOUT
+            for key, _ in sel.select(remaining):
                 chunk = key.fileobj.read1(8192) if hasattr(key.fileobj, "read1") else os.read(key.fileobj.fileno(), 8192)
                 if not chunk:
                     sel.unregister(key.fileobj)
                     open_count -= 1
                 else:
-                    msg = json.dumps({key.data: chunk.decode("utf-8", errors="replace")}) + "\n"
-                    conn.sendall(msg.encode("utf-8"))
-
+                    job.output(key.data, chunk.decode("utf-8", errors="replace"))
+        return proc.wait()
+    finally:
+        # Also reached on a timeout or when the client has gone away.
         sel.close()
-        exit_code = proc.wait()
-        msg = json.dumps({"finish": exit_code}) + "\n"
-        conn.sendall(msg.encode("utf-8"))
-    except Exception as e:
-        try:
-            msg = json.dumps({"stderr": f"server error: {e}\n"}) + "\n"
-            conn.sendall(msg.encode("utf-8"))
-            conn.sendall((json.dumps({"finish": 1}) + "\n").encode("utf-8"))
-        except Exception:
-            pass
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        proc.stdout.close()
+        proc.stderr.close()
+
+
+def run_in_pool(job, pool, timeout=None):
+    result = pool.apply_async(run_ibtool, (job.args, timeout))
+    try:
+        # The worker enforces the timeout itself; this only guards against a worker that never answers.
+        exit_code, stdout, stderr = result.get(None if timeout is None else timeout + 30)
+    except multiprocessing.TimeoutError:
+        job.send({"stderr": f"ibtool_server: request timed out after {timeout:g}s\n"})
+        return EX_TIMEOUT
+    if stdout:
+        job.output("stdout", stdout)
+    if stderr:
+        job.output("stderr", stderr)
+    return exit_code
+
+
+class RequestTimeout(BaseException):
+    # Not an Exception, so that compile code catching Exception can't swallow it.
+    pass
+
+
+def _request_timed_out(signum, frame):
+    raise RequestTimeout()
+
+
+def init_worker():
+    # Pay for the imports once per worker rather than once per request.
+    import ibtool.__main__  # noqa: F401
+    import ibtool.ibdump  # noqa: F401
+    import ibtool.ibtool  # noqa: F401
+    from ibtool import parsers
+    # The command line loads these on first use, which would be during a request.
+    for tag in parsers.PARSER_MODULES:
+        parsers.load(tag)
+
+
+def run_ibtool(args, timeout=None):
+    """Runs the ibtool command line in this process.
+
+    Returns (exit code, stdout, stderr) the way the command would have
+    produced them as a separate process. A run longer than timeout seconds
+    is interrupted and reported with EX_TIMEOUT.
+    """
+    from ibtool.__main__ import run
+
+    out, err = io.BytesIO(), io.BytesIO()
+    stdout = io.TextIOWrapper(out, encoding="utf-8", write_through=True)
+    stderr = io.TextIOWrapper(err, encoding="utf-8", write_through=True)
+    saved = sys.argv, sys.stdout, sys.stderr
+    sys.argv = ["ibtool"] + list(args[1:])
+    sys.stdout, sys.stderr = stdout, stderr
+    exit_code = 0
+    if timeout is not None:
+        signal.signal(signal.SIGALRM, _request_timed_out)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        run()
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except RequestTimeout:
+        print(f"ibtool_server: request timed out after {timeout:g}s", file=sys.stderr)
+        exit_code = EX_TIMEOUT
+    except Exception:
+        traceback.print_exc()
+        exit_code = 1
     finally:
-        conn.close()
+        if timeout is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        stdout.flush()
+        stderr.flush()
+        sys.argv, sys.stdout, sys.stderr = saved
+    return (
+        exit_code,
+        out.getvalue().decode("utf-8", errors="replace"),
+        err.getvalue().decode("utf-8", errors="replace"),
+    )
+
+
+def listen(address):
+    if address.startswith("unix:") or "/" in address:
+        path = address.removeprefix("unix:")
+        # Replace a socket left behind by a previous server, but never a regular file.
+        if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(path)
+    else:
+        host, port = address.rsplit(":", 1)
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, int(port)))
+    sock.listen(5)
+    return sock
+
+
+def _stop(signum, frame):
+    raise KeyboardInterrupt()
 
 
 def main():
-    if len(sys.argv) != 2:
-        print(f"Usage: {sys.argv[0]} <host:port>", file=sys.stderr)
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Run ibtool on behalf of ibtool_client.py.")
+    parser.add_argument("address", help="host:port or unix:/path/to/socket")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run ibtool requests in warm worker processes instead of /usr/bin/ibtool")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Maximum number of requests run at once, and worker processes in --daemon mode (default: CPU count)")
+    parser.add_argument("--max-queue", type=int, default=256,
+                        help="Maximum number of requests waiting for a worker; more are rejected (default: 256)")
+    parser.add_argument("--timeout", type=float, default=None,
+                        help="Kill requests running longer than this many seconds")
+    parser.add_argument("--drain-timeout", type=float, default=None,
+                        help="On shutdown, wait at most this many seconds for queued and running requests")
+    parser.add_argument("--max-requests-per-worker", type=int, default=100,
+                        help="Replace a daemon worker after this many requests (default: 100)")
+    parser.add_argument("--result-cache", metavar="DIR",
+                        help="Replay the recorded results of identical ibtool requests from this directory")
+    parser.add_argument("--result-cache-size", type=int, metavar="MB",
+                        help="Maximum size of the result cache in megabytes (default: 512, as ibtool --cache-size)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
 
     os.environ["LANG"] = "en_US"
     os.environ["LC_ALL"] = "en_US_POSIX"
     os.environ["TZ"] = "Etc/UTC"
 
-    host, port = sys.argv[1].rsplit(":", 1)
-    port = int(port)
+    pool = None
+    if args.daemon:
+        pool = multiprocessing.Pool(
+            args.workers,
+            initializer=init_worker,
+            maxtasksperchild=args.max_requests_per_worker,
+        )
+
+    cache = None
+    if args.result_cache:
+        # Only imported when needed, so the plain forwarding server runs without the ibtool package.
+        from ibtool.compile_cache import DEFAULT_MAX_BYTES
+        from ibtool.result_cache import ResultCache
 
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    sock.bind((host, port))
-    sock.listen(5)
-    print(f"Listening on {host}:{port}", file=sys.stderr)
+        max_bytes = DEFAULT_MAX_BYTES if args.result_cache_size is None else args.result_cache_size * 1024 * 1024
+        cache = ResultCache(args.result_cache, max_bytes)
+
+    scheduler = Scheduler(args.workers, args.max_queue, timeout=args.timeout, pool=pool, cache=cache)
+    sock = listen(args.address)
+    mode = "daemon" if pool is not None else "subprocess"
+    print(f"Listening on {args.address} ({mode}, {args.workers} workers, queue of {args.max_queue})", file=sys.stderr)
 
+    signal.signal(signal.SIGTERM, _stop)
     try:
         while True:
             conn, _ = sock.accept()
-            t = threading.Thread(target=handle_client, args=(conn,), daemon=True)
+            t = threading.Thread(target=handle_client, args=(conn, scheduler), daemon=True)
             t.start()
     except KeyboardInterrupt:
         pass
     finally:
+        # Stop accepting, then let everything already accepted finish.
+        path = sock.getsockname() if sock.family == socket.AF_UNIX else None
         sock.close()
+        if path:
+            os.unlink(path)
+        stats = scheduler.stats()
+        print(f"Shutting down, draining {stats['running']} running and {stats['queued']} queued requests", file=sys.stderr)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        start = time.monotonic()
+        drained = scheduler.drain(args.drain_timeout)
+        if drained:
+            # Replies that are still being written to their clients.
+            drained = Connection.flush_all(None if args.drain_timeout is None else max(0, args.drain_timeout - (time.monotonic() - start)))
+        if not drained:
+            print("Drain timed out, abandoning remaining requests", file=sys.stderr)
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if cache is not None:
+            cache.print_stats()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import glob
+import itertools
 import os
 import shlex
 import shutil
@@ -90,11 +91,190 @@ def run_storyboard_test(sb):
             shutil.rmtree(test_out)
 
 
+# Checks that aren't a sample compile; run with the samples when test.py is
+# given no arguments. Each returns (success, name, output) like run_test.
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+@check
+def check_truncated_dump():
+    """--dump of a truncated nib fails with the parse error, not a BufferError from unmapping it."""
+    with open("samples/correct/minimal.nib", "rb") as f:
+        data = f.read()
+    with tempfile.NamedTemporaryFile(suffix=".nib", delete=False) as f:
+        f.write(data[: len(data) // 2])
+        truncated = f.name
+
+    try:
+        result = subprocess.run(
+            [sys.executable, "-m", "ibtool", "--dump", truncated],
+            capture_output=True,
+            text=True,
+        )
+    finally:
+        os.unlink(truncated)
+
+    errors = result.stderr.strip()
+    if result.returncode != 0 and errors.endswith("IndexError: index out of bounds on dimension 1") and "BufferError" not in errors:
+        return True, "check_truncated_dump", ""
+    return False, "check_truncated_dump", errors
+
+
+@check
+def check_bad_value_writes_nothing():
+    """A value its encoding can't hold is rejected before any of the nib is streamed out."""
+    import io
+    from ibtool import nibencoding
+
+    name = "check_bad_value_writes_nothing"
+    bad_values = [
+        (nibencoding.NIB_TYPE_BYTE, 256),
+        (nibencoding.NIB_TYPE_SHORT, -1),
+        (nibencoding.NIB_TYPE_LONG, 1 << 32),
+        (nibencoding.NIB_TYPE_LONG, 1.5),
+        (nibencoding.NIB_TYPE_FLOAT, 1e39),
+        (nibencoding.NIB_TYPE_DOUBLE, "1.0"),
+    ]
+    # A large string ahead of the bad value gets written out straight away.
+    large = (0, nibencoding.NIB_TYPE_STRING, b"x" * (1 << 16))
+    for encoding, value in bad_values:
+        out = io.BytesIO()
+        nib = ([(0, 0, 2)], ["key"], [large, (0, encoding, value)], ["NSObject"])
+        try:
+            nibencoding.WriteNibTo(nib, out)
+        except Exception:
+            pass
+        else:
+            return False, name, f"{value!r} was written as encoding {encoding}"
+        if out.tell():
+            return False, name, f"{out.tell()} bytes were written before {value!r} was rejected"
+    return True, name, ""
+
+
+NESTED_SEGUE_STORYBOARD = """\
+<document type="com.apple.InterfaceBuilder3.Cocoa.Storyboard.XIB" version="3.0" toolsVersion="22505">
+    <scenes>
+        <scene sceneID="scene-1">
+            <objects>
+                <viewController id="vc-1" sceneMemberID="viewController">
+                    <view key="view" id="view-1">
+                        <subviews>
+                            <button id="button-1">
+                                <connections>
+                                    <segue destination="vc-2" kind="show" id="segue-button"/>
+                                </connections>
+                            </button>
+                        </subviews>
+                    </view>
+                    <connections>
+                        <segue destination="vc-2" kind="modal" id="segue-vc"/>
+                    </connections>
+                </viewController>
+                <customObject id="responder-1" userLabel="First Responder" sceneMemberID="firstResponder"/>
+            </objects>
+        </scene>
+        <scene sceneID="scene-2">
+            <objects>
+                <viewController id="vc-2" sceneMemberID="viewController"/>
+            </objects>
+        </scene>
+    </scenes>
+</document>
+"""
+
+
+@check
+def check_storyboard_segues():
+    """The storyboard index finds every segue inside a view controller, as vc.findall(".//segue") does,
+    including the one on a nested button in NESTED_SEGUE_STORYBOARD."""
+    import xml.etree.ElementTree as ET
+    from ibtool import xibparser  # noqa: F401 (ibtool.storyboard is imported through it)
+    from ibtool.storyboard import _StoryboardDocument
+
+    name = "check_storyboard_segues"
+    roots = [ET.fromstring(NESTED_SEGUE_STORYBOARD)]
+    roots += [ET.parse(sb).getroot() for sb in sorted(glob.glob("samples/**/*.storyboard", recursive=True))]
+    for root in roots:
+        doc = _StoryboardDocument(root, None, None, False)
+        for scene in doc.scenes:
+            for vc in scene.iterfind("objects/*[@sceneMemberID='viewController']"):
+                expected = [seg.get("id") for seg in vc.findall(".//segue")]
+                found = [seg.get("id") for seg in doc.segues_from(vc)]
+                if found != expected:
+                    return False, name, f"segues of {vc.tag} {vc.get('id')}: {found} != {expected}"
+    return True, name, ""
+
+
+@check
+def check_session_memory():
+    """Parses inside one session share its interned strings, and 1,000 in-process compiles keep no memory."""
+    import gc
+    import tracemalloc
+    import xml.etree.ElementTree as ET
+    from ibtool import ibtool, xibparser
+    from ibtool.models import CompilationSession, NibObject, NibString
+
+    name = "check_session_memory"
+    with open("samples/correct/StatusBar.xib") as f:
+        source = f.read()
+
+    def strings(root):
+        """The ids of the NibStrings reachable from root."""
+        seen, found, stack = set(), set(), [root]
+        while stack:
+            obj = stack.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            if isinstance(obj, NibString):
+                found.add(id(obj))
+            stack += [v for _, v in obj.getKeyValuePairs() if isinstance(v, NibObject)]
+        return found
+
+    with CompilationSession() as session:
+        _, first = xibparser.ParseXIBObjects(ET.fromstring(source))
+        _, second = xibparser.ParseXIBObjects(ET.fromstring(source))
+        interned = {id(string) for string in session.strings.values()}
+        if not strings(first) & strings(second) & interned:
+            return False, name, "parses inside a session didn't share the session's interned strings"
+
+    # Every compile gets unique titles, so no strings carry over from one to
+    # the next. Memory is traced after the first 100 so that what's left at
+    # the end is only what the later compiles kept.
+    strings_before = len(NibString.cache)
+    with tempfile.TemporaryDirectory() as tmp:
+        xib = os.path.join(tmp, "in.xib")
+        out = os.path.join(tmp, "out.nib")
+        for i in range(1, 1001):
+            with open(xib, "w") as f:
+                f.write(source.replace('title="', f'title="{i} '))
+            ibtool.ib_compile(xib, out)
+            if i == 100:
+                gc.collect()
+                tracemalloc.start()
+        gc.collect()
+        kept = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+    if len(NibString.cache) != strings_before:
+        return False, name, f"the global string cache grew from {strings_before} to {len(NibString.cache)}"
+    if kept > 64 * 1024:
+        return False, name, f"900 compiles kept {kept / 1024:.1f} KiB"
+    return True, name, ""
+
+
 def main():
     if len(sys.argv) > 1:
         xibs = sys.argv[1:]
+        checks = []
     else:
         xibs = sorted(glob.glob("samples/correct/*.xib") + glob.glob("samples/correct/*.storyboard") + glob.glob("samples/correct/Base.lproj/*.storyboard"))
+        checks = CHECKS
 
     workers = int(os.environ.get("IBTOOL_TEST_WORKERS", 8))
 
@@ -102,7 +282,9 @@ def main():
     failed = 0
 
     with ProcessPoolExecutor(max_workers=workers) as pool:
-        for success, xib, output in pool.map(run_test, xibs):
+        futures = [pool.submit(check) for check in checks]
+        results = itertools.chain(pool.map(run_test, xibs), (future.result() for future in futures))
+        for success, xib, output in results:
             if success:
                 passed += 1
             else: